@@ -1,55 +1,150 @@
 # commands/ai_chat.py
 import os
-import asyncio
 import logging
+from typing import Optional
+
 import discord
 from discord import app_commands
-from discord.ext import commands
-from PyCharacterAI import Client
+from discord.ext import commands, tasks
+
+from utils.ai_channels import DEFAULT_BURST_SECONDS, ChannelConversation, format_burst
+from utils.ai_client import DEFAULT_ACCOUNT_CONCURRENCY, AIAccountPool
+from utils.ai_pipeline import DEFAULT_TIMEOUT, STAGES, AIPipeline, AIRequest
+from utils.ai_scheduler import DEFAULT_MAX_QUEUE, RequestScheduler
+from utils.ai_sessions import DEFAULT_SCOPE, DEFAULT_TTL_HOURS, ChatSessionStore, channel_session_key
+from utils.ai_warm_pool import DEFAULT_MAX_AGE_MINUTES, DEFAULT_POOL_SIZE
 
 logger = logging.getLogger(__name__)
 
-# Character.AI client and chat storage
-client = None
-user_chats = {}
+SESSION_MAINTENANCE_MINUTES = 10
+
+EMPTY_REPLY = "Sorry, I can't think anything. I'm confused. TwT"
+ERROR_REPLY = "Sorry, I can't think anything right now. I'll try to fix this... :D"
+TIMEOUT_REPLY = "Sorry, the AI is taking too long to respond. Please try again later."
+QUEUE_TIMEOUT_REPLY = "I'm talking with a lot of people right now and couldn't get to your message in time. Please try again in a moment!"
+GREETING_REPLY = "Hi! Ask me anything!"
+NOT_CONFIGURED_REPLY = "Character.AI is not configured. Please set up CHARACTERAI_TOKEN and CHARACTER_ID."
+
+UNAVAILABLE_REPLIES = {
+    'disabled': NOT_CONFIGURED_REPLY,
+    'no_character': "Character ID not configured. Please set CHARACTER_ID in your environment variables.",
+    'connecting': "I'm still waking up, please try again in a few seconds!",
+    'circuit_open': "I can't reach Character.AI right now. Please try again in a little while! >_<",
+}
+
+BUSY_REPLIES = {
+    'queue_full': "I'm talking with a lot of people right now. Please try again in a moment!",
+    'too_many_pending': "I'm still answering your last messages, give me a second! >_<",
+}
 
 class AIChatCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self._initialize_character_ai()
-
-    def _initialize_character_ai(self):
-        """Initialize Character.AI client"""
-        global client
+        self.sessions = ChatSessionStore(
+            scope=os.getenv('AI_SESSION_SCOPE', DEFAULT_SCOPE),
+            ttl_hours=float(os.getenv('AI_SESSION_TTL_HOURS', DEFAULT_TTL_HOURS)),
+        )
+        # CHARACTERAI_TOKEN plus any extra accounts; each has its own limits and health
+        tokens = [os.getenv('CHARACTERAI_TOKEN')] + os.getenv('CHARACTERAI_TOKENS', '').split(',')
+        self.ai = AIAccountPool(
+            [token.strip() for token in tokens if token and token.strip()],
+            max_concurrent=int(os.getenv('AI_ACCOUNT_MAX_CONCURRENT', DEFAULT_ACCOUNT_CONCURRENCY)),
+        )
+        if not self.ai.configured:
+            logger.warning('No Character.AI token found. Bot will work without AI responses.')
+        self.scheduler = RequestScheduler(
+            # Defaults to what the accounts can serve together
+            max_concurrent=int(os.getenv('AI_MAX_CONCURRENT') or self.ai.capacity),
+            max_queue=int(os.getenv('AI_MAX_QUEUE', DEFAULT_MAX_QUEUE)),
+        )
+        self.pipeline = AIPipeline(
+            self.scheduler,
+            self.sessions,
+            self.ai,
+            timeout=float(os.getenv('AI_RESPONSE_TIMEOUT', DEFAULT_TIMEOUT)),
+            warm_pool_size=int(os.getenv('AI_WARM_POOL_SIZE', DEFAULT_POOL_SIZE)),
+            warm_pool_max_age=float(os.getenv('AI_WARM_POOL_MAX_AGE_MINUTES', DEFAULT_MAX_AGE_MINUTES)),
+        )
+        self.default_character = os.getenv('CHARACTER_ID')
+        self.guild_characters = {}  # guild_id -> character id override
+        self.chat_channels = {}  # guild_id -> designated AI chat channel id
+        self.conversations = {}  # channel_id -> ChannelConversation
+        self.burst_seconds = float(os.getenv('AI_CHANNEL_BURST_SECONDS', DEFAULT_BURST_SECONDS))
+
+    async def cog_load(self):
+        await self.sessions.open()
+        self.guild_characters = await self.sessions.load_guild_characters()
+        self.chat_channels = await self.sessions.load_chat_channels()
+        self.ai.start()
+        self.pipeline.start(self.default_character)
+        self.session_maintenance.start()
+
+    async def cog_unload(self):
+        self.session_maintenance.cancel()
+        for conversation in list(self.conversations.values()):
+            conversation.cancel()
+        self.pipeline.stop()
+        await self.ai.close()
+        await self.sessions.close()
+
+    def character_for(self, guild):
+        """Character id used in a guild (or in DMs when guild is None)"""
+        if guild is not None and guild.id in self.guild_characters:
+            return self.guild_characters[guild.id]
+        return self.default_character
+
+    @tasks.loop(minutes=SESSION_MAINTENANCE_MINUTES)
+    async def session_maintenance(self):
+        """Persist last-used times and drop idle chat sessions"""
         try:
-            char_token = os.getenv('CHARACTERAI_TOKEN')
-            if char_token:
-                client = Client()
-                asyncio.create_task(self._authenticate_character_ai())
-            else:
-                logger.warning('No Character.AI token found. Bot will work without AI responses.')
+            removed = await self.sessions.evict_idle()
+            if removed:
+                logger.info(f"Evicted {removed} idle chat sessions")
+            stats = self.pipeline.metrics.snapshot()['histograms']
+            if 'total' in stats:
+                logger.info("AI latency p95: " + ", ".join(
+                    f"{stage} {stats[stage]['p95']:.2f}s" for stage in STAGES if stage in stats
+                ))
         except Exception as e:
-            logger.error(f'Error initializing Character.AI client: {e}')
-
-    async def _authenticate_character_ai(self):
-        """Authenticate with Character.AI"""
-        global client
+            logger.error(f"Error maintaining chat sessions: {e}")
+
+    def character_override(self, guild):
+        """The guild's own character id, or None when it uses the default"""
+        return self.guild_characters.get(guild.id) if guild is not None else None
+
+    def session_key(self, user, guild=None, channel=None):
+        """Storage key for a user's conversation in the configured scope"""
+        return self.sessions.key_for(
+            user.id,
+            guild.id if guild else None,
+            channel.id if channel is not None and guild else None,
+            self.character_override(guild),
+        )
+
+    async def respond(self, request):
+        """Run a request through the AI pipeline and explain any failure to the user"""
+        result = await self.pipeline.run(request)
+        if result.replied:
+            return result
+        if result.outcome == 'busy':
+            reply = BUSY_REPLIES[result.reason]
+        elif result.outcome == 'unavailable':
+            reply = UNAVAILABLE_REPLIES[result.reason]
+        elif result.outcome == 'timeout':
+            reply = QUEUE_TIMEOUT_REPLY if result.reason == 'queue' else TIMEOUT_REPLY
+        elif result.outcome == 'empty':
+            reply = EMPTY_REPLY
+        else:
+            reply = ERROR_REPLY
         try:
-            await client.authenticate(os.getenv('CHARACTERAI_TOKEN'))
-            logger.info('Character.AI client initialized and authenticated successfully!')
+            await request.send(reply)
         except Exception as e:
-            logger.error(f'Error authenticating Character.AI client: {e}')
+            logger.error(f"Error sending AI failure reply: {e}")
+        return result
 
-    async def handle_ai_response(self, message):
+    async def handle_ai_response(self, message, source='dm'):
         """Handle AI response generation"""
-        global client
         try:
-            if not client:
-                await message.reply(
-                    "Character.AI is not configured. Please set up CHARACTERAI_TOKEN and CHARACTER_ID."
-                )
-                return
-
             # Get the user's message, clean it up
             user_message = message.content
             if message.content.startswith('!ai'):
@@ -60,67 +155,82 @@ class AIChatCommands(commands.Cog):
                 user_message = message.content.strip()
 
             if not user_message:
-                await message.reply("Hi! Ask me anything!")
+                await message.reply(GREETING_REPLY)
                 return
 
+            guild = getattr(message, 'guild', None)
             # Show typing indicator
             async with message.channel.typing():
-                character_id = os.getenv('CHARACTER_ID')
-                if not character_id:
-                    await message.reply("Character ID not configured. Please set CHARACTER_ID in your environment variables.")
-                    return
-
-                try:
-                    if not client:
-                        await message.reply("Character.AI client not available. Please restart the bot.")
-                        return
-
-                    # Get or create chat session for this user
-                    user_id = str(message.author.id)
-                    if user_id not in user_chats:
-                        chat, greeting = await client.chat.create_chat(character_id)
-                        user_chats[user_id] = chat.chat_id
-                        logger.info(f"Created new chat session for user {user_id}: {chat.chat_id}")
-
-                    chat_id = user_chats[user_id]
-
-                    # Send message and get response
-                    response = await client.chat.send_message(character_id, chat_id, user_message)
-
-                    # Get the AI's response text from primary candidate
-                    primary_candidate = response.get_primary_candidate()
-                    ai_response = primary_candidate.text if primary_candidate else "Sorry, I can't think anything. I'm confused. TwT"
-
-                    # Discord has a 2000 character limit for messages
-                    if len(ai_response) > 1900:
-                        ai_response = ai_response[:1900] + "..."
-
-                    await message.reply(ai_response)
-
-                except Exception as api_error:
-                    logger.error(f"Character.AI API error: {api_error}")
-                    # Reset user's chat session on error
-                    user_id = str(message.author.id)
-                    if user_id in user_chats:
-                        del user_chats[user_id]
-
-                    # Fallback response when Character.AI fails
-                    await message.reply(
-                        f"I heard you say: '{user_message}'\nBut sorry, I can't think anything. I'll try to fix this... :D"
-                    )
+                await self.respond(AIRequest(
+                    source,
+                    self.session_key(message.author, guild, message.channel),
+                    message.author.id,
+                    self.character_for(guild),
+                    user_message,
+                    message.reply,
+                ))
 
         except Exception as e:
             logger.error(f"Error generating AI response: {e}")
             await message.reply("Sorry, my brain explode while trying to talk with you. T_T")
 
+    @commands.Cog.listener()
+    async def on_message(self, message):
+        """Collect guild messages addressed to Suomi into per-channel conversations"""
+        # DMs are handled by main.on_message
+        if message.author.bot or not message.guild or not self.bot.user:
+            return
+        prefix = self.bot.command_prefix
+        if isinstance(prefix, str) and message.content.startswith(prefix):
+            return
+
+        mentioned = self.bot.user in message.mentions
+        designated = self.chat_channels.get(message.guild.id) == message.channel.id
+        if not (mentioned or designated):
+            return
+
+        text = message.content.replace(f'<@{self.bot.user.id}>', '').replace(f'<@!{self.bot.user.id}>', '').strip()
+        if not text:
+            if mentioned:
+                await message.reply(GREETING_REPLY)
+            return
+
+        conversation = self.conversations.get(message.channel.id)
+        if conversation is None:
+            channel = message.channel
+            conversation = ChannelConversation(
+                channel.id,
+                lambda burst: self.handle_channel_burst(channel, burst),
+                burst_seconds=self.burst_seconds,
+                on_idle=lambda idle: self.conversations.pop(idle.channel_id, None),
+            )
+            self.conversations[channel.id] = conversation
+        conversation.add(message.author.display_name, text, message)
+
+    async def handle_channel_burst(self, channel, burst):
+        """Send a burst of channel messages upstream as one speaker-labelled turn"""
+        async with channel.typing():
+            # Everyone in the channel shares one conversation; it has no
+            # single owner, so user_id 0 marks it
+            await self.respond(AIRequest(
+                'channel',
+                channel_session_key(channel.id, self.character_override(channel.guild)),
+                0,
+                self.character_for(channel.guild),
+                format_burst(burst),
+                burst[-1].message.reply,
+            ))
+
     @commands.command(name='chat')
     async def chat_command(self, ctx, *, message):
         """Chat with Suomi using a command"""
         class FakeMessage:
-            def __init__(self, content, channel, author):
+            def __init__(self, content, original):
                 self.content = content
-                self.channel = channel
-                self.author = author
+                self.original = original
+                self.channel = original.channel
+                self.author = original.author
+                self.guild = original.guild
                 self.mention_everyone = False
                 self.mentions = []
                 self.role_mentions = []
@@ -130,17 +240,15 @@ class AIChatCommands(commands.Cog):
                 self.reactions = []
 
             async def reply(self, content):
-                await self.channel.send(f"{self.author.mention} {content}")
+                return await self.original.reply(content)
 
-        fake_message = FakeMessage(message, ctx.channel, ctx.author)
-        await self.handle_ai_response(fake_message)
+        fake_message = FakeMessage(message, ctx.message)
+        await self.handle_ai_response(fake_message, source='command')
 
     @commands.command(name='reset_chat')
     async def reset_chat_command(self, ctx):
         """Reset user's chat history with the AI"""
-        user_id = str(ctx.author.id)
-        if user_id in user_chats:
-            del user_chats[user_id]
+        if await self.sessions.delete(self.session_key(ctx.author, ctx.guild, ctx.channel)):
             await ctx.send("Your conversation history has been reset!")
         else:
             await ctx.send("You don't have an active conversation to reset.")
@@ -148,51 +256,16 @@ class AIChatCommands(commands.Cog):
     @app_commands.command(name='chat', description='Chat with the AI character')
     async def slash_chat(self, interaction: discord.Interaction, message: str):
         """Slash command to chat with AI"""
-        global client
         try:
             await interaction.response.defer(thinking=True)
-            
-            if not client:
-                await interaction.followup.send("Character.AI is not configured. Please set up CHARACTERAI_TOKEN and CHARACTER_ID.")
-                return
-
-            character_id = os.getenv('CHARACTER_ID')
-            if not character_id:
-                await interaction.followup.send("Character ID not configured. Please set CHARACTER_ID in your environment variables.")
-                return
-
-            user_id = str(interaction.user.id)
-            
-            try:
-                if user_id not in user_chats:
-                    chat, greeting = await client.chat.create_chat(character_id)
-                    user_chats[user_id] = chat.chat_id
-                    logger.info(f"Created new chat session for user {user_id}: {chat.chat_id}")
-
-                chat_id = user_chats[user_id]
-
-                try:
-                    response = await asyncio.wait_for(
-                        client.chat.send_message(character_id, chat_id, message),
-                        timeout=30.0
-                    )
-                    
-                    primary_candidate = response.get_primary_candidate()
-                    ai_response = primary_candidate.text if primary_candidate else "Sorry, I can't think anything. I'm confused. TwT"
-
-                    if len(ai_response) > 1900:
-                        ai_response = ai_response[:1900] + "..."
-
-                    await interaction.followup.send(ai_response)
-                    
-                except asyncio.TimeoutError:
-                    await interaction.followup.send("Sorry, the AI is taking too long to respond. Please try again later.")
-                    
-            except Exception as api_error:
-                logger.error(f"Character.AI API error: {api_error}")
-                if user_id in user_chats:
-                    del user_chats[user_id]
-                await interaction.followup.send("Sorry, I encountered an error while processing your message. Please try again.")
+            await self.respond(AIRequest(
+                'slash',
+                self.session_key(interaction.user, interaction.guild, interaction.channel),
+                interaction.user.id,
+                self.character_for(interaction.guild),
+                message,
+                lambda content: interaction.followup.send(content, wait=True),
+            ))
 
         except Exception as e:
             logger.error(f"Error in slash_chat: {e}")
@@ -209,9 +282,7 @@ class AIChatCommands(commands.Cog):
         """Slash command to reset chat history"""
         try:
             await interaction.response.defer(ephemeral=True)
-            user_id = str(interaction.user.id)
-            if user_id in user_chats:
-                del user_chats[user_id]
+            if await self.sessions.delete(self.session_key(interaction.user, interaction.guild, interaction.channel)):
                 await interaction.followup.send("Your conversation history has been reset!")
             else:
                 await interaction.followup.send("You don't have an active conversation to reset.")
@@ -225,5 +296,133 @@ class AIChatCommands(commands.Cog):
             except:
                 pass
 
+    @app_commands.command(name='ai_config', description='Configure AI chat for this server (Admin only)')
+    @app_commands.describe(
+        action='What action to perform',
+        character_id='Character.AI character ID (from the character URL)',
+        channel='Channel where Suomi answers every message')
+    @app_commands.choices(action=[
+        app_commands.Choice(name='show', value='show'),
+        app_commands.Choice(name='set_character', value='set_character'),
+        app_commands.Choice(name='clear_character', value='clear_character'),
+        app_commands.Choice(name='set_channel', value='set_channel'),
+        app_commands.Choice(name='clear_channel', value='clear_channel'),
+        app_commands.Choice(name='reset_conversation', value='reset_conversation'),
+    ])
+    @app_commands.default_permissions(manage_guild=True)
+    @app_commands.guild_only()
+    async def slash_ai_config(self, interaction: discord.Interaction, action: str,
+                              character_id: Optional[str] = None,
+                              channel: Optional[discord.TextChannel] = None):
+        """AI chat settings management command"""
+        try:
+            guild_id = interaction.guild.id
+
+            if action == 'show':
+                embed = discord.Embed(title="⚙️ AI Chat Settings", color=0x00ff00)
+                character = self.character_for(interaction.guild)
+                source = "server" if guild_id in self.guild_characters else "default"
+                embed.add_field(name="Character", value=f"`{character}` ({source})" if character else "Not set", inline=False)
+                chat_channel = self.chat_channels.get(guild_id)
+                embed.add_field(
+                    name="Chat Channel",
+                    value=f"<#{chat_channel}>" if chat_channel else "None (mentions only)",
+                    inline=False
+                )
+                states = {}
+                for account in self.ai.accounts.values():
+                    states[account.state] = states.get(account.state, 0) + 1
+                embed.add_field(
+                    name="Accounts",
+                    value=", ".join(f"{count} {state}" for state, count in sorted(states.items())) or "None",
+                    inline=True
+                )
+                stats = self.scheduler.stats()
+                embed.add_field(
+                    name="Load",
+                    value=f"{stats['running']} running, {stats['queued']} queued, p95 wait {stats['wait_p95']:.1f}s",
+                    inline=True
+                )
+                await interaction.response.send_message(embed=embed, ephemeral=True)
+                return
+
+            if action == 'set_character':
+                character_id = (character_id or '').strip()
+                if not character_id:
+                    await interaction.response.send_message("Please provide a `character_id`!", ephemeral=True)
+                    return
+                await self.sessions.set_guild_character(guild_id, character_id)
+                self.guild_characters[guild_id] = character_id
+                message = f"Suomi now talks as character `{character_id}` here. Conversations with the previous character are kept for when it returns."
+
+            elif action == 'clear_character':
+                await self.sessions.set_guild_character(guild_id, None)
+                self.guild_characters.pop(guild_id, None)
+                message = "This server now uses the default character."
+
+            elif action == 'set_channel':
+                if channel is None:
+                    await interaction.response.send_message("Please specify a `channel`!", ephemeral=True)
+                    return
+                await self.sessions.set_chat_channel(guild_id, channel.id)
+                self.chat_channels[guild_id] = channel.id
+                message = f"Suomi now joins every conversation in {channel.mention}."
+
+            elif action == 'clear_channel':
+                await self.sessions.set_chat_channel(guild_id, None)
+                self.chat_channels.pop(guild_id, None)
+                message = "Suomi now only answers when mentioned."
+
+            else:
+                target = channel or interaction.channel
+                if await self.sessions.delete(channel_session_key(target.id, self.character_override(interaction.guild))):
+                    message = f"Suomi's conversation in {target.mention} has been reset."
+                else:
+                    message = f"There's no conversation to reset in {target.mention}."
+
+            await interaction.response.send_message(f"✅ {message}", ephemeral=True)
+
+        except Exception as e:
+            logger.error(f"Error in ai_config: {e}")
+            try:
+                if interaction.response.is_done():
+                    await interaction.followup.send("Error updating AI settings.", ephemeral=True)
+                else:
+                    await interaction.response.send_message("Error updating AI settings.", ephemeral=True)
+            except:
+                pass
+
+    @app_commands.command(name='ai_stats', description='Show AI latency by stage and error counts (Bot Owner Only)')
+    async def slash_ai_stats(self, interaction: discord.Interaction):
+        """Show AI pipeline latency histograms and counters"""
+        BOT_OWNER_ID = int(os.getenv('BOT_OWNER_ID', 0))
+
+        if interaction.user.id != BOT_OWNER_ID:
+            await interaction.response.send_message("❌ This command is only available for the bot owner.", ephemeral=True)
+            return
+
+        snapshot = self.pipeline.metrics.snapshot()
+        histograms = snapshot['histograms']
+        counters = snapshot['counters']
+
+        embed = discord.Embed(title="🧠 AI Pipeline", color=0x00ff00)
+        lines = []
+        for stage in STAGES:
+            if stage in histograms:
+                h = histograms[stage]
+                lines.append(
+                    f"`{stage:<11}` n={h['count']} p50 {h['p50']:.2f}s · p95 {h['p95']:.2f}s · "
+                    f"p99 {h['p99']:.2f}s · max {h['max']:.2f}s"
+                )
+        embed.add_field(name="Latency", value="\n".join(lines) or "No requests yet", inline=False)
+
+        for title, prefix in (("Outcomes", 'outcome.'), ("Errors", 'errors.'), ("Sources", 'source.'), ("New Sessions", 'sessions.')):
+            values = [f"{name[len(prefix):]}: {count}" for name, count in sorted(counters.items()) if name.startswith(prefix)]
+            embed.add_field(name=title, value="\n".join(values) or "None", inline=True)
+
+        stats = self.scheduler.stats()
+        embed.set_footer(text=f"{stats['running']} running · {stats['queued']} queued · {stats['rejected']} rejected")
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
 async def setup(bot):
     await bot.add_cog(AIChatCommands(bot))
\ No newline at end of file
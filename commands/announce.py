@@ -1,58 +1,256 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
+import asyncio
+import logging
 import os
+import time
+
+from utils.announce_store import AnnouncementStore
+from utils.fanout import SENT, FanoutDispatcher, classify_send_error
+
+logger = logging.getLogger(__name__)
+
+PROGRESS_INTERVAL = 5  # Seconds between progress message edits
+CHECKPOINT_BATCH = 50  # Outcomes buffered before they are written, at most
+
+def announcement_embed(message, author_name):
+    embed = discord.Embed(
+        title="Bot Announcement",
+        description=message,
+        color=0x00ff00
+    )
+    embed.set_footer(text=f"From {author_name}")
+    return embed
+
+def announcement_channel(guild):
+    """The system channel if we can post there, otherwise the first text channel we can post in"""
+    candidates = [guild.system_channel] if guild.system_channel else []
+    for text_channel in candidates + list(guild.text_channels):
+        permissions = text_channel.permissions_for(guild.me)
+        if permissions.send_messages and permissions.embed_links:
+            return text_channel
+    return None
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes}m" if hours else f"{minutes}m {seconds}s"
+
+class AnnouncementJob:
+    """A running announcement: its counters and the outcomes not yet checkpointed"""
+    def __init__(self, job_id, message, author_name, counts, progress_message=None):
+        self.job_id = job_id
+        self.message = message
+        self.author_name = author_name
+        self.sent = counts.get(SENT, 0)
+        self.failed = sum(count for outcome, count in counts.items() if outcome not in (SENT, None))
+        self.remaining = counts.get(None, 0)
+        self.failures = {outcome: count for outcome, count in counts.items() if outcome not in (SENT, None)}
+        self.progress_message = progress_message
+        self.started = time.monotonic()
+        self.handled_since_start = 0
+        self.checkpoint = []  # (guild_id, outcome) not yet written
+
+    @property
+    def total(self):
+        return self.sent + self.failed + self.remaining
+
+    def record(self, guild_id, outcome):
+        self.checkpoint.append((guild_id, outcome))
+        self.remaining -= 1
+        self.handled_since_start += 1
+        if outcome == SENT:
+            self.sent += 1
+        else:
+            self.failed += 1
+            self.failures[outcome] = self.failures.get(outcome, 0) + 1
+
+    def progress_embed(self, done=False):
+        embed = discord.Embed(
+            title=f"Announcement #{self.job_id} {'finished' if done else 'in progress'}",
+            color=0x00ff00 if done else 0xffa500
+        )
+        embed.add_field(name="Sent", value=str(self.sent), inline=True)
+        embed.add_field(name="Failed", value=str(self.failed), inline=True)
+        embed.add_field(name="Remaining", value=str(self.remaining), inline=True)
+        elapsed = time.monotonic() - self.started
+        if not done and self.handled_since_start and elapsed > 0:
+            rate = self.handled_since_start / elapsed
+            embed.add_field(name="ETA", value=f"{format_duration(self.remaining / rate)} ({rate:.1f} servers/s)", inline=False)
+        if self.failures:
+            embed.add_field(name="Failures", value=", ".join(
+                f"{outcome}: {count}" for outcome, count in sorted(self.failures.items())
+            ), inline=False)
+        embed.set_footer(text=f"{self.total} servers")
+        return embed
 
 class AnnounceCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.store = AnnouncementStore()
+        self.dispatcher = FanoutDispatcher(bot)
+        self.jobs = {}  # job_id -> asyncio.Task
+        self.resume_task = None
+
+    async def cog_load(self):
+        await self.store.open()
+        self.resume_task = asyncio.create_task(self.resume_jobs())
+
+    async def cog_unload(self):
+        if self.resume_task:
+            self.resume_task.cancel()
+        tasks = list(self.jobs.values())
+        for task in tasks:
+            task.cancel()
+        # Let cancelled jobs write their checkpoint before the database closes
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.store.close()
+
+    async def resume_jobs(self):
+        """Continue announcements that were still running when the bot stopped"""
+        await self.bot.wait_until_ready()
+        try:
+            for job_id, message, author_name, channel_id, message_id in await self.store.running_jobs():
+                progress_message = None
+                if channel_id and message_id:
+                    progress_message = self.bot.get_partial_messageable(channel_id).get_partial_message(message_id)
+                counts = await self.store.outcome_counts(job_id)
+                job = AnnouncementJob(job_id, message, author_name, counts, progress_message)
+                logger.info(f"Resuming announcement #{job_id} with {job.remaining} servers left")
+                self.start_job(job)
+        except Exception as e:
+            logger.error(f"Error resuming announcements: {e}")
+
+    def start_job(self, job):
+        if job.job_id in self.jobs:
+            return  # Already running; /announce and resume_jobs can both pick up a new job
+        task = asyncio.create_task(self.run_job(job))
+        self.jobs[job.job_id] = task
+        task.add_done_callback(lambda _: self.jobs.pop(job.job_id, None))
+
+    async def flush_checkpoint(self, job):
+        if job.checkpoint:
+            outcomes, job.checkpoint = job.checkpoint, []
+            try:
+                await self.store.record_outcomes(job.job_id, outcomes)
+            except BaseException:
+                # Keep them for the next flush, or these guilds get the announcement again on resume
+                job.checkpoint = outcomes + job.checkpoint
+                raise
+
+    async def update_progress(self, job, done=False):
+        if job.progress_message is None:
+            return
+        try:
+            await job.progress_message.edit(embed=job.progress_embed(done))
+        except discord.HTTPException as e:
+            logger.error(f"Error updating progress for announcement #{job.job_id}: {e}")
+            if not classify_send_error(e)[1]:
+                # Deleted message, closed DMs or an expired interaction token: stop editing
+                job.progress_message = None
+
+    async def report_progress(self, job):
+        """Checkpoint and refresh the progress message every PROGRESS_INTERVAL seconds"""
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            try:
+                await self.flush_checkpoint(job)
+            except Exception as e:
+                logger.error(f"Error checkpointing announcement #{job.job_id}: {e}")
+            await self.update_progress(job)
+
+    async def deliver(self, job, guild_id, embed):
+        guild = self.bot.get_guild(guild_id)
+        if guild is None:
+            outcome = 'left'  # The bot left the server since the job started
+        else:
+            channel = announcement_channel(guild)
+            if channel is None:
+                outcome = 'no_channel'
+            else:
+                delivery = await self.dispatcher.deliver(channel.id, embed=embed)
+                outcome = delivery.outcome
+                if outcome != SENT:
+                    logger.warning(f"Failed to send announcement to {guild.name}: {outcome} ({delivery.error})")
+        job.record(guild_id, outcome)
+        if len(job.checkpoint) >= CHECKPOINT_BATCH:
+            await self.flush_checkpoint(job)
+
+    async def run_job(self, job):
+        """Deliver an announcement to every pending guild, checkpointing as it goes"""
+        embed = announcement_embed(job.message, job.author_name)
+        reporter = asyncio.create_task(self.report_progress(job))
+        deliveries = []
+        try:
+            pending = await self.store.pending_guilds(job.job_id)
+            # The dispatcher bounds how many sends are in flight
+            deliveries = [asyncio.create_task(self.deliver(job, guild_id, embed)) for guild_id in pending]
+            results = await asyncio.gather(*deliveries, return_exceptions=True)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error running announcement #{job.job_id}: {e}")
+            return
+        finally:
+            # On cancellation or error, stop the remaining sends before checkpointing
+            for task in [reporter, *deliveries]:
+                task.cancel()
+            await asyncio.gather(reporter, *deliveries, return_exceptions=True)
+            try:
+                await self.flush_checkpoint(job)
+            except Exception as e:
+                logger.error(f"Error checkpointing announcement #{job.job_id}: {e}")
+
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            # Guilds whose delivery raised are still pending; the job resumes them on restart
+            logger.error(f"Announcement #{job.job_id}: {len(errors)} deliveries failed, first error: {errors[0]!r}")
+            return
+
+        await self.store.finish_job(job.job_id)
+        await self.update_progress(job, done=True)
+        logger.info(f"Announcement #{job.job_id} finished: {job.sent} sent, {job.failed} failed")
 
     @app_commands.command(name='announce', description='Send a message to all servers (Bot Owner Only)')
     @app_commands.describe(message='The message to send to all servers')
     async def slash_announce(self, interaction: discord.Interaction, message: str):
         """Send announcement to all servers"""
         BOT_OWNER_ID = int(os.getenv('BOT_OWNER_ID'))
-        
+
         if interaction.user.id != BOT_OWNER_ID:
             await interaction.response.send_message("❌ This command is only available for the bot owner.", ephemeral=True)
             return
 
         await interaction.response.defer(ephemeral=True)
-        
-        sent_count = 0
-        failed_count = 0
-        
-        for guild in self.bot.guilds:
+
+        try:
+            guild_ids = [guild.id for guild in self.bot.guilds]
+            author_name = interaction.user.display_name
+            job_id = await self.store.create_job(message, author_name, guild_ids)
+            job = AnnouncementJob(job_id, message, author_name, {None: len(guild_ids)})
+
+            # Progress stays private: a DM survives restarts and the interaction
+            # token's 15 minute expiry, so an ephemeral followup is only the
+            # fallback for owners who don't accept DMs
+            progress = ""
             try:
-                # Try to find a text channel where we can send messages
-                channel = None
-                for text_channel in guild.text_channels:
-                    if text_channel.permissions_for(guild.me).send_messages:
-                        channel = text_channel
-                        break
-                
-                if channel:
-                    embed = discord.Embed(
-                        title="Bot Announcement",
-                        description=message,
-                        color=0x00ff00
-                    )
-                    embed.set_footer(text=f"From {interaction.user.display_name}")
-                    await channel.send(embed=embed)
-                    sent_count += 1
-                else:
-                    failed_count += 1
-                    
-            except Exception as e:
-                print(f"Failed to send message to {guild.name}: {e}")
-                failed_count += 1
-        
-        await interaction.followup.send(
-            f"✅ Announcement sent!\n"
-            f"• Success: {sent_count} servers\n"
-            f"• Failed: {failed_count} servers",
-            ephemeral=True
-        )
+                job.progress_message = await interaction.user.send(embed=job.progress_embed())
+                await self.store.set_progress_message(job_id, job.progress_message.channel.id, job.progress_message.id)
+                progress = f" Progress: {job.progress_message.jump_url}"
+            except discord.HTTPException:
+                job.progress_message = await interaction.followup.send(
+                    embed=job.progress_embed(), ephemeral=True, wait=True
+                )
+
+            self.start_job(job)
+            await interaction.followup.send(
+                f"✅ Announcement #{job_id} started for {len(guild_ids)} servers.{progress}",
+                ephemeral=True
+            )
+        except Exception as e:
+            logger.error(f"Error starting announcement: {e}")
+            await interaction.followup.send("❌ Failed to start the announcement.", ephemeral=True)
 
 async def setup(bot):
-    await bot.add_cog(AnnounceCommands(bot))
\ No newline at end of file
+    await bot.add_cog(AnnounceCommands(bot))
@@ -1,56 +1,47 @@
 # commands/gunsmoke.py
-import os
 import json
+import math
+import random
+import time
+import asyncio
 import logging
 import discord
 from discord import app_commands
-from discord.ext import commands, tasks
-from datetime import datetime, timedelta
-import pytz
+from discord.ext import commands
+from datetime import datetime
+
+from utils.gunsmoke_schedule import (
+    EVENT_LENGTH, JAKARTA_TZ, RESET_HOUR, build_timeline, next_start_after, parse_start, reschedule_message,
+)
+from utils.fanout import SENT, FanoutDispatcher
+from utils.gunsmoke_store import GunsmokeGuild, GunsmokeStore
 
 logger = logging.getLogger(__name__)
 
 # Gunsmoke Frontline configuration
-GUNSMOKE_CONFIG_FILE = 'gunsmoke_config.json'
-JAKARTA_TZ = pytz.timezone('Asia/Jakarta')
-RESET_HOUR = 16  # 4 PM in Jakarta time
-
-# Default configuration
-default_gunsmoke_config = {
-    'enabled': False,
-    'current_start': None,
-    'notification_channels': [],
-    'last_notification_sent': None,
-    'last_reset_notification': None
-}
-
-def load_gunsmoke_config():
-    """Load gunsmoke configuration from file"""
-    try:
-        if os.path.exists(GUNSMOKE_CONFIG_FILE):
-            with open(GUNSMOKE_CONFIG_FILE, 'r') as f:
-                return json.load(f)
-        else:
-            return default_gunsmoke_config.copy()
-    except Exception as e:
-        logger.error(f"Error loading gunsmoke config: {e}")
-        return default_gunsmoke_config.copy()
+GUNSMOKE_CONFIG_FILE = 'gunsmoke_config.json'  # Global config from before per-guild schedules
+MAX_SLEEP = 3600  # Re-check the clock at least hourly in case it jumped
+DUE_BATCH = 100  # Guilds handled per database round trip
+RETRY_BASE_DELAY = 60  # First retry of a guild whose schedule failed, doubling up to MAX_SLEEP
 
-def save_gunsmoke_config(config):
-    """Save gunsmoke configuration to file"""
+def load_gunsmoke_config(path=GUNSMOKE_CONFIG_FILE):
+    """Read the old global config file, or None if there is none"""
     try:
-        with open(GUNSMOKE_CONFIG_FILE, 'w') as f:
-            json.dump(config, f, indent=2, default=str)
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
     except Exception as e:
-        logger.error(f"Error saving gunsmoke config: {e}")
+        logger.error(f"Error loading gunsmoke config: {e}")
+        return None
 
-def get_gunsmoke_status(config):
+def get_gunsmoke_status(schedule):
     """Get current gunsmoke status"""
-    if not config['enabled'] or not config['current_start']:
+    if not schedule.enabled or not schedule.current_start:
         return None, None, None
 
-    start_time = datetime.fromisoformat(config['current_start']).replace(tzinfo=JAKARTA_TZ)
-    end_time = start_time + timedelta(days=7)  # Gunsmoke lasts 1 week
+    start_time = parse_start(schedule.current_start)
+    end_time = start_time + EVENT_LENGTH
     now = datetime.now(JAKARTA_TZ)
 
     if now < start_time:
@@ -62,162 +53,186 @@ def get_gunsmoke_status(config):
 
 def calculate_next_gunsmoke_start(current_start):
     """Calculate next gunsmoke start time (3 weeks after current ends)"""
-    current_start_dt = datetime.fromisoformat(current_start).replace(tzinfo=JAKARTA_TZ)
-    current_end = current_start_dt + timedelta(days=7)
-    next_start = current_end + timedelta(days=21)  # 3 weeks later
-    return next_start
-
-async def send_gunsmoke_notification(bot, channel_ids, message):
-    """Send notification to all configured channels"""
-    for channel_id in channel_ids:
-        try:
-            channel = bot.get_channel(int(channel_id))
-            if channel:
-                await channel.send(message)
-        except Exception as e:
-            logger.error(f"Error sending notification to channel {channel_id}: {e}")
+    return next_start_after(parse_start(current_start), datetime.now(JAKARTA_TZ))
+
+def pending_events(schedule):
+    """Timeline events a guild hasn't handled yet, earliest first"""
+    if not schedule.enabled or not schedule.current_start:
+        return []
+    return build_timeline(parse_start(schedule.current_start), schedule.last_event)
+
+def next_event_time(events):
+    """Unix time, rounded up to the second, when the first of `events` is due"""
+    return math.ceil(events[0].at.timestamp()) if events else None
+
+def failure_backoff(failures):
+    """Seconds before retrying a guild that failed `failures` times in a row, with jitter"""
+    delay = min(MAX_SLEEP, RETRY_BASE_DELAY * 2 ** (failures - 1))
+    return random.uniform(delay / 2, delay)
 
 class GunsmokeCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.gunsmoke_reminder.start()
-
-    def cog_unload(self):
-        self.gunsmoke_reminder.cancel()
+        self.store = GunsmokeStore()
+        self.dispatcher = FanoutDispatcher(bot)
+        self.schedule_changed = asyncio.Event()
+        self.reminder_task = None
+        self.failures = {}  # guild_id -> consecutive failed attempts at its schedule
+
+    async def cog_load(self):
+        await self.store.open()
+        self.reminder_task = asyncio.create_task(self.gunsmoke_reminder())
+
+    async def cog_unload(self):
+        if self.reminder_task:
+            self.reminder_task.cancel()
+        await self.store.close()
+
+    async def save_schedule(self, schedule):
+        """Store a guild's schedule with its next due time and wake the reminder task"""
+        schedule.next_event_at = next_event_time(pending_events(schedule))
+        await self.store.save_guild(schedule)
+        self.failures.pop(schedule.guild_id, None)
+        self.schedule_changed.set()
+
+    async def import_legacy_config(self):
+        """Copy the old global gunsmoke_config.json into per-guild schedules, once
+
+        The schedule is copied to every guild that owns one of its channels.
+        Channels missing from the cache are looked up over the API; the file
+        itself is left alone and the import is recorded in the database.
+        """
+        if await self.store.legacy_imported():
+            return
+        config = load_gunsmoke_config()
+        if config is None:
+            return
+        guild_channels = {}
+        for channel_id in config.get('notification_channels', []):
+            try:
+                channel = await self.dispatcher.resolve(int(channel_id))
+            except (discord.NotFound, discord.Forbidden) as e:
+                # Can't tell which guild it belonged to; anything else is retried next start
+                logger.warning(f"Dropping gunsmoke channel {channel_id} from the old config: {e}")
+                continue
+            guild = getattr(channel, 'guild', None)
+            if guild is None:
+                logger.warning(f"Dropping gunsmoke channel {channel_id} from the old config: not in a server")
+                continue
+            guild_channels.setdefault(guild.id, []).append(channel.id)
+
+        # Everything up to now was handled by the old loop
+        last_event = tuple(config['last_event']) if config.get('last_event') else (int(time.time()), 0)
+        imports = []
+        for guild_id, channel_ids in guild_channels.items():
+            schedule = GunsmokeGuild(guild_id, bool(config.get('enabled')), config.get('current_start'), last_event)
+            schedule.next_event_at = next_event_time(pending_events(schedule))
+            imports.append((schedule, channel_ids))
+        await self.store.import_legacy(imports, time.time())
+        logger.info(f"Imported gunsmoke config into {len(imports)} guilds")
 
-    @tasks.loop(minutes=1)
     async def gunsmoke_reminder(self):
-        """Background task to check for gunsmoke reminders"""
+        """Sleep until any guild's next gunsmoke notification is due and handle the due guilds"""
+        await self.bot.wait_until_ready()
         try:
-            config = load_gunsmoke_config()
-
-            if not config['enabled'] or not config['notification_channels']:
-                return
+            await self.import_legacy_config()
+        except Exception as e:
+            logger.error(f"Error importing gunsmoke config: {e}")
 
+        while True:
+            try:
+                self.schedule_changed.clear()
+                now = time.time()
+                next_due = await self.store.next_due()
+                delay = MAX_SLEEP if next_due is None else min(MAX_SLEEP, next_due - now)
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(self.schedule_changed.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                # Guilds are independent; the dispatcher bounds how many sends run at once
+                due = await self.store.due_guilds(int(now), DUE_BATCH)
+                results = await asyncio.gather(*(self.handle_guild(schedule) for schedule in due), return_exceptions=True)
+                for schedule, result in zip(due, results):
+                    if isinstance(result, Exception):
+                        await self.postpone_failed_guild(schedule.guild_id, result)
+                    else:
+                        self.failures.pop(schedule.guild_id, None)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in gunsmoke reminder task: {e}")
+                await asyncio.sleep(60)
+
+    async def postpone_failed_guild(self, guild_id, error):
+        """Push a failing guild's next attempt back so it doesn't keep the loop busy"""
+        failures = self.failures.get(guild_id, 0) + 1
+        self.failures[guild_id] = failures
+        delay = failure_backoff(failures)
+        logger.error(f"Error handling gunsmoke schedule for guild {guild_id} "
+                     f"(attempt {failures}, retrying in {delay:.0f}s): {error}")
+        # If this fails too, the reminder loop's own error handling slows it down
+        await self.store.postpone(guild_id, math.ceil(time.time() + delay))
+
+    async def send_notification(self, guild_id, message):
+        """Send a notification to a guild's channels and record how each delivery went"""
+        channel_ids = await self.store.channels(guild_id)
+        if not channel_ids:
+            return
+        deliveries = await self.dispatcher.send(channel_ids, message)
+        for delivery in deliveries:
+            if delivery.outcome != SENT:
+                logger.warning(f"Gunsmoke notification to channel {delivery.channel_id} {delivery.outcome} "
+                               f"after {delivery.attempts} attempts: {delivery.error}")
+        for channel_id in await self.store.record_deliveries(guild_id, deliveries, time.time()):
+            logger.warning(f"Quarantined gunsmoke channel {channel_id} in guild {guild_id}")
+
+    async def handle_guild(self, schedule):
+        """Handle every due event for one guild, then store its next due time
+
+        Sends can take a while with retries, so progress is only written if
+        the schedule is still the one we loaded; if /gunsmoke changed it in
+        the meantime, the admin's version wins and this run stops.
+        """
+        expected = (schedule.enabled, schedule.current_start, schedule.last_event)
+        while True:
+            events = pending_events(schedule)
             now = datetime.now(JAKARTA_TZ)
-            current_date = now.strftime('%Y-%m-%d')
-            status, start_time, end_time = get_gunsmoke_status(config)
-
-            if status == "active":
-                # Calculate days remaining
-                days_remaining = (end_time - now).days + 1
-
-                # Check for different reminder messages based on days remaining
-                day_messages = {
-                    7: ("First Day of Gunsmoke Frontline!",
-                        "Everyone, it's time to shine! Let's make today count and score some points!\nRemember, Gunsmoke ends 3 hours before reset."),
-                    6: ("Second Day of Gunsmoke Frontline!",
-                        "Keep up the great work and aim for even higher scores!\nRemember, Gunsmoke ends 3 hours before reset."),
-                    5: ("Third Day of Gunsmoke Frontline!",
-                        "Let's push for even better results today!\nRemember, Gunsmoke ends 3 hours before reset."),
-                    4: ("Fourth Day of Gunsmoke Frontline!",
-                        "Let's aim for some great scores today!\nRemember, Gunsmoke ends 3 hours before reset."),
-                    3: ("Fifth Day of Gunsmoke Frontline!",
-                        "Let's make the most of today and aim for some great scores!\nRemember, Gunsmoke ends 3 hours before reset."),
-                    2: ("Sixth Day of Gunsmoke Frontline!",
-                        "Let's make today count and aim for some great scores!\nRemember, Gunsmoke ends 3 hours before reset."),
-                    1: ("Last Day of Gunsmoke Frontline!",
-                        "It's the final day! Let's make it count and aim for some great scores!\nRemember, Gunsmoke ends 3 hours before reset.")
-                }
-
-                if days_remaining in day_messages:
-                    day_key = f"{current_date}_day{days_remaining}" if days_remaining > 1 else f"{current_date}_lastday"
-                    if config.get('last_notification_sent') != day_key:
-                        title, message_text = day_messages[days_remaining]
-                        await send_gunsmoke_notification(
-                            self.bot,
-                            config['notification_channels'],
-                            f"**{title}**\n\n{message_text}"
-                        )
-                        config['last_notification_sent'] = day_key
-                        save_gunsmoke_config(config)
-
-                # Check for 3-hour warning (only on last day)
-                last_day = end_time.date() == now.date()
-                warning_time = end_time - timedelta(hours=3)
-
-                if (last_day and now >= warning_time and now < end_time
-                        and config.get('last_notification_sent') != f"{current_date}_warning"):
-
-                    await send_gunsmoke_notification(
-                        self.bot,
-                        config['notification_channels'],
-                        "**Gunsmoke Frontline Warning!**\n\n"
-                        "Keep in mind that Gunsmoke ends 3 hours before reset! "
-                        "Make sure to finish your runs before the event closes!"
-                    )
-
-                    config['last_notification_sent'] = f"{current_date}_warning"
-                    save_gunsmoke_config(config)
+            if not events or events[0].at > now:
+                break
+            event = events[0]
 
-                # Check for daily reset notification
-                reset_time = now.replace(hour=RESET_HOUR, minute=0, second=0, microsecond=0)
-                if (abs((now - reset_time).total_seconds()) < 600
-                        and config.get('last_reset_notification') != current_date):
-
-                    await send_gunsmoke_notification(
-                        self.bot,
-                        config['notification_channels'],
-                        "**Gunsmoke is Reset. Good Work everyone! :D**\n\n"
-                        "Let's do our best for today too! Time to score some points!"
-                    )
-
-                    config['last_reset_notification'] = current_date
-                    save_gunsmoke_config(config)
-
-            elif status == "upcoming":
-                # Calculate days until Gunsmoke starts
-                days_until_start = (start_time - now).days
-
-                # Check for different reminder messages based on days until start
-                upcoming_messages = {
-                    2: ("Gunsmoke Frontline is coming in 2 days!",
-                        "Everyone, get ready to shine! Let's make the most of this event and aim for some great scores!"),
-                    1: ("Gunsmoke Frontline is coming tomorrow!",
-                        "Everyone, get ready to shine! Let's make the most of this event and aim for some great scores!"),
-                    0: ("Gunsmoke Frontline is starting today!",
-                        "Everyone, get ready to shine! Let's make the most of this event and aim for some great scores!")
-                }
-
-                if days_until_start in upcoming_messages:
-                    day_key = f"{current_date}_{days_until_start}days" if days_until_start == 2 else \
-                             f"{current_date}_{days_until_start}day" if days_until_start == 1 else \
-                             f"{current_date}_today"
-                    
-                    if config.get('last_notification_sent') != day_key:
-                        title, message_text = upcoming_messages[days_until_start]
-                        await send_gunsmoke_notification(
-                            self.bot,
-                            config['notification_channels'],
-                            f"**{title}**\n\n{message_text}"
-                        )
-                        config['last_notification_sent'] = day_key
-                        save_gunsmoke_config(config)
-
-            elif status == "ended":
+            if event.expires is not None and now >= event.expires:
+                logger.debug(f"Skipping missed gunsmoke notification {event} for guild {schedule.guild_id}")
+            elif event.kind == 'reschedule':
                 # Auto-schedule next gunsmoke
-                next_start = calculate_next_gunsmoke_start(config['current_start'])
-                config['current_start'] = next_start.isoformat()
-                config['last_notification_sent'] = None
-                config['last_reset_notification'] = None
-                save_gunsmoke_config(config)
-
-                await send_gunsmoke_notification(
-                    self.bot,
-                    config['notification_channels'],
-                    f"**Next Gunsmoke Frontline scheduled!**\n\n"
-                    f"Next event starts: **{next_start.strftime('%Y-%m-%d %H:%M')} (UTC+7) Time**\n"
-                    f"Get ready Everyone!"
-                )
+                next_start = calculate_next_gunsmoke_start(schedule.current_start)
+                schedule.current_start = next_start.isoformat()
+                await self.send_notification(schedule.guild_id, reschedule_message(next_start))
+            else:
+                await self.send_notification(schedule.guild_id, event.message)
+
+            # Persist right away so a restart doesn't send it again
+            schedule.last_event = event.key
+            schedule.next_event_at = next_event_time(pending_events(schedule))
+            if not await self.store.save_progress(schedule, expected):
+                logger.info(f"Gunsmoke schedule for guild {schedule.guild_id} changed while sending; keeping the new one")
+                return
+            expected = (schedule.enabled, schedule.current_start, schedule.last_event)
 
-        except Exception as e:
-            logger.error(f"Error in gunsmoke reminder task: {e}")
+        schedule.next_event_at = next_event_time(events)
+        if not await self.store.save_progress(schedule, expected):
+            logger.info(f"Gunsmoke schedule for guild {schedule.guild_id} changed while sending; keeping the new one")
 
     @app_commands.command(name='gunsmoke', description='Manage Gunsmoke Frontline event system')
     @app_commands.describe(
         action='What action to perform',
         start_date='Start date for gunsmoke (YYYY-MM-DD format, UTC+7)',
         channel='Channel to add/remove for notifications')
+    @app_commands.guild_only()
     @app_commands.choices(action=[
         app_commands.Choice(name='status', value='status'),
         app_commands.Choice(name='enable', value='enable'),
@@ -239,13 +254,15 @@ class GunsmokeCommands(commands.Cog):
                 await interaction.followup.send("Sorry you're not allowed to do that!")
                 return
 
-            config = load_gunsmoke_config()
+            guild_id = interaction.guild.id
+            schedule = await self.store.get_guild(guild_id)
 
             if action == 'status':
-                status, start_time, end_time = get_gunsmoke_status(config)
+                status, start_time, end_time = get_gunsmoke_status(schedule)
+                channel_ids = await self.store.channels(guild_id)
 
                 embed = discord.Embed(title="Gunsmoke Frontline Status", color=0x00ff00)
-                embed.add_field(name="System", value="Enabled" if config['enabled'] else "Disabled", inline=True)
+                embed.add_field(name="System", value="Enabled" if schedule.enabled else "Disabled", inline=True)
 
                 if status:
                     if status == "active":
@@ -260,24 +277,29 @@ class GunsmokeCommands(commands.Cog):
                         embed.add_field(name="Starts", value=start_time.strftime('%Y-%m-%d %H:%M (UTC+7)'), inline=False)
                     else:
                         embed.add_field(name="Current Status", value="Ended", inline=True)
-                        next_start = calculate_next_gunsmoke_start(config['current_start'])
+                        next_start = calculate_next_gunsmoke_start(schedule.current_start)
                         embed.add_field(name="Next Starts", value=next_start.strftime('%Y-%m-%d %H:%M (UTC+7)'), inline=False)
                 else:
                     embed.add_field(name="Current Status", value="Not Scheduled", inline=True)
 
-                embed.add_field(name="Notification Channels", value=str(len(config['notification_channels'])), inline=True)
+                events = pending_events(schedule)
+                if events:
+                    embed.add_field(name="Next Notification",
+                                    value=f"{events[0].kind} at {events[0].at.strftime('%Y-%m-%d %H:%M (UTC+7)')}",
+                                    inline=False)
+                embed.add_field(name="Notification Channels", value=str(len(channel_ids)), inline=True)
                 embed.add_field(name="Reset Time", value="16:00 (UTC+7) Time", inline=True)
 
                 await interaction.followup.send(embed=embed)
 
             elif action == 'enable':
-                config['enabled'] = True
-                save_gunsmoke_config(config)
+                schedule.enabled = True
+                await self.save_schedule(schedule)
                 await interaction.followup.send("Gunsmoke Frontline system enabled!")
 
             elif action == 'disable':
-                config['enabled'] = False
-                save_gunsmoke_config(config)
+                schedule.enabled = False
+                await self.save_schedule(schedule)
                 await interaction.followup.send("Gunsmoke Frontline system disabled!")
 
             elif action == 'set_start':
@@ -290,10 +312,9 @@ class GunsmokeCommands(commands.Cog):
                     start_datetime = start_datetime.replace(hour=RESET_HOUR, minute=0, second=0)
                     start_datetime = JAKARTA_TZ.localize(start_datetime)
 
-                    config['current_start'] = start_datetime.isoformat()
-                    config['last_notification_sent'] = None
-                    config['last_reset_notification'] = None
-                    save_gunsmoke_config(config)
+                    schedule.current_start = start_datetime.isoformat()
+                    schedule.last_event = None
+                    await self.save_schedule(schedule)
 
                     await interaction.followup.send(
                         f"Gunsmoke Frontline start date set to: **{start_datetime.strftime('%Y-%m-%d %H:%M')} (UTC+7)**"
@@ -306,10 +327,7 @@ class GunsmokeCommands(commands.Cog):
                     await interaction.followup.send("Please specify a channel to add!")
                     return
 
-                channel_id = str(channel.id)
-                if channel_id not in config['notification_channels']:
-                    config['notification_channels'].append(channel_id)
-                    save_gunsmoke_config(config)
+                if await self.store.add_channel(guild_id, channel.id):
                     await interaction.followup.send(f"Added {channel.mention} to Gunsmoke notifications!")
                 else:
                     await interaction.followup.send(f"{channel.mention} is already in the notification list!")
@@ -319,26 +337,26 @@ class GunsmokeCommands(commands.Cog):
                     await interaction.followup.send("Please specify a channel to remove!")
                     return
 
-                channel_id = str(channel.id)
-                if channel_id in config['notification_channels']:
-                    config['notification_channels'].remove(channel_id)
-                    save_gunsmoke_config(config)
+                if await self.store.remove_channel(guild_id, channel.id):
                     await interaction.followup.send(f"Removed {channel.mention} from Gunsmoke notifications!")
                 else:
                     await interaction.followup.send(f"{channel.mention} is not in the notification list!")
 
             elif action == 'list_channels':
-                if not config['notification_channels']:
+                statuses = await self.store.channel_statuses(guild_id)
+                if not statuses:
                     await interaction.followup.send("No notification channels configured!")
                     return
 
                 channels_list = []
-                for channel_id in config['notification_channels']:
-                    channel_obj = self.bot.get_channel(int(channel_id))
-                    if channel_obj:
-                        channels_list.append(channel_obj.mention)
-                    else:
-                        channels_list.append(f"Unknown Channel ({channel_id})")
+                for channel_id, quarantined, failures, last_outcome, last_attempt in statuses:
+                    channel_obj = self.bot.get_channel(channel_id)
+                    line = channel_obj.mention if channel_obj else f"Unknown Channel ({channel_id})"
+                    if quarantined:
+                        line += f" — paused after {failures} failed deliveries ({last_outcome}), use add_channel to retry"
+                    elif last_outcome and last_outcome != SENT:
+                        line += f" — last delivery {last_outcome}"
+                    channels_list.append(line)
 
                 embed = discord.Embed(title="Gunsmoke Notification Channels",
                                     description="\n".join(channels_list),
@@ -1,59 +1,626 @@
 import discord
 from discord import app_commands
-from discord.ext import commands
-import sqlite3
+from discord.ext import commands, tasks
 import asyncio
 import datetime
+import io
 import math
 import os
+import random
+import tempfile
+import time
 from typing import Optional
+from utils.database import get_database
+from utils.leveling_config import CURVES, DEFAULT_CURVE, CooldownStore, LevelingConfig
+from utils import leveling_io
+from utils.rank_card import RankCardRenderer
+from utils.ranking import RankIndex, RankIndexCache
 
 # Database setup
 DB_PATH = "database/leveling.db"
 
-def init_db():
-    """Initialize the database"""
-    # Create database directory if it doesn't exist
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Create table if it doesn't exist
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS user_levels (
-            user_id INTEGER,
-            guild_id INTEGER,
-            xp INTEGER DEFAULT 0,
-            level INTEGER DEFAULT 1,
-            messages INTEGER DEFAULT 0,
-            last_message TIMESTAMP,
-            PRIMARY KEY (user_id, guild_id)
+LEADERBOARD_PAGE_SIZE = 10
+
+# XP settings (per-guild rules live in guild_settings / channel_multipliers)
+FLUSH_INTERVAL = 5  # Seconds between XP buffer flushes
+MAX_PENDING_USERS = 5000  # Flush early once this many users have unsaved XP
+NAME_FETCH_TIMEOUT = 2.0  # Seconds to wait for names of users missing from the cache
+
+# Voice XP
+VOICE_XP_PER_MINUTE = 10
+VOICE_CHECKPOINT_MINUTES = 5  # Long sessions are credited this often, bounding loss on restart
+
+# Level-up announcements
+ANNOUNCE_WINDOW = 3  # Seconds to gather level-ups per channel into one embed
+ANNOUNCE_MAX_AGE = 30  # Level-ups waiting longer than this are dropped, not announced
+ANNOUNCE_MAX_LINES = 15
+
+# Activity rollups
+HOURLY_RETENTION_DAYS = 30  # Hourly rows older than this are pruned; daily rows are kept
+STATS_TOP_COUNT = 5
+
+SELECT_XP_SQL = 'SELECT xp FROM user_levels WHERE user_id = ? AND guild_id = ?'
+
+SELECT_STATS_SQL = 'SELECT xp, level, messages FROM user_levels WHERE user_id = ? AND guild_id = ?'
+
+SELECT_PAGE_SQL = '''
+    SELECT user_id, level, xp, messages
+    FROM user_levels
+    WHERE guild_id = ?
+    ORDER BY xp DESC, user_id
+    LIMIT ? OFFSET ?
+'''
+
+SELECT_GUILD_XP_SQL = 'SELECT user_id, xp FROM user_levels WHERE guild_id = ?'
+
+UPSERT_NAME_SQL = '''
+    INSERT INTO user_names (user_id, name, updated_at)
+    VALUES (?, ?, ?)
+    ON CONFLICT (user_id) DO UPDATE SET
+        name = excluded.name,
+        updated_at = excluded.updated_at
+'''
+
+SELECT_GUILD_SETTINGS_SQL = 'SELECT guild_id, xp_min, xp_max, cooldown, curve FROM guild_settings'
+
+SELECT_CHANNEL_MULTIPLIERS_SQL = 'SELECT guild_id, channel_id, multiplier FROM channel_multipliers'
+
+UPSERT_GUILD_SETTINGS_SQL = '''
+    INSERT INTO guild_settings (guild_id, xp_min, xp_max, cooldown, curve)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (guild_id) DO UPDATE SET
+        xp_min = excluded.xp_min,
+        xp_max = excluded.xp_max,
+        cooldown = excluded.cooldown,
+        curve = excluded.curve
+'''
+
+UPSERT_CHANNEL_MULTIPLIER_SQL = '''
+    INSERT INTO channel_multipliers (guild_id, channel_id, multiplier)
+    VALUES (?, ?, ?)
+    ON CONFLICT (guild_id, channel_id) DO UPDATE SET multiplier = excluded.multiplier
+'''
+
+DELETE_CHANNEL_MULTIPLIER_SQL = 'DELETE FROM channel_multipliers WHERE guild_id = ? AND channel_id = ?'
+
+UPSERT_ACTIVITY_HOURLY_SQL = '''
+    INSERT INTO activity_hourly (guild_id, hour, channel_id, messages)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (guild_id, hour, channel_id) DO UPDATE SET
+        messages = activity_hourly.messages + excluded.messages
+'''
+
+UPSERT_ACTIVITY_DAILY_SQL = '''
+    INSERT INTO activity_daily (guild_id, day, channel_id, messages)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (guild_id, day, channel_id) DO UPDATE SET
+        messages = activity_daily.messages + excluded.messages
+'''
+
+UPSERT_ACTIVITY_USER_DAILY_SQL = '''
+    INSERT INTO activity_user_daily (guild_id, day, user_id, messages, xp)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (guild_id, day, user_id) DO UPDATE SET
+        messages = activity_user_daily.messages + excluded.messages,
+        xp = activity_user_daily.xp + excluded.xp
+'''
+
+PRUNE_ACTIVITY_HOURLY_SQL = 'DELETE FROM activity_hourly WHERE hour < ?'
+
+SELECT_HOURLY_CURVE_SQL = '''
+    SELECT hour, SUM(messages) FROM activity_hourly
+    WHERE guild_id = ? AND hour >= ?
+    GROUP BY hour
+'''
+
+SELECT_DAILY_CURVE_SQL = '''
+    SELECT day, SUM(messages) FROM activity_daily
+    WHERE guild_id = ? AND day >= ?
+    GROUP BY day
+'''
+
+SELECT_TOP_CHANNELS_SQL = '''
+    SELECT channel_id, SUM(messages) AS total FROM activity_daily
+    WHERE guild_id = ? AND day >= ?
+    GROUP BY channel_id
+    ORDER BY total DESC
+    LIMIT ?
+'''
+
+SELECT_TOP_MEMBERS_SQL = '''
+    SELECT user_id, SUM(messages) AS total, SUM(xp) FROM activity_user_daily
+    WHERE guild_id = ? AND day >= ?
+    GROUP BY user_id
+    ORDER BY total DESC
+    LIMIT ?
+'''
+
+UPSERT_XP_SQL = '''
+    INSERT INTO user_levels (user_id, guild_id, xp, level, messages, last_message)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, guild_id) DO UPDATE SET
+        xp = user_levels.xp + excluded.xp,
+        level = excluded.level,
+        messages = user_levels.messages + excluded.messages,
+        last_message = excluded.last_message
+'''
+
+# Schema migrations, applied in order (see utils.database.Database)
+MIGRATIONS = [
+    # 1: initial schema
+    '''
+    CREATE TABLE IF NOT EXISTS user_levels (
+        user_id INTEGER,
+        guild_id INTEGER,
+        xp INTEGER DEFAULT 0,
+        level INTEGER DEFAULT 1,
+        messages INTEGER DEFAULT 0,
+        last_message TIMESTAMP,
+        PRIMARY KEY (user_id, guild_id)
+    );
+    ''',
+    # 2: covering index for leaderboards and rank lookups
+    '''
+    CREATE INDEX IF NOT EXISTS idx_user_levels_guild_xp
+        ON user_levels (guild_id, xp DESC, user_id, level, messages);
+    ''',
+    # 3: display-name cache so leaderboards can render departed users without REST calls
+    '''
+    CREATE TABLE IF NOT EXISTS user_names (
+        user_id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        updated_at TIMESTAMP
+    );
+    ''',
+    # 4: per-guild leveling rules
+    '''
+    CREATE TABLE IF NOT EXISTS guild_settings (
+        guild_id INTEGER PRIMARY KEY,
+        xp_min INTEGER NOT NULL DEFAULT 15,
+        xp_max INTEGER NOT NULL DEFAULT 15,
+        cooldown INTEGER NOT NULL DEFAULT 60,
+        curve TEXT NOT NULL DEFAULT 'quadratic'
+    );
+    CREATE TABLE IF NOT EXISTS channel_multipliers (
+        guild_id INTEGER NOT NULL,
+        channel_id INTEGER NOT NULL,
+        multiplier REAL NOT NULL,
+        PRIMARY KEY (guild_id, channel_id)
+    );
+    ''',
+    # 5: activity rollups, bucketed by hours/days since the Unix epoch (UTC)
+    '''
+    CREATE TABLE IF NOT EXISTS activity_hourly (
+        guild_id INTEGER NOT NULL,
+        hour INTEGER NOT NULL,
+        channel_id INTEGER NOT NULL,
+        messages INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (guild_id, hour, channel_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_activity_hourly_hour ON activity_hourly (hour);
+    CREATE TABLE IF NOT EXISTS activity_daily (
+        guild_id INTEGER NOT NULL,
+        day INTEGER NOT NULL,
+        channel_id INTEGER NOT NULL,
+        messages INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (guild_id, day, channel_id)
+    );
+    CREATE TABLE IF NOT EXISTS activity_user_daily (
+        guild_id INTEGER NOT NULL,
+        day INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        messages INTEGER NOT NULL DEFAULT 0,
+        xp INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (guild_id, day, user_id)
+    );
+    ''',
+]
+
+def get_username(user):
+    """Name shown on the leaderboard (global name is unique, display name isn't)"""
+    return user.global_name or user.name
+
+def write_batch(conn, xp_rows, name_rows, activity, prune_before=None):
+    """Persist one flush worth of buffered data (runs on the database writer)"""
+    if xp_rows:
+        conn.executemany(UPSERT_XP_SQL, xp_rows)
+    if name_rows:
+        conn.executemany(UPSERT_NAME_SQL, name_rows)
+
+    hourly, daily, user_daily = activity
+    if hourly:
+        conn.executemany(UPSERT_ACTIVITY_HOURLY_SQL, [(*key, messages) for key, messages in hourly.items()])
+    if daily:
+        conn.executemany(UPSERT_ACTIVITY_DAILY_SQL, [(*key, messages) for key, messages in daily.items()])
+    if user_daily:
+        conn.executemany(UPSERT_ACTIVITY_USER_DAILY_SQL, [(*key, *counts) for key, counts in user_daily.items()])
+    if prune_before is not None:
+        conn.execute(PRUNE_ACTIVITY_HOURLY_SQL, (prune_before,))
+
+def sparkline(values):
+    """Render a list of counts as a one-line bar chart"""
+    bars = "▁▂▃▄▅▆▇█"
+    peak = max(values, default=0)
+    if not peak:
+        return bars[0] * len(values)
+    return "".join(bars[min(len(bars) - 1, value * len(bars) // (peak + 1))] for value in values)
+
+class XPBuffer:
+    """Write-behind buffer holding XP gains until the next batched flush
+
+    `totals` caches the full XP of users with buffered gains, so awarding XP
+    doesn't read the database per message. Entries are evicted once their
+    gains are flushed; every user with pending gains has a total.
+    """
+    def __init__(self):
+        # (guild_id, user_id) -> total XP, including gains not yet flushed
+        self.totals = {}
+        # (guild_id, user_id) -> [xp_gained, messages_gained, level, last_message]
+        self.pending = {}
+
+    def add(self, guild_id, user_id, xp, level, timestamp, messages=1):
+        """Record an XP gain; the caller keeps totals up to date"""
+        key = (guild_id, user_id)
+        entry = self.pending.get(key)
+        if entry:
+            entry[0] += xp
+            entry[1] += messages
+            entry[2] = level
+            entry[3] = timestamp
+        else:
+            self.pending[key] = [xp, messages, level, timestamp]
+
+    def take(self):
+        """Detach all pending gains so new messages can be buffered during a flush"""
+        pending, self.pending = self.pending, {}
+        return pending
+
+    def restore(self, pending):
+        """Put back gains from a failed flush, merging with anything buffered since"""
+        for key, (xp, messages, level, timestamp) in pending.items():
+            entry = self.pending.get(key)
+            if entry:
+                entry[0] += xp
+                entry[1] += messages
+            else:
+                self.pending[key] = [xp, messages, level, timestamp]
+
+    def evict_flushed(self, flushed):
+        """Drop totals of users whose gains were just written and who gained nothing since"""
+        for key in flushed:
+            if key not in self.pending:
+                self.totals.pop(key, None)
+
+    def pending_for(self, guild_id, user_id):
+        """(xp, messages) gained by a user since the last flush"""
+        entry = self.pending.get((guild_id, user_id))
+        return (entry[0], entry[1]) if entry else (0, 0)
+
+    def pending_users(self, guild_id):
+        return [user_id for g, user_id in self.pending if g == guild_id]
+
+    def rebuild_totals(self, guild_id, stored):
+        """Recompute a guild's totals after its rows changed underneath us
+
+        `stored` maps user_id -> XP now in the database for users that had
+        pending gains. Pending gains are deltas, so they stay valid and are
+        added on top; users without pending gains lose their cached total.
+        """
+        totals = {k: v for k, v in self.totals.items() if k[0] != guild_id}
+        for key, entry in self.pending.items():
+            if key[0] != guild_id:
+                continue
+            if key[1] in stored:
+                totals[key] = (stored[key[1]] or 0) + entry[0]
+            elif key in self.totals:
+                # Gained XP while the stored values were being read; already current
+                totals[key] = self.totals[key]
+        self.totals = totals
+
+    def forget_guild(self, guild_id):
+        """Drop cached and pending data for a guild"""
+        self.totals = {k: v for k, v in self.totals.items() if k[0] != guild_id}
+        self.pending = {k: v for k, v in self.pending.items() if k[0] != guild_id}
+
+    def __len__(self):
+        return len(self.pending)
+
+class ActivityBuffer:
+    """Hourly and daily activity counters waiting for the next flush
+
+    Every message bumps a few in-memory counters; flushes merge them into the
+    rollup tables, so /stats reads a handful of pre-aggregated rows no matter
+    how much history there is.
+    """
+    def __init__(self):
+        self.hourly = {}  # (guild_id, hour, channel_id) -> messages
+        self.daily = {}  # (guild_id, day, channel_id) -> messages
+        self.user_daily = {}  # (guild_id, day, user_id) -> [messages, xp]
+
+    def record(self, guild_id, channel_id, user_id, xp=0, messages=1, now=None):
+        now = time.time() if now is None else now
+        hour = int(now // 3600)
+        day = hour // 24
+        if messages:
+            key = (guild_id, hour, channel_id)
+            self.hourly[key] = self.hourly.get(key, 0) + messages
+            key = (guild_id, day, channel_id)
+            self.daily[key] = self.daily.get(key, 0) + messages
+        counts = self.user_daily.setdefault((guild_id, day, user_id), [0, 0])
+        counts[0] += messages
+        counts[1] += xp
+
+    def take(self):
+        """Detach the current counters, leaving the buffer empty"""
+        taken = (self.hourly, self.daily, self.user_daily)
+        self.hourly, self.daily, self.user_daily = {}, {}, {}
+        return taken
+
+    def restore(self, taken):
+        """Merge counters from a failed flush back in"""
+        hourly, daily, user_daily = taken
+        for key, messages in hourly.items():
+            self.hourly[key] = self.hourly.get(key, 0) + messages
+        for key, messages in daily.items():
+            self.daily[key] = self.daily.get(key, 0) + messages
+        for key, (messages, xp) in user_daily.items():
+            counts = self.user_daily.setdefault(key, [0, 0])
+            counts[0] += messages
+            counts[1] += xp
+
+    def pending_for(self, guild_id, first_hour, first_day):
+        """Unflushed counts for one guild as (hourly, daily, per channel, per member) dicts
+
+        Shaped like the /stats queries: hour -> messages, day -> messages,
+        channel_id -> messages and user_id -> [messages, xp].
+        """
+        hourly, daily, channels, members = {}, {}, {}, {}
+        for (g, hour, channel_id), messages in self.hourly.items():
+            if g == guild_id and hour >= first_hour:
+                hourly[hour] = hourly.get(hour, 0) + messages
+        for (g, day, channel_id), messages in self.daily.items():
+            if g == guild_id and day >= first_day:
+                daily[day] = daily.get(day, 0) + messages
+                channels[channel_id] = channels.get(channel_id, 0) + messages
+        for (g, day, user_id), (messages, xp) in self.user_daily.items():
+            if g == guild_id and day >= first_day:
+                counts = members.setdefault(user_id, [0, 0])
+                counts[0] += messages
+                counts[1] += xp
+        return hourly, daily, channels, members
+
+    def __bool__(self):
+        return bool(self.hourly or self.user_daily)
+
+class VoiceSessions:
+    """Open voice intervals, credited when they close or at a checkpoint
+
+    Intervals are opened and closed from voice state transitions, so nothing
+    scans voice channels on a timer. Only whole minutes are credited; the
+    remainder carries over to the next checkpoint.
+    """
+    def __init__(self):
+        self.open = {}  # (guild_id, user_id) -> [channel_id, credited_until]
+
+    def start(self, guild_id, user_id, channel_id, now=None):
+        now = time.monotonic() if now is None else now
+        self.open.setdefault((guild_id, user_id), [channel_id, now])
+
+    def stop(self, guild_id, user_id, now=None):
+        """Close an interval; returns (channel_id, minutes) or None"""
+        now = time.monotonic() if now is None else now
+        session = self.open.pop((guild_id, user_id), None)
+        if session is None:
+            return None
+        channel_id, credited_until = session
+        return channel_id, int((now - credited_until) // 60)
+
+    def checkpoint(self, now=None):
+        """Credit whole minutes of every open interval; yields (guild_id, user_id, channel_id, minutes)"""
+        now = time.monotonic() if now is None else now
+        for (guild_id, user_id), session in self.open.items():
+            channel_id, credited_until = session
+            minutes = int((now - credited_until) // 60)
+            if minutes > 0:
+                session[1] = credited_until + minutes * 60
+                yield guild_id, user_id, channel_id, minutes
+
+    def __contains__(self, key):
+        return key in self.open
+
+def is_voice_eligible(member, state):
+    """Whether a voice state should be earning XP"""
+    if member.bot or state is None or state.channel is None:
+        return False
+    if state.channel == member.guild.afk_channel:
+        return False
+    return not (state.self_mute or state.self_deaf or state.mute or state.deaf)
+
+class LevelUpAnnouncer:
+    """Coalesces level-ups per channel into one embed every ANNOUNCE_WINDOW seconds"""
+    def __init__(self):
+        self.pending = {}  # channel_id -> {user_id: (user, level, queued_at)}
+        self.tasks = {}  # channel_id -> task sending that channel's batches
+        self.can_send = {}  # channel_id -> whether we may post embeds there
+
+    def add(self, channel, user, level):
+        """Queue a level-up; returns immediately"""
+        if not self.check_permissions(channel):
+            return
+
+        batch = self.pending.setdefault(channel.id, {})
+        previous = batch.get(user.id)
+        if previous:
+            level = max(level, previous[1])
+        batch[user.id] = (user, level, time.monotonic())
+
+        if channel.id not in self.tasks:
+            self.tasks[channel.id] = asyncio.create_task(self.run(channel))
+
+    def check_permissions(self, channel):
+        allowed = self.can_send.get(channel.id)
+        if allowed is None:
+            permissions = channel.permissions_for(channel.guild.me)
+            can_post = permissions.send_messages_in_threads if isinstance(channel, discord.Thread) else permissions.send_messages
+            allowed = self.can_send[channel.id] = can_post and permissions.embed_links
+        return allowed
+
+    def forget_permissions(self, channel_id=None):
+        """Recompute permissions on next use (all channels if no id is given)"""
+        if channel_id is None:
+            self.can_send.clear()
+        else:
+            self.can_send.pop(channel_id, None)
+
+    async def run(self, channel):
+        try:
+            while self.pending.get(channel.id):
+                await asyncio.sleep(ANNOUNCE_WINDOW)
+                batch = self.pending.pop(channel.id, None)
+                if batch:
+                    await self.send(channel, batch)
+        finally:
+            self.tasks.pop(channel.id, None)
+
+    async def send(self, channel, batch):
+        # Anything that waited too long (e.g. behind rate limits) is no longer news
+        cutoff = time.monotonic() - ANNOUNCE_MAX_AGE
+        level_ups = sorted(
+            ((user, level) for user, level, queued_at in batch.values() if queued_at >= cutoff),
+            key=lambda item: item[1], reverse=True
+        )
+        if not level_ups:
+            return
+
+        if len(level_ups) == 1:
+            user, level = level_ups[0]
+            embed = discord.Embed(
+                title="🎉 Level Up!",
+                description=f"**{user.display_name}** reached level **{level}**!",
+                color=0x00ff00
+            )
+            embed.set_thumbnail(url=user.display_avatar.url)
+        else:
+            lines = [f"**{user.display_name}** reached level **{level}**!" for user, level in level_ups[:ANNOUNCE_MAX_LINES]]
+            if len(level_ups) > ANNOUNCE_MAX_LINES:
+                lines.append(f"...and {len(level_ups) - ANNOUNCE_MAX_LINES} more!")
+            embed = discord.Embed(title="🎉 Level Ups!", description="\n".join(lines), color=0x00ff00)
+
+        try:
+            await channel.send(embed=embed, delete_after=10)
+        except discord.Forbidden:
+            # Permissions changed without an event reaching us; stop trying here
+            self.can_send[channel.id] = False
+        except Exception as e:
+            print(f"Error announcing level ups: {e}")
+
+    def cancel(self):
+        for task in self.tasks.values():
+            task.cancel()
+        self.tasks.clear()
+        self.pending.clear()
+
+class LeaderboardView(discord.ui.View):
+    """Previous/next buttons for paging through the leaderboard"""
+    def __init__(self, cog, guild, viewer, page, total_pages):
+        super().__init__(timeout=120)
+        self.cog = cog
+        self.guild = guild
+        self.viewer = viewer
+        self.page = page
+        self.total_pages = total_pages
+        self.message = None
+        self.update_buttons()
+
+    def update_buttons(self):
+        self.previous_page.disabled = self.page <= 0
+        self.next_page.disabled = self.page >= self.total_pages - 1
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        if interaction.user.id != self.viewer.id:
+            await interaction.response.send_message("Run `/leaderboard` yourself to browse it!", ephemeral=True)
+            return False
+        return True
+
+    async def show_page(self, interaction, page):
+        embed, self.total_pages = await self.cog.build_leaderboard_embed(
+            self.guild, self.viewer, page, before_fetch=interaction.response.defer
         )
-    ''')
-    
-    conn.commit()
-    conn.close()
+        self.page = min(page, self.total_pages - 1)
+        self.update_buttons()
+        if interaction.response.is_done():
+            await interaction.edit_original_response(embed=embed, view=self)
+        else:
+            await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label="Previous", emoji="◀️", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_page(interaction, self.page - 1)
+
+    @discord.ui.button(label="Next", emoji="▶️", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_page(interaction, self.page + 1)
+
+    async def on_timeout(self):
+        if self.message:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
 
 class LevelingCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.cooldown = commands.CooldownMapping.from_cooldown(1, 60, commands.BucketType.user)  # 1 XP per minute
-        init_db()
+        self.cooldowns = CooldownStore()
+        self.configs = {}  # guild_id -> LevelingConfig, for guilds with custom rules
+        self.default_config = LevelingConfig()
+        self.xp_buffer = XPBuffer()
+        self.flush_lock = asyncio.Lock()
+        self.db = get_database(DB_PATH, MIGRATIONS)
+        self.rank_indexes = RankIndexCache()
+        self.pending_names = {}  # user_id -> name, written with the next flush
+        self.announcer = LevelUpAnnouncer()
+        self.activity = ActivityBuffer()
+        self.voice_sessions = VoiceSessions()
+        self.rank_cards = RankCardRenderer()
+        self.last_prune_hour = None
+
+    async def cog_load(self):
+        """Bring the schema up to date before handling any events"""
+        await self.db.open()
+        await self.load_configs()
+        self.flush_xp_task.start()
+        self.voice_checkpoint_task.start()
+
+    async def cog_unload(self):
+        self.flush_xp_task.cancel()
+        self.voice_checkpoint_task.cancel()
+        self.announcer.cancel()
+        self.rank_cards.shutdown()
+        # Credit open voice time, then persist whatever is still buffered
+        await self.credit_voice_checkpoint()
+        await self.flush_xp()
+        await self.db.close()
+
+    async def load_configs(self):
+        """Load every guild's leveling rules into memory"""
+        configs = {}
+        for guild_id, xp_min, xp_max, cooldown, curve in await self.db.fetchall(SELECT_GUILD_SETTINGS_SQL):
+            configs[guild_id] = LevelingConfig(xp_min, xp_max, cooldown, curve if curve in CURVES else DEFAULT_CURVE)
+        for guild_id, channel_id, multiplier in await self.db.fetchall(SELECT_CHANNEL_MULTIPLIERS_SQL):
+            configs.setdefault(guild_id, LevelingConfig()).channel_multipliers[channel_id] = multiplier
+        self.configs = configs
 
-    def get_connection(self):
-        """Get database connection"""
-        return sqlite3.connect(DB_PATH)
+    def get_config(self, guild_id):
+        return self.configs.get(guild_id, self.default_config)
 
-    def calculate_level(self, xp):
-        """Calculate level based on XP using a progressive formula"""
-        # Fixed formula: level = sqrt(xp/100) + 1
-        return max(1, int(((xp / 100) ** 0.5) + 1))
+    def calculate_level(self, guild_id, xp):
+        """Calculate level from total XP using the guild's curve"""
+        return self.get_config(guild_id).curve.level_for(xp)
 
-    def calculate_xp_for_level(self, level):
-        """Calculate XP required for a specific level"""
-        # Fixed formula: XP = (level - 1)^2 * 100
-        return ((level - 1) ** 2) * 100
+    def calculate_xp_for_level(self, guild_id, level):
+        """Calculate total XP required for a level using the guild's curve"""
+        return self.get_config(guild_id).curve.xp_for_level(level)
 
     @commands.Cog.listener()
     async def on_message(self, message):
@@ -61,105 +628,332 @@ class LevelingCommands(commands.Cog):
         if message.author.bot or not message.guild:
             return
 
+        # Activity counts every message, whether or not it earns XP
+        self.activity.record(message.guild.id, message.channel.id, message.author.id)
+
+        config = self.get_config(message.guild.id)
+        multiplier = config.multiplier_for(message.channel.id)
+        if multiplier <= 0:
+            return
+
         # Check cooldown
-        bucket = self.cooldown.get_bucket(message)
-        retry_after = bucket.update_rate_limit()
-        if retry_after:
+        if not self.cooldowns.try_acquire((message.guild.id, message.author.id), config.cooldown):
             return
 
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
+            gained_xp = round(random.randint(config.xp_min, config.xp_max) * multiplier)
+            if gained_xp <= 0:
+                return
+            current_level, new_level = await self.award_xp(message.guild.id, message.author, message.channel.id, gained_xp)
 
-            # Get current user data
-            cursor.execute(
-                'SELECT xp, level, messages FROM user_levels WHERE user_id = ? AND guild_id = ?',
-                (message.author.id, message.guild.id)
-            )
-            result = cursor.fetchone()
+            # Check for level up
+            if new_level > current_level:
+                await self.handle_level_up(message, message.author, new_level)
 
-            if result:
-                current_xp, current_level, messages = result
-                new_xp = current_xp + 15  # Give 15 XP per message
-                new_messages = messages + 1
+        except Exception as e:
+            print(f"Error in leveling system: {e}")
+
+    async def award_xp(self, guild_id, user, channel_id, gained_xp, messages=1):
+        """Add XP to the buffer and caches; returns (old_level, new_level)"""
+        config = self.get_config(guild_id)
+        key = (guild_id, user.id)
+        current_xp = self.xp_buffer.totals.get(key)
+        previous_xp = current_xp  # None for users without a row yet
+        if current_xp is None:
+            # Not cached: the first gain since startup or since the last flush
+            previous_xp = await self.load_xp(guild_id, user.id)
+            if previous_xp is None:
+                # New user; the member listeners keep the cached name fresh after this
+                self.remember_name(user)
+            # Another event may have populated the cache while we were waiting
+            if key in self.xp_buffer.totals:
+                previous_xp = self.xp_buffer.totals[key]
+            current_xp = previous_xp or 0
+
+        current_level = config.curve.level_for(current_xp)
+        new_xp = current_xp + gained_xp
+        new_level = config.curve.level_for(new_xp)
+
+        self.xp_buffer.totals[key] = new_xp
+        self.rank_indexes.update(guild_id, previous_xp, new_xp)
+        self.xp_buffer.add(guild_id, user.id, gained_xp, new_level, datetime.datetime.now(), messages=messages)
+        self.activity.record(guild_id, channel_id, user.id, xp=gained_xp, messages=0)
+
+        if len(self.xp_buffer) >= MAX_PENDING_USERS and not self.flush_lock.locked():
+            asyncio.create_task(self.flush_xp())
+
+        return current_level, new_level
+
+    async def credit_voice(self, member, channel_id, minutes):
+        """Turn credited voice minutes into XP"""
+        if minutes <= 0:
+            return
+        guild_id = member.guild.id
+        multiplier = self.get_config(guild_id).multiplier_for(channel_id)
+        gained_xp = round(minutes * VOICE_XP_PER_MINUTE * multiplier)
+        if gained_xp <= 0:
+            return
+
+        current_level, new_level = await self.award_xp(guild_id, member, channel_id, gained_xp, messages=0)
+        if new_level > current_level:
+            channel = member.guild.get_channel(channel_id)
+            # Voice channels have their own text chat
+            if isinstance(channel, discord.abc.Messageable):
+                self.announcer.add(channel, member, new_level)
+
+    async def credit_voice_checkpoint(self):
+        for guild_id, user_id, channel_id, minutes in list(self.voice_sessions.checkpoint()):
+            # Members in voice are cached through the voice states intent
+            guild = self.bot.get_guild(guild_id)
+            member = guild.get_member(user_id) if guild else None
+            if member is None:
+                continue
+            try:
+                await self.credit_voice(member, channel_id, minutes)
+            except Exception as e:
+                print(f"Error crediting voice XP: {e}")
+
+    @tasks.loop(minutes=VOICE_CHECKPOINT_MINUTES)
+    async def voice_checkpoint_task(self):
+        """Credit long-running voice sessions so a restart loses little time"""
+        await self.credit_voice_checkpoint()
+
+    @voice_checkpoint_task.before_loop
+    async def before_voice_checkpoint(self):
+        await self.bot.wait_until_ready()
+        # Pick up members who were already in voice when we started
+        for guild in self.bot.guilds:
+            for channel in guild.voice_channels + guild.stage_channels:
+                for member in channel.members:
+                    if is_voice_eligible(member, member.voice):
+                        self.voice_sessions.start(guild.id, member.id, channel.id)
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member, before, after):
+        was_eligible = is_voice_eligible(member, before)
+        is_eligible = is_voice_eligible(member, after)
+        moved = before.channel != after.channel
+        if was_eligible == is_eligible and not moved:
+            return
+
+        try:
+            if (member.guild.id, member.id) in self.voice_sessions:
+                closed = self.voice_sessions.stop(member.guild.id, member.id)
+                if closed:
+                    # After a leave the member is gone from the voice-only cache, so use the event's member
+                    await self.credit_voice(member, *closed)
+            if is_eligible:
+                self.voice_sessions.start(member.guild.id, member.id, after.channel.id)
+        except Exception as e:
+            print(f"Error tracking voice XP: {e}")
+
+    async def load_stats(self, guild_id, user_id):
+        """A user's (xp, messages) including buffered gains, or None if they have none
+
+        Waits for a flush in progress instead of forcing one, so the stored
+        row and the buffer never count the same gains twice.
+        """
+        async with self.flush_lock:
+            row = await self.db.fetchone(SELECT_STATS_SQL, (user_id, guild_id))
+            pending_xp, pending_messages = self.xp_buffer.pending_for(guild_id, user_id)
+        if row is None and not (pending_xp or pending_messages):
+            return None
+        xp, _, messages = row or (0, 0, 0)
+        return xp + pending_xp, messages + pending_messages
+
+    async def refresh_totals(self, guild_id):
+        """Rebuild cached totals of users with buffered gains from their stored rows
+
+        Call with flush_lock held, so no flush is writing pending gains meanwhile.
+        """
+        user_ids = self.xp_buffer.pending_users(guild_id)
+
+        def _load(conn):
+            stored = {}
+            for user_id in user_ids:
+                row = conn.execute(SELECT_XP_SQL, (user_id, guild_id)).fetchone()
+                stored[user_id] = row[0] if row else None
+            return stored
+
+        self.xp_buffer.rebuild_totals(guild_id, await self.db.read(_load))
+
+    async def load_xp(self, guild_id, user_id):
+        """Read a user's stored XP, or None if they have no row yet"""
+        row = await self.db.fetchone(SELECT_XP_SQL, (user_id, guild_id))
+        return row[0] if row else None
+
+    async def get_rank_index(self, guild_id):
+        """Get the guild's in-memory rank index, loading it on first use"""
+        index = self.rank_indexes.get(guild_id)
+        if index is None:
+            # A flush evicts totals once written; don't let one land between the read and the overlay
+            async with self.flush_lock:
+                rows = await self.db.fetchall(SELECT_GUILD_XP_SQL, (guild_id,))
+            index = self.rank_indexes.get(guild_id)
+            if index is None:
+                xp_by_user = dict(rows)
+                # Buffered totals are newer than what's on disk
+                for (g, user_id), xp in self.xp_buffer.totals.items():
+                    if g == guild_id:
+                        xp_by_user[user_id] = xp
+                index = RankIndex(xp_by_user.values())
+                self.rank_indexes.put(guild_id, index)
+        return index
+
+    async def get_rank(self, guild_id, xp):
+        """Return (rank, total ranked users) for a user with this much XP"""
+        index = await self.get_rank_index(guild_id)
+        return index.rank(xp), len(index)
+
+    async def flush_xp(self):
+        """Write all buffered XP gains, name updates and activity in a single transaction"""
+        async with self.flush_lock:
+            if not self.xp_buffer and not self.pending_names and not self.activity:
+                return
+            pending = self.xp_buffer.take()
+            names, self.pending_names = self.pending_names, {}
+            activity = self.activity.take()
+
+            # Prune old hourly rollups once per hour, as part of a regular flush
+            current_hour = int(time.time() // 3600)
+            prune_before = None
+            if current_hour != self.last_prune_hour:
+                prune_before = current_hour - HOURLY_RETENTION_DAYS * 24
+
+            xp_rows = [
+                (user_id, guild_id, xp, level, messages, timestamp)
+                for (guild_id, user_id), (xp, messages, level, timestamp) in pending.items()
+            ]
+            now = datetime.datetime.now()
+            name_rows = [(user_id, name, now) for user_id, name in names.items()]
+
+            try:
+                await self.db.write(write_batch, xp_rows, name_rows, activity, prune_before)
+                if prune_before is not None:
+                    self.last_prune_hour = current_hour
+                # The database is now current for these users, so their totals needn't stay in memory
+                self.xp_buffer.evict_flushed(pending)
+            except Exception as e:
+                print(f"Error flushing XP buffer: {e}")
+                self.xp_buffer.restore(pending)
+                self.pending_names = {**names, **self.pending_names}
+                self.activity.restore(activity)
+
+    def remember_name(self, user):
+        """Queue a user's current name for the name cache"""
+        self.pending_names[user.id] = get_username(user)
+
+    async def resolve_names(self, guild, user_ids, before_fetch=None):
+        """Map user ids to (name, left_server) for leaderboard rows
+
+        Members come from the guild cache, departed users from the name cache
+        table. Only users unknown to both are fetched over REST, concurrently
+        and bounded by NAME_FETCH_TIMEOUT. `before_fetch` is awaited first so
+        the caller can defer its interaction.
+        """
+        names = {}
+        missing = []
+        for user_id in user_ids:
+            member = guild.get_member(user_id)
+            if member:
+                names[user_id] = (get_username(member), False)
             else:
-                # New user
-                new_xp = 15
-                new_messages = 1
-                current_level = 1
+                missing.append(user_id)
 
-            # Calculate new level
-            new_level = self.calculate_level(new_xp)
+        if missing:
+            rows = await self.db.fetchall(
+                f'SELECT user_id, name FROM user_names WHERE user_id IN ({",".join("?" * len(missing))})',
+                missing
+            )
+            for user_id, name in rows:
+                names[user_id] = (self.pending_names.get(user_id, name), True)
+            missing = [user_id for user_id in missing if user_id not in names]
 
-            # Update or insert user data
-            if result:
-                cursor.execute(
-                    '''UPDATE user_levels 
-                    SET xp = ?, level = ?, messages = ?, last_message = ? 
-                    WHERE user_id = ? AND guild_id = ?''',
-                    (new_xp, new_level, new_messages, datetime.datetime.now(), message.author.id, message.guild.id)
-                )
+        # Users seen since the last flush may not be in the table yet
+        still_missing = []
+        for user_id in missing:
+            user = self.bot.get_user(user_id)
+            if user_id in self.pending_names:
+                names[user_id] = (self.pending_names[user_id], True)
+            elif user:
+                names[user_id] = (get_username(user), True)
             else:
-                cursor.execute(
-                    '''INSERT INTO user_levels 
-                    (user_id, guild_id, xp, level, messages, last_message) 
-                    VALUES (?, ?, ?, ?, ?, ?)''',
-                    (message.author.id, message.guild.id, new_xp, new_level, new_messages, datetime.datetime.now())
-                )
+                still_missing.append(user_id)
+        missing = still_missing
 
-            conn.commit()
-            conn.close()
+        if missing:
+            if before_fetch:
+                await before_fetch()
+            tasks_by_id = {user_id: asyncio.create_task(self.bot.fetch_user(user_id)) for user_id in missing}
+            done, not_done = await asyncio.wait(tasks_by_id.values(), timeout=NAME_FETCH_TIMEOUT)
+            for task in not_done:
+                task.cancel()
+            for user_id, task in tasks_by_id.items():
+                if task in done and not task.exception():
+                    user = task.result()
+                    names[user_id] = (get_username(user), True)
+                    self.remember_name(user)
 
-            # Check for level up
-            if new_level > current_level:
-                await self.handle_level_up(message, message.author, new_level)
+        return names
 
-        except Exception as e:
-            print(f"Error in leveling system: {e}")
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        self.remember_name(member)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before, after):
+        if get_username(before) != get_username(after):
+            self.remember_name(after)
+        if after.id == self.bot.user.id and before.roles != after.roles:
+            self.announcer.forget_permissions()
+
+    @commands.Cog.listener()
+    async def on_user_update(self, before, after):
+        if get_username(before) != get_username(after):
+            self.remember_name(after)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member):
+        # Keep their last known name for the leaderboard
+        self.remember_name(member)
+
+    @tasks.loop(seconds=FLUSH_INTERVAL)
+    async def flush_xp_task(self):
+        """Background task that periodically persists buffered XP"""
+        await self.flush_xp()
 
     async def handle_level_up(self, message, user, new_level):
         """Handle level up notifications"""
-        embed = discord.Embed(
-            title="🎉 Level Up!",
-            description=f"**{user.display_name}** reached level **{new_level}**!",
-            color=0x00ff00
-        )
-        embed.set_thumbnail(url=user.display_avatar.url)
-        
-        try:
-            await message.channel.send(embed=embed, delete_after=10)
-        except discord.Forbidden:
-            # Can't send message in this channel, ignore
-            pass
+        self.announcer.add(message.channel, user, new_level)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before, after):
+        self.announcer.forget_permissions(after.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        self.announcer.forget_permissions(channel.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, before, after):
+        if before.permissions != after.permissions:
+            self.announcer.forget_permissions()
 
     @app_commands.command(name='level', description='Check your level and XP')
     async def slash_level(self, interaction: discord.Interaction, user: Optional[discord.User] = None):
         """Check your level or another user's level"""
         try:
             target_user = user or interaction.user
-            
-            conn = self.get_connection()
-            cursor = conn.cursor()
-
-            cursor.execute(
-                'SELECT xp, level, messages FROM user_levels WHERE user_id = ? AND guild_id = ?',
-                (target_user.id, interaction.guild.id)
-            )
-            result = cursor.fetchone()
+            # Nothing below may keep Discord waiting: unless the answer is
+            # already in memory, defer before touching the lock or the database
+            if not self.can_answer_now(interaction.guild.id, target_user):
+                await interaction.response.defer()
+            result = await self.load_stats(interaction.guild.id, target_user.id)
 
             if result:
-                xp, level, messages = result
-                # Fixed XP calculations
-                current_level_xp = self.calculate_xp_for_level(level)
-                next_level_xp = self.calculate_xp_for_level(level + 1)
-                xp_progress = xp - current_level_xp
-                xp_needed = next_level_xp - current_level_xp
-                
-                # Ensure progress is never negative
-                if xp_progress < 0:
-                    xp_progress = 0
-                
-                progress_percentage = (xp_progress / xp_needed) * 100 if xp_needed > 0 else 100
+                xp, messages = result
+                level, xp_progress, xp_needed, progress_percentage = self.level_progress(interaction.guild.id, xp)
+                rank, ranked_users = await self.get_rank(interaction.guild.id, xp)
 
                 # Create progress bar
                 progress_bar_length = 10
@@ -173,6 +967,7 @@ class LevelingCommands(commands.Cog):
                 embed.add_field(name="Level", value=f"**{level}**", inline=True)
                 embed.add_field(name="Total XP", value=f"**{xp}**", inline=True)
                 embed.add_field(name="Messages", value=f"**{messages}**", inline=True)
+                embed.add_field(name="Rank", value=f"**#{rank}** of {ranked_users}", inline=True)
                 embed.add_field(
                     name="Progress to Level {0}".format(level + 1), 
                     value=f"`{progress_bar}` {progress_percentage:.1f}%", 
@@ -185,6 +980,23 @@ class LevelingCommands(commands.Cog):
                 )
                 embed.set_thumbnail(url=target_user.display_avatar.url)
 
+                card = await self.get_rank_card(target_user, level, progress_percentage)
+                if card:
+                    # Level and progress are on the card; keep the exact numbers and the rank in the embed
+                    embed.clear_fields()
+                    embed.add_field(name="Total XP", value=f"**{xp}**", inline=True)
+                    embed.add_field(name="Messages", value=f"**{messages}**", inline=True)
+                    embed.add_field(name="Rank", value=f"**#{rank}** of {ranked_users}", inline=True)
+                    embed.add_field(name="XP Progress", value=f"**{xp_progress}** / **{xp_needed}** XP", inline=False)
+                    embed.set_thumbnail(url=None)
+                    embed.set_image(url="attachment://rank_card.png")
+                    file = discord.File(io.BytesIO(card), filename="rank_card.png")
+                    if interaction.response.is_done():
+                        await interaction.followup.send(embed=embed, file=file)
+                    else:
+                        await interaction.response.send_message(embed=embed, file=file)
+                    return
+
             else:
                 embed = discord.Embed(
                     title="📊 Level Info",
@@ -192,103 +1004,441 @@ class LevelingCommands(commands.Cog):
                     color=0xffff00
                 )
 
-            conn.close()
-            await interaction.response.send_message(embed=embed)
+            if interaction.response.is_done():
+                await interaction.followup.send(embed=embed)
+            else:
+                await interaction.response.send_message(embed=embed)
 
         except Exception as e:
-            await interaction.response.send_message("❌ An error occurred while fetching level information.", ephemeral=True)
+            if interaction.response.is_done():
+                await interaction.followup.send("❌ An error occurred while fetching level information.", ephemeral=True)
+            else:
+                await interaction.response.send_message("❌ An error occurred while fetching level information.", ephemeral=True)
             print(f"Error in level command: {e}")
 
-    @app_commands.command(name='leaderboard', description='Show the server leaderboard')
-    async def slash_leaderboard(self, interaction: discord.Interaction):
-        """Show the top 10 users by level"""
+    def level_progress(self, guild_id, xp):
+        """Return (level, xp into the level, xp the level needs, percent done)"""
+        # The stored level can lag behind a curve change, so derive it from XP
+        level = self.calculate_level(guild_id, xp)
+        current_level_xp = self.calculate_xp_for_level(guild_id, level)
+        next_level_xp = self.calculate_xp_for_level(guild_id, level + 1)
+        # Ensure progress is never negative
+        xp_progress = max(0, xp - current_level_xp)
+        xp_needed = next_level_xp - current_level_xp
+        progress_percentage = (xp_progress / xp_needed) * 100 if xp_needed > 0 else 100
+        return level, xp_progress, xp_needed, progress_percentage
+
+    def can_answer_now(self, guild_id, user):
+        """Whether /level can reply without deferring
+
+        True only when no flush holds the lock, the guild's rank index is
+        loaded and the user's card (if cards are on) is in the memory cache.
+        """
+        if self.flush_lock.locked() or self.rank_indexes.get(guild_id) is None:
+            return False
+        if not self.rank_cards.available():
+            return True
+        xp = self.xp_buffer.totals.get((guild_id, user.id))
+        if xp is None:
+            return False
+        level, _, _, progress = self.level_progress(guild_id, xp)
+        return self.rank_cards.cached(user, user.display_name, level, progress) is not None
+
+    async def get_rank_card(self, user, level, progress):
+        """Render (or fetch from cache) a rank card; None if cards are unavailable"""
+        if not self.rank_cards.available():
+            return None
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-
-            cursor.execute(
-                '''SELECT user_id, level, xp, messages 
-                FROM user_levels 
-                WHERE guild_id = ? 
-                ORDER BY xp DESC 
-                LIMIT 10''',
-                (interaction.guild.id,)
-            )
-            results = cursor.fetchall()
+            return await self.rank_cards.render(user, user.display_name, level, progress)
+        except Exception as e:
+            print(f"Error rendering rank card: {e}")
+            return None
 
-            embed = discord.Embed(
-                title="🏆 Server Leaderboard",
-                description="Top 10 users by XP",
-                color=0xffd700
+    async def build_leaderboard_embed(self, guild, viewer, page, before_fetch=None):
+        """Render one leaderboard page; returns (embed, total_pages)
+
+        Buffered XP is overlaid on the stored rows instead of flushing first,
+        so for up to FLUSH_INTERVAL seconds a user who just gained XP can sit
+        on the page they were on before.
+        """
+        index = await self.get_rank_index(guild.id)
+        total_pages = max(1, math.ceil(len(index) / LEADERBOARD_PAGE_SIZE))
+        page = max(0, min(page, total_pages - 1))
+        offset = page * LEADERBOARD_PAGE_SIZE
+
+        async with self.flush_lock:
+            rows = await self.db.fetchall(SELECT_PAGE_SQL, (guild.id, LEADERBOARD_PAGE_SIZE, offset))
+            totals = self.xp_buffer.totals
+            results = [(user_id, level, totals.get((guild.id, user_id), xp), messages) for user_id, level, xp, messages in rows]
+        results.sort(key=lambda row: (-row[2], row[0]))
+
+        embed = discord.Embed(
+            title="🏆 Server Leaderboard",
+            description="Top users by XP",
+            color=0xffd700
+        )
+
+        if results:
+            names = await self.resolve_names(guild, [row[0] for row in results], before_fetch)
+            leaderboard_text = ""
+            for i, (user_id, level, xp, messages) in enumerate(results, offset + 1):
+                level = self.calculate_level(guild.id, xp)
+                if user_id in names:
+                    username, left_server = names[user_id]
+                    display_text = f"**{username}** (Left Server)" if left_server else f"**{username}**"
+                else:
+                    display_text = f"Unknown User ({user_id})"
+
+                medal = ""
+                if i == 1:
+                    medal = "🥇"
+                elif i == 2:
+                    medal = "🥈"
+                elif i == 3:
+                    medal = "🥉"
+                else:
+                    medal = f"`{i}.`"
+
+                leaderboard_text += f"{medal} {display_text} - Level {level} | {xp} XP\n"
+
+            embed.description = leaderboard_text
+        else:
+            embed.description = "No users have leveled up yet!"
+
+        footer = f"Page {page + 1}/{total_pages}"
+        viewer_xp = self.xp_buffer.totals.get((guild.id, viewer.id))
+        if viewer_xp is None:
+            viewer_xp = await self.load_xp(guild.id, viewer.id)
+        if viewer_xp is not None:
+            footer += f" • Your rank: #{index.rank(viewer_xp)} of {len(index)}"
+        embed.set_footer(text=footer)
+
+        return embed, total_pages
+
+    @app_commands.command(name='leaderboard', description='Show the server leaderboard')
+    @app_commands.describe(page='Page number to start on')
+    async def slash_leaderboard(self, interaction: discord.Interaction, page: Optional[int] = 1):
+        """Show the server leaderboard, 10 users per page"""
+        try:
+            embed, total_pages = await self.build_leaderboard_embed(
+                interaction.guild, interaction.user, (page or 1) - 1,
+                before_fetch=interaction.response.defer
             )
 
-            if results:
-                leaderboard_text = ""
-                for i, (user_id, level, xp, messages) in enumerate(results, 1):
-                    # Try to get the member from the guild
-                    member = interaction.guild.get_member(user_id)
-                    if member:
-                        # Use global name (unique) instead of display name
-                        username = member.global_name or member.name
-                        display_text = f"**{username}**"
-                    else:
-                        # If member not found, try to fetch user info
-                        try:
-                            user = await self.bot.fetch_user(user_id)
-                            username = user.global_name or user.name
-                            display_text = f"**{username}** (Left Server)"
-                        except:
-                            display_text = f"Unknown User ({user_id})"
-                    
-                    medal = ""
-                    if i == 1:
-                        medal = "🥇"
-                    elif i == 2:
-                        medal = "🥈"
-                    elif i == 3:
-                        medal = "🥉"
-                    else:
-                        medal = f"`{i}.`"
+            view = None
+            if total_pages > 1:
+                start_page = max(0, min((page or 1) - 1, total_pages - 1))
+                view = LeaderboardView(self, interaction.guild, interaction.user, start_page, total_pages)
 
-                    leaderboard_text += f"{medal} {display_text} - Level {level} | {xp} XP\n"
+            if interaction.response.is_done():
+                message = await interaction.followup.send(embed=embed, view=view or discord.utils.MISSING, wait=True)
+            else:
+                await interaction.response.send_message(embed=embed, view=view or discord.utils.MISSING)
+                message = await interaction.original_response() if view else None
+            if view:
+                view.message = message
 
-                embed.description = leaderboard_text
+        except Exception as e:
+            if interaction.response.is_done():
+                await interaction.followup.send("❌ An error occurred while fetching the leaderboard.", ephemeral=True)
             else:
-                embed.description = "No users have leveled up yet!"
+                await interaction.response.send_message("❌ An error occurred while fetching the leaderboard.", ephemeral=True)
+            print(f"Error in leaderboard command: {e}")
+
+    @app_commands.command(name='stats', description='Show server activity statistics')
+    @app_commands.describe(days='How many days to look back (1-30)')
+    async def slash_stats(self, interaction: discord.Interaction, days: app_commands.Range[int, 1, 30] = 7):
+        """Show activity curves and top channels/members from the rollup tables"""
+        try:
+            await interaction.response.defer()
+
+            guild_id = interaction.guild.id
+            current_hour = int(time.time() // 3600)
+            today = current_hour // 24
+            first_hour = current_hour - 23
+            first_day = today - days + 1
+
+            # Overlay unflushed counts on the rollups instead of forcing a flush;
+            # the lock keeps a flush from landing between the two reads
+            async with self.flush_lock:
+                pending_hourly, pending_daily, pending_channels, pending_members = \
+                    self.activity.pending_for(guild_id, first_hour, first_day)
+                hourly = dict(await self.db.fetchall(SELECT_HOURLY_CURVE_SQL, (guild_id, first_hour)))
+                daily = dict(await self.db.fetchall(SELECT_DAILY_CURVE_SQL, (guild_id, first_day)))
+                # Extra rows leave room for entries that buffered counts push into the top
+                top_channels = await self.db.fetchall(
+                    SELECT_TOP_CHANNELS_SQL, (guild_id, first_day, STATS_TOP_COUNT + len(pending_channels))
+                )
+                top_members = await self.db.fetchall(
+                    SELECT_TOP_MEMBERS_SQL, (guild_id, first_day, STATS_TOP_COUNT + len(pending_members))
+                )
+
+            for hour, messages in pending_hourly.items():
+                hourly[hour] = hourly.get(hour, 0) + messages
+            for day, messages in pending_daily.items():
+                daily[day] = daily.get(day, 0) + messages
+            channel_totals = dict(top_channels)
+            for channel_id, messages in pending_channels.items():
+                channel_totals[channel_id] = channel_totals.get(channel_id, 0) + messages
+            top_channels = sorted(channel_totals.items(), key=lambda item: -item[1])[:STATS_TOP_COUNT]
+            member_totals = {user_id: [total, xp] for user_id, total, xp in top_members}
+            for user_id, (messages, xp) in pending_members.items():
+                counts = member_totals.setdefault(user_id, [0, 0])
+                counts[0] += messages
+                counts[1] += xp
+            top_members = sorted(
+                ((user_id, total, xp) for user_id, (total, xp) in member_totals.items()),
+                key=lambda row: -row[1]
+            )[:STATS_TOP_COUNT]
+
+            hourly_values = [hourly.get(hour, 0) for hour in range(first_hour, current_hour + 1)]
+            daily_values = [daily.get(day, 0) for day in range(first_day, today + 1)]
 
-            conn.close()
-            await interaction.response.send_message(embed=embed)
+            embed = discord.Embed(title="📈 Server Activity", color=0x00bfff)
+            embed.add_field(name="Messages (24h)", value=f"**{sum(hourly_values)}**", inline=True)
+            embed.add_field(name=f"Messages ({days}d)", value=f"**{sum(daily_values)}**", inline=True)
+            embed.add_field(name="Last 24 Hours", value=f"`{sparkline(hourly_values)}`", inline=False)
+            if days > 1:
+                embed.add_field(name=f"Last {days} Days", value=f"`{sparkline(daily_values)}`", inline=False)
+
+            channel_lines = [f"<#{channel_id}> - {total} messages" for channel_id, total in top_channels]
+            embed.add_field(name="Top Channels", value="\n".join(channel_lines) or "No activity yet!", inline=False)
+
+            names = await self.resolve_names(interaction.guild, [row[0] for row in top_members])
+            member_lines = []
+            for user_id, total, xp in top_members:
+                username = names[user_id][0] if user_id in names else f"Unknown User ({user_id})"
+                member_lines.append(f"**{username}** - {total} messages | {xp} XP")
+            embed.add_field(name="Top Members", value="\n".join(member_lines) or "No activity yet!", inline=False)
+            embed.set_footer(text="Times in UTC")
+
+            await interaction.followup.send(embed=embed)
 
         except Exception as e:
-            await interaction.response.send_message("❌ An error occurred while fetching the leaderboard.", ephemeral=True)
-            print(f"Error in leaderboard command: {e}")
+            await interaction.followup.send("❌ An error occurred while fetching activity stats.", ephemeral=True)
+            print(f"Error in stats command: {e}")
 
     @app_commands.command(name='reset_levels', description='Reset leveling data for this server (Admin only)')
     @app_commands.default_permissions(administrator=True)
     async def slash_reset_levels(self, interaction: discord.Interaction):
         """Reset all leveling data for the server"""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute(
-                'DELETE FROM user_levels WHERE guild_id = ?',
-                (interaction.guild.id,)
-            )
-            
-            conn.commit()
-            conn.close()
-            
+            await interaction.response.defer()
+
+            guild_id = interaction.guild.id
+            async with self.flush_lock:
+                self.xp_buffer.forget_guild(guild_id)
+            # Delete in chunks without the flush lock, so XP flushes for other
+            # guilds (and /level readers) get the database between chunks
+            await leveling_io.delete_guild(self.db, guild_id)
+            async with self.flush_lock:
+                # Sweep rows flushed while the delete ran and drop what was buffered meanwhile
+                await leveling_io.delete_guild(self.db, guild_id)
+                self.xp_buffer.forget_guild(guild_id)
+                self.rank_indexes.discard(guild_id)
+                self.cooldowns.clear_guild(guild_id)
+
             embed = discord.Embed(
                 title="🔄 Level Data Reset",
                 description="All leveling data for this server has been reset.",
                 color=0x00ff00
             )
-            await interaction.response.send_message(embed=embed)
-            
+            await interaction.followup.send(embed=embed)
+
         except Exception as e:
-            await interaction.response.send_message("❌ An error occurred while resetting level data.", ephemeral=True)
+            await interaction.followup.send("❌ An error occurred while resetting level data.", ephemeral=True)
             print(f"Error in reset_levels command: {e}")
 
+    @app_commands.command(name='export_levels', description='Export leveling data for this server (Admin only)')
+    @app_commands.describe(file_format='File format')
+    @app_commands.choices(file_format=[app_commands.Choice(name=fmt, value=fmt) for fmt in leveling_io.FORMATS])
+    @app_commands.default_permissions(administrator=True)
+    async def slash_export_levels(self, interaction: discord.Interaction, file_format: str = 'jsonl'):
+        """Export the server's leveling data as a JSONL or CSV file"""
+        try:
+            await interaction.response.defer(ephemeral=True)
+            await self.flush_xp()
+
+            guild_id = interaction.guild.id
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                path = os.path.join(tmp_dir, leveling_io.export_filename(guild_id, file_format))
+
+                def _export(conn):
+                    with open(path, 'w', newline='', encoding='utf-8') as f:
+                        return leveling_io.export_guild(conn, guild_id, file_format, f)
+
+                count = await self.db.read(_export)
+
+                if os.path.getsize(path) > interaction.guild.filesize_limit:
+                    await interaction.followup.send(
+                        "❌ The export is too large to upload here. Use `python -m tools.leveling_data export` on the bot host instead.",
+                        ephemeral=True
+                    )
+                    return
+
+                await interaction.followup.send(f"📦 Exported **{count}** users.", file=discord.File(path), ephemeral=True)
+
+        except Exception as e:
+            await interaction.followup.send("❌ An error occurred while exporting level data.", ephemeral=True)
+            print(f"Error in export_levels command: {e}")
+
+    @app_commands.command(name='import_levels', description='Import leveling data for this server (Admin only)')
+    @app_commands.describe(
+        file='JSONL or CSV file with at least user_id and xp columns',
+        policy='What to do with users that already have XP here')
+    @app_commands.choices(policy=[
+        app_commands.Choice(name='skip existing users', value='skip'),
+        app_commands.Choice(name='replace existing users', value='replace'),
+        app_commands.Choice(name='add to existing XP', value='sum'),
+        app_commands.Choice(name='keep the higher XP', value='max'),
+    ])
+    @app_commands.default_permissions(administrator=True)
+    async def slash_import_levels(self, interaction: discord.Interaction, file: discord.Attachment, policy: str = 'skip'):
+        """Import leveling data exported from this or another bot"""
+        try:
+            await interaction.response.defer(ephemeral=True)
+
+            guild_id = interaction.guild.id
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                path = os.path.join(tmp_dir, 'import')
+                await file.save(path)
+
+                # Reject malformed files before anything is written
+                loop = asyncio.get_event_loop()
+                await loop.run_in_executor(None, leveling_io.validate_file, path)
+
+                await self.flush_xp()
+                try:
+                    # No flush lock here: import_rows commits chunk by chunk so the
+                    # XP flush can write in between. Buffered gains are deltas and
+                    # land on top of the imported rows.
+                    with open(path, newline='', encoding='utf-8') as f:
+                        count = await leveling_io.import_rows(
+                            self.db, guild_id, leveling_io.read_rows(f), policy,
+                            level_for=lambda xp: self.calculate_level(guild_id, xp)
+                        )
+                finally:
+                    async with self.flush_lock:
+                        await self.refresh_totals(guild_id)
+                        self.rank_indexes.discard(guild_id)
+
+            await interaction.followup.send(f"✅ Imported **{count}** users.", ephemeral=True)
+
+        except ValueError as e:
+            await interaction.followup.send(f"❌ Nothing was imported: {e}", ephemeral=True)
+        except Exception as e:
+            await interaction.followup.send("❌ An error occurred while importing level data.", ephemeral=True)
+            print(f"Error in import_levels command: {e}")
+
+    async def save_config(self, guild_id, config):
+        """Persist a guild's base rules and update the in-memory copy"""
+        await self.db.execute(
+            UPSERT_GUILD_SETTINGS_SQL,
+            (guild_id, config.xp_min, config.xp_max, config.cooldown, config.curve.name)
+        )
+        self.configs[guild_id] = config
+
+    @app_commands.command(name='leveling_config', description='Configure leveling rules for this server (Admin only)')
+    @app_commands.describe(
+        action='What action to perform',
+        min_xp='Minimum XP per message',
+        max_xp='Maximum XP per message',
+        seconds='Cooldown between XP gains, in seconds',
+        curve='Level curve',
+        channel='Channel to configure',
+        multiplier='XP multiplier for the channel (0 disables XP there)')
+    @app_commands.choices(
+        action=[
+            app_commands.Choice(name='show', value='show'),
+            app_commands.Choice(name='set_xp', value='set_xp'),
+            app_commands.Choice(name='set_cooldown', value='set_cooldown'),
+            app_commands.Choice(name='set_curve', value='set_curve'),
+            app_commands.Choice(name='set_multiplier', value='set_multiplier'),
+            app_commands.Choice(name='no_xp', value='no_xp'),
+            app_commands.Choice(name='clear_channel', value='clear_channel'),
+        ],
+        curve=[app_commands.Choice(name=name, value=name) for name in CURVES])
+    @app_commands.default_permissions(manage_guild=True)
+    async def slash_leveling_config(self, interaction: discord.Interaction,
+                                    action: str,
+                                    min_xp: Optional[app_commands.Range[int, 0, 1000]] = None,
+                                    max_xp: Optional[app_commands.Range[int, 0, 1000]] = None,
+                                    seconds: Optional[app_commands.Range[int, 0, 86400]] = None,
+                                    curve: Optional[str] = None,
+                                    channel: Optional[discord.TextChannel] = None,
+                                    multiplier: Optional[app_commands.Range[float, 0, 10]] = None):
+        """Leveling rules management command"""
+        try:
+            guild_id = interaction.guild.id
+            current = self.get_config(guild_id)
+            # Work on a copy so a failed write leaves the cached rules untouched
+            config = LevelingConfig(current.xp_min, current.xp_max, current.cooldown,
+                                    current.curve.name, dict(current.channel_multipliers))
+
+            if action == 'show':
+                embed = discord.Embed(title="⚙️ Leveling Rules", color=0x00ff00)
+                embed.add_field(name="XP per Message", value=f"{config.xp_min}-{config.xp_max}", inline=True)
+                embed.add_field(name="Cooldown", value=f"{config.cooldown}s", inline=True)
+                embed.add_field(name="Curve", value=config.curve.name, inline=True)
+                multipliers = [
+                    f"<#{channel_id}>: x{value:g}" for channel_id, value in config.channel_multipliers.items() if value != 0
+                ]
+                embed.add_field(name="Channel Multipliers", value="\n".join(multipliers) or "None", inline=False)
+                no_xp = [f"<#{channel_id}>" for channel_id in config.no_xp_channels()]
+                embed.add_field(name="No XP Channels", value=", ".join(no_xp) or "None", inline=False)
+                await interaction.response.send_message(embed=embed, ephemeral=True)
+                return
+
+            if action == 'set_xp':
+                if min_xp is None or max_xp is None or min_xp > max_xp:
+                    await interaction.response.send_message("Please provide `min_xp` and `max_xp` with min_xp <= max_xp!", ephemeral=True)
+                    return
+                config.xp_min, config.xp_max = min_xp, max_xp
+                await self.save_config(guild_id, config)
+                message = f"Members now earn **{min_xp}-{max_xp} XP** per message."
+
+            elif action == 'set_cooldown':
+                if seconds is None:
+                    await interaction.response.send_message("Please provide `seconds`!", ephemeral=True)
+                    return
+                config.cooldown = seconds
+                await self.save_config(guild_id, config)
+                # Running cooldowns were started with the old length
+                self.cooldowns.clear_guild(guild_id)
+                message = f"XP cooldown set to **{seconds}s**."
+
+            elif action == 'set_curve':
+                if curve is None:
+                    await interaction.response.send_message("Please choose a `curve`!", ephemeral=True)
+                    return
+                config = LevelingConfig(config.xp_min, config.xp_max, config.cooldown, curve, config.channel_multipliers)
+                await self.save_config(guild_id, config)
+                message = f"Level curve set to **{curve}**."
+
+            elif action in ('set_multiplier', 'no_xp'):
+                if channel is None or (action == 'set_multiplier' and multiplier is None):
+                    await interaction.response.send_message("Please specify a `channel` (and `multiplier`)!", ephemeral=True)
+                    return
+                value = 0.0 if action == 'no_xp' else multiplier
+                await self.db.execute(UPSERT_CHANNEL_MULTIPLIER_SQL, (guild_id, channel.id, value))
+                config.channel_multipliers[channel.id] = value
+                self.configs[guild_id] = config
+                message = f"{channel.mention} gives no XP." if value == 0 else f"{channel.mention} now gives **x{value:g}** XP."
+
+            elif action == 'clear_channel':
+                if channel is None:
+                    await interaction.response.send_message("Please specify a `channel`!", ephemeral=True)
+                    return
+                await self.db.execute(DELETE_CHANNEL_MULTIPLIER_SQL, (guild_id, channel.id))
+                config.channel_multipliers.pop(channel.id, None)
+                self.configs[guild_id] = config
+                message = f"{channel.mention} uses the default XP rate again."
+
+            await interaction.response.send_message(f"✅ {message}", ephemeral=True)
+
+        except Exception as e:
+            await interaction.response.send_message("❌ An error occurred while updating leveling rules.", ephemeral=True)
+            print(f"Error in leveling_config command: {e}")
+
 async def setup(bot):
     await bot.add_cog(LevelingCommands(bot))
\ No newline at end of file
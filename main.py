@@ -16,6 +16,7 @@ logger = logging.getLogger(__name__)
 intents = discord.Intents.default()
 intents.message_content = True
 intents.voice_states = True  # Required for music functionality
+intents.members = True  # Join/leave/rename events keep the leaderboard name cache fresh
 bot = commands.Bot(command_prefix='!', intents=intents)
 
 # Load command modules
@@ -93,7 +94,7 @@ async def on_message(message):
     # Process commands first
     await bot.process_commands(message)
 
-    # Only respond in DMs (mentions require Message Content Intent in Discord portal)
+    # Respond to every DM here; guild mentions and AI chat channels are handled by AIChatCommands
     if isinstance(message.channel, discord.DMChannel):
         # Get the AI chat cog and handle the response
         ai_cog = bot.get_cog('AIChatCommands')
@@ -0,0 +1,65 @@
+import asyncio
+from types import SimpleNamespace
+
+from commands import leveling
+from commands.leveling import VOICE_XP_PER_MINUTE, LevelingCommands
+
+
+class VoiceOnlyGuild:
+    """Guild whose member cache only holds members currently in voice"""
+    def __init__(self, guild_id):
+        self.id = guild_id
+        self.afk_channel = None
+        self.members = {}
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+    def get_channel(self, channel_id):
+        return None
+
+
+def voice_state(channel=None):
+    return SimpleNamespace(channel=channel, self_mute=False, self_deaf=False, mute=False, deaf=False)
+
+
+def make_cog(guild):
+    bot = SimpleNamespace(get_guild=lambda guild_id: guild if guild_id == guild.id else None)
+    cog = LevelingCommands(bot)
+    awarded = []
+
+    async def award_xp(guild_id, user, channel_id, gained_xp, messages=1):
+        awarded.append((guild_id, user.id, channel_id, gained_xp))
+        return 0, 0
+
+    cog.award_xp = award_xp
+    return cog, awarded
+
+
+def test_leave_credits_voice_xp_after_member_left_cache(monkeypatch):
+    guild = VoiceOnlyGuild(1)
+    channel = SimpleNamespace(id=10)
+    member = SimpleNamespace(id=100, bot=False, guild=guild)
+    cog, awarded = make_cog(guild)
+
+    # Joined twelve minutes ago
+    cog.voice_sessions.start(guild.id, member.id, channel.id, now=0)
+    monkeypatch.setattr(leveling.time, 'monotonic', lambda: 12 * 60)
+
+    # discord.py drops the member from a voice-only cache before dispatching the leave
+    assert guild.get_member(member.id) is None
+    asyncio.run(cog.on_voice_state_update(member, voice_state(channel), voice_state()))
+
+    assert awarded == [(guild.id, member.id, channel.id, 12 * VOICE_XP_PER_MINUTE)]
+    assert (guild.id, member.id) not in cog.voice_sessions
+
+
+def test_checkpoint_skips_members_missing_from_cache(monkeypatch):
+    guild = VoiceOnlyGuild(1)
+    cog, awarded = make_cog(guild)
+    cog.voice_sessions.start(guild.id, 100, 10, now=0)
+    monkeypatch.setattr(leveling.time, 'monotonic', lambda: 5 * 60)
+
+    asyncio.run(cog.credit_voice_checkpoint())
+
+    assert awarded == []
@@ -0,0 +1,383 @@
+# tools/bench_ai.py
+"""Load test for the AI chat path against a local fake Character.AI
+
+Drives AIChatCommands with DMs and /chat interactions arriving as a Poisson
+process, with the upstream played by tools.fake_characterai, and reports
+throughput, end-to-end and first-reply latency, queueing, pipeline stage
+percentiles and how requests ended. Runs offline; no Discord connection or
+Character.AI account is needed.
+
+    python -m tools.bench_ai --rate 5 --duration 30 --users 200
+    python -m tools.bench_ai --rate 20 --requests 500 --accounts 2 --error-rate 0.05 --json
+    python -m tools.bench_ai --rate 10 --duration 20 --throttle-rps 2 --first-token 1.5:0.8
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from tools.bench_leveling import monitor_loop_lag, percentile
+from tools.fake_characterai import FakeCharacterAI
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.bot = False
+        self.name = f"user{user_id}"
+        self.display_name = self.name
+
+    def mentioned_in(self, message):
+        return False
+
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+
+
+class FakeTyping:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeChannel:
+    def __init__(self, channel_id, guild=None):
+        self.id = channel_id
+        self.guild = guild
+
+    def typing(self):
+        return FakeTyping()
+
+
+class Trace:
+    """Timing of one simulated request as the user would see it"""
+    def __init__(self, source):
+        self.source = source
+        self.started = time.perf_counter()
+        self.first_reply = None
+        self.finished = None
+        self.messages = 0
+        self.edits = 0
+
+
+class FakeSentMessage:
+    def __init__(self, discord, trace):
+        self.discord = discord
+        self.trace = trace
+
+    async def edit(self, content=None, **kwargs):
+        await self.discord.call()
+        self.trace.edits += 1
+        return self
+
+
+class FakeDiscord:
+    """Simulated Discord API round trips for sends and edits"""
+    def __init__(self, latency, rng):
+        self.latency = latency
+        self.rng = rng
+        self.calls = 0
+
+    async def call(self):
+        self.calls += 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency * self.rng.uniform(0.5, 1.5))
+
+    async def send(self, trace, content):
+        await self.call()
+        if trace.first_reply is None:
+            trace.first_reply = time.perf_counter()
+        trace.messages += 1
+        return FakeSentMessage(self, trace)
+
+
+class FakeMessage:
+    """A DM as handle_ai_response sees it"""
+    def __init__(self, author, channel, content, discord, trace):
+        self.author = author
+        self.guild = None
+        self.channel = channel
+        self.content = content
+        self.mentions = []
+        self.discord = discord
+        self.trace = trace
+
+    async def reply(self, content=None, **kwargs):
+        return await self.discord.send(self.trace, content)
+
+
+class FakeResponse:
+    def __init__(self, discord):
+        self.discord = discord
+        self.done = False
+
+    def is_done(self):
+        return self.done
+
+    async def defer(self, **kwargs):
+        await self.discord.call()
+        self.done = True
+
+    async def send_message(self, *args, **kwargs):
+        await self.discord.call()
+        self.done = True
+
+
+class FakeFollowup:
+    def __init__(self, discord, trace):
+        self.discord = discord
+        self.trace = trace
+
+    async def send(self, content=None, **kwargs):
+        return await self.discord.send(self.trace, content)
+
+
+class FakeInteraction:
+    """A /chat invocation as slash_chat sees it"""
+    def __init__(self, user, guild, channel, discord, trace):
+        self.user = user
+        self.guild = guild
+        self.channel = channel
+        self.response = FakeResponse(discord)
+        self.followup = FakeFollowup(discord, trace)
+
+
+class FakeBot:
+    def __init__(self):
+        self.user = FakeUser(0)
+        self.command_prefix = "!"
+
+
+async def run(args):
+    from commands import ai_chat
+    from utils import ai_sessions
+    from utils.ai_pipeline import STAGES
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_ai_")
+    ai_sessions.DB_PATH = os.path.join(tmp_dir, "ai_chat.db")
+
+    tokens = [f"bench-token-{index}" for index in range(args.accounts)]
+    upstream = FakeCharacterAI(
+        auth=args.auth,
+        create=args.create,
+        first_token=args.first_token,
+        chunk=args.chunk,
+        chunks=args.chunks,
+        error_rate=args.error_rate,
+        session_error_rate=args.session_error_rate,
+        rate_per_account=args.throttle_rps,
+        concurrency_per_account=args.throttle_concurrency,
+        seed=args.seed,
+    )
+    # The cog reads its limits from the environment, like in production
+    os.environ["CHARACTERAI_TOKEN"] = tokens[0]
+    os.environ["CHARACTERAI_TOKENS"] = ",".join(tokens[1:])
+    os.environ["CHARACTER_ID"] = "bench-character"
+    os.environ["AI_WARM_POOL_SIZE"] = str(args.warm_pool)
+    os.environ["AI_RESPONSE_TIMEOUT"] = str(args.timeout)
+    os.environ["AI_MAX_QUEUE"] = str(args.max_queue)
+    os.environ["AI_ACCOUNT_MAX_CONCURRENT"] = str(args.account_concurrency)
+    if args.max_concurrent:
+        os.environ["AI_MAX_CONCURRENT"] = str(args.max_concurrent)
+    ai_chat.AIAccountPool = functools.partial(ai_chat.AIAccountPool, client_factory=upstream.client)
+
+    rng = random.Random(args.seed)
+    discord = FakeDiscord(args.discord_latency, rng)
+    bot = FakeBot()
+    users = [FakeUser(user_id) for user_id in range(1, args.users + 1)]
+    dm_channels = {user.id: FakeChannel(100000 + user.id) for user in users}
+    guilds = [FakeGuild(guild_id) for guild_id in range(1, args.guilds + 1)]
+    guild_channels = {guild.id: FakeChannel(guild.id * 1000, guild) for guild in guilds}
+
+    cog = ai_chat.AIChatCommands(bot)
+    await cog.cog_load()
+    # Let the accounts authenticate before traffic starts
+    connect_deadline = time.perf_counter() + 10
+    while (any(account.state != "ready" for account in cog.ai.accounts.values())
+           and time.perf_counter() < connect_deadline):
+        await asyncio.sleep(0.05)
+    if args.warm_pool:
+        await asyncio.sleep(args.warmup)
+
+    traces = []
+    queue_samples = []
+    lag_samples = []
+    lag_task = asyncio.create_task(monitor_loop_lag(lag_samples))
+
+    async def sample_queue():
+        while True:
+            queue_samples.append(cog.scheduler.queued)
+            await asyncio.sleep(0.1)
+
+    queue_task = asyncio.create_task(sample_queue())
+
+    async def one_request(trace, user):
+        text = f"hello number {len(traces)}"
+        try:
+            if trace.source == "slash":
+                guild = rng.choice(guilds)
+                interaction = FakeInteraction(user, guild, guild_channels[guild.id], discord, trace)
+                await cog.slash_chat.callback(cog, interaction, text)
+            else:
+                message = FakeMessage(user, dm_channels[user.id], text, discord, trace)
+                await cog.handle_ai_response(message)
+        finally:
+            trace.finished = time.perf_counter()
+
+    deadline = time.perf_counter() + args.duration if args.duration else None
+    tasks = []
+    started = time.perf_counter()
+    try:
+        while True:
+            if deadline is not None:
+                if time.perf_counter() >= deadline:
+                    break
+            elif len(traces) >= args.requests:
+                break
+            trace = Trace("slash" if rng.random() < args.slash_fraction else "dm")
+            traces.append(trace)
+            tasks.append(asyncio.create_task(one_request(trace, rng.choice(users))))
+            # Open-loop arrivals: a slow bot doesn't slow the users down
+            await asyncio.sleep(rng.expovariate(args.rate))
+
+        arrivals_done = time.perf_counter()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        elapsed = time.perf_counter() - started
+        drain = time.perf_counter() - arrivals_done
+    finally:
+        lag_task.cancel()
+        queue_task.cancel()
+        snapshot = cog.pipeline.metrics.snapshot()
+        scheduler_stats = cog.scheduler.stats()
+        await cog.cog_unload()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def latency_summary(values):
+        return {
+            "p50_ms": round(percentile(values, 50) * 1000, 1),
+            "p95_ms": round(percentile(values, 95) * 1000, 1),
+            "p99_ms": round(percentile(values, 99) * 1000, 1),
+            "max_ms": round(max(values, default=0) * 1000, 1),
+        }
+
+    counters = snapshot["counters"]
+    completed = counters.get("outcome.ok", 0)
+    result = {
+        "requests": len(traces),
+        "accounts": args.accounts,
+        "users": args.users,
+        "offered_rate": args.rate,
+        "elapsed_s": round(elapsed, 3),
+        "drain_s": round(drain, 3),
+        "completed_per_s": round(completed / elapsed, 2) if elapsed else 0,
+        "end_to_end": {
+            source: latency_summary([t.finished - t.started for t in traces if t.source == source])
+            for source in ("dm", "slash")
+        },
+        "first_reply": latency_summary([t.first_reply - t.started for t in traces if t.first_reply is not None]),
+        "no_reply": sum(1 for t in traces if t.first_reply is None),
+        "stages_ms": {
+            stage: {key: round(value * 1000, 1) for key, value in snapshot["histograms"][stage].items() if key != "count"}
+            for stage in STAGES if stage in snapshot["histograms"]
+        },
+        "queue": {
+            "depth_max": max(queue_samples, default=0),
+            "depth_mean": round(sum(queue_samples) / len(queue_samples), 2) if queue_samples else 0,
+            "wait_p50_ms": round(scheduler_stats["wait_p50"] * 1000, 1),
+            "wait_p95_ms": round(scheduler_stats["wait_p95"] * 1000, 1),
+            "wait_max_ms": round(scheduler_stats["wait_max"] * 1000, 1),
+            "rejected": scheduler_stats["rejected"],
+        },
+        "outcomes": {name.split(".", 1)[1]: count for name, count in counters.items() if name.startswith("outcome.")},
+        "errors": {name.split(".", 1)[1]: count for name, count in counters.items() if name.startswith("errors.")},
+        "sessions": {name.split(".", 1)[1]: count for name, count in counters.items() if name.startswith("sessions.")},
+        "upstream": dict(upstream.stats),
+        "discord_calls": discord.calls,
+        "loop_lag_p99_ms": round(percentile(lag_samples, 99) * 1000, 3),
+        "loop_lag_max_ms": round(max(lag_samples, default=0) * 1000, 3),
+    }
+    return result
+
+
+def format_latency(summary):
+    return (f"p50 {summary['p50_ms']} ms | p95 {summary['p95_ms']} ms | "
+            f"p99 {summary['p99_ms']} ms | max {summary['max_ms']} ms")
+
+
+def format_counts(counts):
+    return ", ".join(f"{name} {count}" for name, count in sorted(counts.items())) or "none"
+
+
+def print_report(result):
+    print(f"Requests:          {result['requests']} at {result['offered_rate']}/s offered "
+          f"({result['users']} users, {result['accounts']} accounts)")
+    print(f"Throughput:        {result['completed_per_s']} completed/s over {result['elapsed_s']}s "
+          f"(drained in {result['drain_s']}s)")
+    print(f"DM end-to-end:     {format_latency(result['end_to_end']['dm'])}")
+    print(f"/chat end-to-end:  {format_latency(result['end_to_end']['slash'])}")
+    print(f"First reply:       {format_latency(result['first_reply'])} ({result['no_reply']} never got one)")
+    queue = result["queue"]
+    print(f"Queue:             depth max {queue['depth_max']} / mean {queue['depth_mean']} | "
+          f"wait p50 {queue['wait_p50_ms']} ms, p95 {queue['wait_p95_ms']} ms, max {queue['wait_max_ms']} ms | "
+          f"rejected {queue['rejected']}")
+    for stage, summary in result["stages_ms"].items():
+        print(f"  {stage + ':':<16} p50 {summary['p50']} ms | p95 {summary['p95']} ms | p99 {summary['p99']} ms")
+    print(f"Outcomes:          {format_counts(result['outcomes'])}")
+    print(f"Errors:            {format_counts(result['errors'])}")
+    print(f"Sessions:          {format_counts(result['sessions'])}")
+    print(f"Upstream calls:    {format_counts(result['upstream'])}")
+    print(f"Event-loop lag:    p99 {result['loop_lag_p99_ms']} ms | max {result['loop_lag_max_ms']} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the AI chat path against a fake Character.AI")
+    parser.add_argument("--requests", type=int, default=200, help="Requests to send (ignored with --duration)")
+    parser.add_argument("--duration", type=float, default=0, help="Send for this many seconds instead")
+    parser.add_argument("--rate", type=float, default=5, help="Mean arrivals/second (Poisson)")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--guilds", type=int, default=5, help="Guilds /chat is used in")
+    parser.add_argument("--slash-fraction", type=float, default=0.3, help="Share of requests sent as /chat")
+    parser.add_argument("--accounts", type=int, default=1, help="Character.AI accounts in the pool")
+    parser.add_argument("--account-concurrency", type=int, default=2, help="AI_ACCOUNT_MAX_CONCURRENT")
+    parser.add_argument("--max-concurrent", type=int, default=0, help="AI_MAX_CONCURRENT (0 = accounts' capacity)")
+    parser.add_argument("--max-queue", type=int, default=50, help="AI_MAX_QUEUE")
+    parser.add_argument("--timeout", type=float, default=30, help="AI_RESPONSE_TIMEOUT in seconds")
+    parser.add_argument("--warm-pool", type=int, default=3, help="AI_WARM_POOL_SIZE")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds to let warm pools fill before traffic")
+    latency = parser.add_argument_group("fake upstream", "latencies are 'median[:sigma]' in seconds, log-normal")
+    latency.add_argument("--auth", default="0.2")
+    latency.add_argument("--create", default="0.4", help="create_chat latency")
+    latency.add_argument("--first-token", default="0.8", help="Time to the first streamed chunk")
+    latency.add_argument("--chunk", default="0.15", help="Time between streamed chunks")
+    latency.add_argument("--chunks", type=int, default=8, help="Chunks per reply")
+    latency.add_argument("--error-rate", type=float, default=0.0, help="Share of calls failing with a transient error")
+    latency.add_argument("--session-error-rate", type=float, default=0.0,
+                         help="Share of messages failing because the chat is gone")
+    latency.add_argument("--throttle-rps", type=float, default=0, help="Requests/second allowed per account (0 = no limit)")
+    latency.add_argument("--throttle-concurrency", type=int, default=0,
+                         help="Streams allowed at once per account (0 = no limit)")
+    parser.add_argument("--discord-latency", type=float, default=0.05, help="Mean Discord API round trip in seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON for comparing runs")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    if args.json:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(result)
+
+
+if __name__ == "__main__":
+    main()
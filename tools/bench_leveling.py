@@ -0,0 +1,267 @@
+# tools/bench_leveling.py
+"""Message-storm benchmark for the leveling cog
+
+Drives LevelingCommands.on_message with fake messages against a temporary
+database and reports throughput, handler latency, event-loop lag and database
+growth. Runs offline; no Discord connection is needed.
+
+    python -m tools.bench_leveling --messages 50000 --guilds 20 --users 2000
+    python -m tools.bench_leveling --rate 2000 --duration 30 --cooldown 60 --json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+
+class FakeAsset:
+    def __init__(self, user_id):
+        self.key = f"avatar{user_id}"
+        self.url = f"https://cdn.example/avatars/{user_id}.png"
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.bot = False
+        self.name = f"user{user_id}"
+        self.global_name = None
+        self.display_name = self.name
+        self.display_avatar = FakeAsset(user_id)
+
+
+class FakePermissions:
+    send_messages = True
+    send_messages_in_threads = True
+    embed_links = True
+
+
+class FakeChannel:
+    def __init__(self, channel_id, guild):
+        self.id = channel_id
+        self.guild = guild
+        self.sent = 0
+
+    def permissions_for(self, member):
+        return FakePermissions()
+
+    async def send(self, *args, **kwargs):
+        self.sent += 1
+
+
+class FakeGuild:
+    def __init__(self, guild_id, channels):
+        self.id = guild_id
+        self.me = None
+        self.afk_channel = None
+        self.voice_channels = []
+        self.stage_channels = []
+        self.channels = [FakeChannel(guild_id * 1000 + i, self) for i in range(channels)]
+        self.members = {}
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+    def get_channel(self, channel_id):
+        for channel in self.channels:
+            if channel.id == channel_id:
+                return channel
+        return None
+
+
+class FakeMessage:
+    """The subset of discord.Message the leveling cog reads"""
+    def __init__(self, author, guild, channel):
+        self.author = author
+        self.guild = guild
+        self.channel = channel
+
+
+class FakeBot:
+    def __init__(self, guilds):
+        self.guilds = guilds
+        self.user = FakeUser(0)
+        self._guilds = {guild.id: guild for guild in guilds}
+
+    def get_guild(self, guild_id):
+        return self._guilds.get(guild_id)
+
+    def get_user(self, user_id):
+        return None
+
+    async def wait_until_ready(self):
+        return None
+
+
+def database_size(path):
+    """Bytes used by the database, including its WAL and shared-memory files"""
+    return sum(os.path.getsize(path + suffix) for suffix in ("", "-wal", "-shm") if os.path.exists(path + suffix))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def monitor_loop_lag(samples, interval=0.01):
+    """Record how late the event loop wakes us up, in seconds"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - start - interval))
+
+
+async def run(args):
+    from commands import leveling
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_leveling_")
+    leveling.DB_PATH = os.path.join(tmp_dir, "leveling.db")
+
+    rng = random.Random(args.seed)
+    guilds = [FakeGuild(guild_id, args.channels) for guild_id in range(1, args.guilds + 1)]
+    users = [FakeUser(user_id) for user_id in range(1, args.users + 1)]
+    for guild in guilds:
+        for user in users:
+            guild.members[user.id] = user
+    bot = FakeBot(guilds)
+
+    cog = leveling.LevelingCommands(bot)
+    cog.rank_cards.shutdown()
+    await cog.cog_load()
+    for guild in guilds:
+        cog.configs[guild.id] = leveling.LevelingConfig(cooldown=args.cooldown)
+
+    # Count level-ups as they are queued; the announcer may not get to send them all
+    level_ups = 0
+    queue_level_up = cog.announcer.add
+
+    def count_level_up(*args):
+        nonlocal level_ups
+        level_ups += 1
+        queue_level_up(*args)
+
+    cog.announcer.add = count_level_up
+
+    start_size = database_size(leveling.DB_PATH)
+    latencies = []
+    lag_samples = []
+    lag_task = asyncio.create_task(monitor_loop_lag(lag_samples))
+
+    interval = 1 / args.rate if args.rate else 0
+    deadline = time.perf_counter() + args.duration if args.duration else None
+    sent = 0
+    started = time.perf_counter()
+    try:
+        while True:
+            if deadline is not None:
+                if time.perf_counter() >= deadline:
+                    break
+            elif sent >= args.messages:
+                break
+
+            guild = rng.choice(guilds)
+            message = FakeMessage(rng.choice(users), guild, rng.choice(guild.channels))
+            t0 = time.perf_counter()
+            await cog.on_message(message)
+            latencies.append(time.perf_counter() - t0)
+            sent += 1
+
+            if interval:
+                next_send = started + sent * interval
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif sent % 100 == 0:
+                # Let background flushes and the lag monitor run, like the gateway would
+                await asyncio.sleep(0)
+
+        elapsed = time.perf_counter() - started
+        flush_started = time.perf_counter()
+        await cog.flush_xp()
+        final_flush = time.perf_counter() - flush_started
+        end_size = database_size(leveling.DB_PATH)
+    finally:
+        lag_task.cancel()
+        await cog.cog_unload()
+
+    # Closing the last connection checkpoints the WAL back into the main file
+    checkpointed_size = database_size(leveling.DB_PATH)
+    result = {
+        "messages": sent,
+        "guilds": args.guilds,
+        "users": args.users,
+        "cooldown": args.cooldown,
+        "elapsed_s": round(elapsed, 3),
+        "messages_per_s": round(sent / elapsed, 1) if elapsed else 0,
+        "handler_p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "handler_p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "handler_max_ms": round(max(latencies, default=0) * 1000, 3),
+        "loop_lag_p50_ms": round(percentile(lag_samples, 50) * 1000, 3),
+        "loop_lag_p99_ms": round(percentile(lag_samples, 99) * 1000, 3),
+        "loop_lag_max_ms": round(max(lag_samples, default=0) * 1000, 3),
+        "final_flush_ms": round(final_flush * 1000, 3),
+        "db_start_bytes": start_size,
+        "db_end_bytes": end_size,
+        "db_growth_bytes": end_size - start_size,
+        "db_checkpointed_bytes": checkpointed_size,
+        "level_ups": level_ups,
+    }
+
+    if args.keep_db:
+        result["db_path"] = leveling.DB_PATH
+    else:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return result
+
+
+def print_report(result):
+    print(f"Messages:          {result['messages']} across {result['guilds']} guilds / {result['users']} users "
+          f"(cooldown {result['cooldown']}s)")
+    print(f"Throughput:        {result['messages_per_s']} msg/s over {result['elapsed_s']}s")
+    print(f"Handler latency:   p50 {result['handler_p50_ms']} ms | p99 {result['handler_p99_ms']} ms | "
+          f"max {result['handler_max_ms']} ms")
+    print(f"Event-loop lag:    p50 {result['loop_lag_p50_ms']} ms | p99 {result['loop_lag_p99_ms']} ms | "
+          f"max {result['loop_lag_max_ms']} ms")
+    print(f"Final flush:       {result['final_flush_ms']} ms")
+    print(f"Database growth:   {result['db_start_bytes']} -> {result['db_end_bytes']} bytes "
+          f"(+{result['db_growth_bytes']}, including WAL); {result['db_checkpointed_bytes']} bytes after checkpoint")
+    print(f"Level-ups:         {result['level_ups']}")
+    if "db_path" in result:
+        print(f"Database kept at:  {result['db_path']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the leveling message path with synthetic traffic")
+    parser.add_argument("--messages", type=int, default=20000, help="Messages to send (ignored with --duration)")
+    parser.add_argument("--duration", type=float, default=0, help="Run for this many seconds instead")
+    parser.add_argument("--rate", type=float, default=0, help="Target messages/second (0 = as fast as possible)")
+    parser.add_argument("--guilds", type=int, default=10)
+    parser.add_argument("--users", type=int, default=1000, help="Users per guild")
+    parser.add_argument("--channels", type=int, default=5, help="Text channels per guild")
+    parser.add_argument("--cooldown", type=int, default=0,
+                        help="XP cooldown in seconds (0 makes every message hit the write path)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep-db", action="store_true", help="Keep the temporary database for inspection")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON for comparing runs")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    if args.json:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+    else:
+        print_report(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+# tools/fake_characterai.py
+"""Local stand-in for the parts of PyCharacterAI the bot uses
+
+FakeCharacterAI plays the upstream service in-process: it hands out clients
+with `authenticate`, `close_session`, `chat.create_chat` and
+`chat.send_message` (streaming or not), and turns whose
+`get_primary_candidate().text` grows the way real streamed replies do.
+Latencies are drawn from log-normal distributions, errors are injected at
+configurable rates, and each account is throttled with a request rate and a
+concurrency limit. Errors are the real PyCharacterAI exception classes, so
+the bot's error classification is exercised as-is.
+
+    from tools.fake_characterai import FakeCharacterAI
+    upstream = FakeCharacterAI(first_token=0.8, error_rate=0.02)
+    client = upstream.client()
+"""
+import asyncio
+import math
+import random
+import time
+import uuid
+
+from PyCharacterAI.exceptions import ActionError, AuthenticationError, RequestError, ServerError
+
+WORDS = (
+    "sure", "I", "think", "that", "sounds", "fun", "let's", "see", "maybe", "we", "could", "try",
+    "again", "tomorrow", "haha", "of", "course", "the", "commander", "said", "so", "okay", "hmm",
+)
+
+
+class Latency:
+    """Log-normal latency with a given median; sigma sets how heavy the tail is"""
+    def __init__(self, median, sigma=0.5):
+        self.median = median
+        self.sigma = sigma
+
+    @classmethod
+    def parse(cls, spec):
+        """Parse 'median' or 'median:sigma' (seconds)"""
+        median, _, sigma = str(spec).partition(":")
+        return cls(float(median), float(sigma) if sigma else 0.5)
+
+    def sample(self, rng):
+        if self.median <= 0:
+            return 0.0
+        return self.median * math.exp(rng.gauss(0, self.sigma))
+
+
+class FakeCandidate:
+    def __init__(self, text, is_final):
+        self.candidate_id = str(uuid.uuid4())
+        self.text = text
+        self.is_final = is_final
+
+
+class FakeTurn:
+    def __init__(self, chat_id, text, is_final):
+        self.turn_id = str(uuid.uuid4())
+        self.chat_id = chat_id
+        self.author_is_human = False
+        self._candidate = FakeCandidate(text, is_final)
+
+    def get_primary_candidate(self):
+        return self._candidate
+
+
+class FakeChat:
+    def __init__(self, chat_id, character_id):
+        self.chat_id = chat_id
+        self.character_id = character_id
+
+
+class AccountState:
+    """Per-token throttle and bookkeeping"""
+    def __init__(self, rate, concurrency):
+        self.rate = rate
+        self.tokens = float(rate) if rate else 0.0
+        self.refilled = time.monotonic()
+        self.concurrency = concurrency
+        self.active = 0
+        self.chats = set()
+
+    def take(self):
+        """Spend one request from the token bucket; False when throttled"""
+        if not self.rate:
+            return True
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.refilled) * self.rate)
+        self.refilled = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class FakeCharacterAI:
+    """Shared fake upstream; every client it creates talks to the same state"""
+    def __init__(self, auth=0.2, create=0.4, first_token=0.8, chunk=0.15, chunks=8, words_per_chunk=6,
+                 error_rate=0.0, session_error_rate=0.0, rate_per_account=0.0, concurrency_per_account=0,
+                 valid_tokens=None, seed=None):
+        self.auth = Latency.parse(auth)
+        self.create = Latency.parse(create)
+        self.first_token = Latency.parse(first_token)
+        self.chunk = Latency.parse(chunk)
+        self.chunks = chunks
+        self.words_per_chunk = words_per_chunk
+        self.error_rate = error_rate
+        self.session_error_rate = session_error_rate
+        self.rate_per_account = rate_per_account
+        self.concurrency_per_account = concurrency_per_account
+        self.valid_tokens = set(valid_tokens) if valid_tokens else None
+        self.rng = random.Random(seed)
+        self.accounts = {}
+        self.stats = {
+            "auth": 0, "create_chat": 0, "send_message": 0, "throttled": 0,
+            "transient_errors": 0, "session_errors": 0, "peak_active": 0,
+        }
+
+    def client(self):
+        """A new client, like PyCharacterAI.Client()"""
+        return FakeClient(self)
+
+    def account(self, token):
+        state = self.accounts.get(token)
+        if state is None:
+            state = self.accounts[token] = AccountState(self.rate_per_account, self.concurrency_per_account)
+        return state
+
+    def admit(self, state):
+        """Apply throttling and random transient failures to one request"""
+        if not state.take() or (state.concurrency and state.active >= state.concurrency):
+            self.stats["throttled"] += 1
+            raise ServerError("429 Too Many Requests")
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.stats["transient_errors"] += 1
+            raise RequestError("Fake upstream connection reset")
+
+    def reply_text(self):
+        words = [self.rng.choice(WORDS) for _ in range(self.chunks * self.words_per_chunk)]
+        return " ".join(words).capitalize() + "!"
+
+
+class FakeChatMethods:
+    def __init__(self, client):
+        self._client = client
+
+    async def create_chat(self, character_id, greeting=True, **kwargs):
+        upstream, state = self._client._require_auth()
+        upstream.stats["create_chat"] += 1
+        upstream.admit(state)
+        await asyncio.sleep(upstream.create.sample(upstream.rng))
+        chat = FakeChat(str(uuid.uuid4()), character_id)
+        state.chats.add(chat.chat_id)
+        greeting_turn = FakeTurn(chat.chat_id, "Hello, Commander!", True) if greeting else None
+        return chat, greeting_turn
+
+    async def send_message(self, character_id, chat_id, text, streaming=False, **kwargs):
+        upstream, state = self._client._require_auth()
+        upstream.stats["send_message"] += 1
+        upstream.admit(state)
+        if chat_id not in state.chats:
+            upstream.stats["session_errors"] += 1
+            raise ActionError("Cannot send message. Chat not found")
+        if upstream.session_error_rate and upstream.rng.random() < upstream.session_error_rate:
+            upstream.stats["session_errors"] += 1
+            state.chats.discard(chat_id)
+            raise ActionError("Cannot send message. Chat was deleted")
+
+        responses = self._generate(upstream, state, chat_id)
+        if streaming:
+            return responses
+        last = None
+        async for turn in responses:
+            last = turn
+        return last
+
+    async def _generate(self, upstream, state, chat_id):
+        state.active += 1
+        upstream.stats["peak_active"] = max(upstream.stats["peak_active"], state.active)
+        try:
+            words = upstream.reply_text().split(" ")
+            await asyncio.sleep(upstream.first_token.sample(upstream.rng))
+            for index in range(1, upstream.chunks + 1):
+                if index > 1:
+                    await asyncio.sleep(upstream.chunk.sample(upstream.rng))
+                shown = words[:index * upstream.words_per_chunk]
+                yield FakeTurn(chat_id, " ".join(shown), index == upstream.chunks)
+        finally:
+            state.active -= 1
+
+
+class FakeClient:
+    """The subset of PyCharacterAI.Client the bot calls"""
+    def __init__(self, upstream):
+        self._upstream = upstream
+        self._token = None
+        self.chat = FakeChatMethods(self)
+
+    async def authenticate(self, token, **kwargs):
+        upstream = self._upstream
+        upstream.stats["auth"] += 1
+        await asyncio.sleep(upstream.auth.sample(upstream.rng))
+        if upstream.valid_tokens is not None and token not in upstream.valid_tokens:
+            raise AuthenticationError("Maybe your token is invalid?")
+        self._token = token
+
+    async def close_session(self):
+        self._token = None
+
+    def get_token(self):
+        return self._token
+
+    def get_account_id(self):
+        return f"fake-{self._token}" if self._token else None
+
+    def _require_auth(self):
+        if self._token is None:
+            raise AuthenticationError("Not authenticated")
+        return self._upstream, self._upstream.account(self._token)
@@ -0,0 +1,83 @@
+# tools/leveling_data.py
+"""Export, import or delete a guild's leveling data from the command line
+
+    python -m tools.leveling_data export GUILD_ID [--format csv] [--output FILE]
+    python -m tools.leveling_data import GUILD_ID FILE [--policy sum]
+    python -m tools.leveling_data delete GUILD_ID
+
+Safe to run while the bot is up (the database is in WAL mode), but a running
+bot keeps its cached XP totals until restart, so prefer /import_levels there.
+"""
+import argparse
+import asyncio
+import sys
+
+from commands.leveling import DB_PATH, MIGRATIONS
+from utils import leveling_io
+from utils.database import Database
+from utils.leveling_config import CURVES, DEFAULT_CURVE, get_curve
+
+
+async def run(args):
+    db = Database(args.database, MIGRATIONS)
+    await db.open()
+    try:
+        if args.action == 'export':
+            if args.output:
+                def _export(conn):
+                    with open(args.output, 'w', newline='', encoding='utf-8') as f:
+                        return leveling_io.export_guild(conn, args.guild_id, args.format, f)
+            else:
+                def _export(conn):
+                    return leveling_io.export_guild(conn, args.guild_id, args.format, sys.stdout)
+            count = await db.read(_export)
+            print(f"Exported {count} users", file=sys.stderr)
+
+        elif args.action == 'import':
+            row = await db.fetchone('SELECT curve FROM guild_settings WHERE guild_id = ?', (args.guild_id,))
+            curve = get_curve(row[0] if row and row[0] in CURVES else DEFAULT_CURVE)
+            try:
+                leveling_io.validate_file(args.file)
+            except ValueError as e:
+                # Covers bad rows, broken JSON/CSV and files that aren't UTF-8
+                sys.exit(f"Nothing was imported from {args.file}: {e}")
+            with open(args.file, newline='', encoding='utf-8') as f:
+                count = await leveling_io.import_rows(
+                    db, args.guild_id, leveling_io.read_rows(f), args.policy,
+                    level_for=curve.level_for, chunk_size=args.chunk_size
+                )
+            print(f"Imported {count} users", file=sys.stderr)
+
+        elif args.action == 'delete':
+            count = await leveling_io.delete_guild(db, args.guild_id, chunk_size=args.chunk_size)
+            print(f"Deleted {count} users", file=sys.stderr)
+    finally:
+        await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move leveling data in and out of the bot's database")
+    parser.add_argument('--database', default=DB_PATH, help=f"SQLite file (default: {DB_PATH})")
+    subparsers = parser.add_subparsers(dest='action', required=True)
+
+    export_parser = subparsers.add_parser('export', help="Write a guild's rows as JSONL or CSV")
+    export_parser.add_argument('guild_id', type=int)
+    export_parser.add_argument('--format', choices=leveling_io.FORMATS, default='jsonl')
+    export_parser.add_argument('--output', help="File to write (default: stdout)")
+
+    import_parser = subparsers.add_parser('import', help="Load JSONL or CSV rows into a guild")
+    import_parser.add_argument('guild_id', type=int)
+    import_parser.add_argument('file')
+    import_parser.add_argument('--policy', choices=leveling_io.CONFLICT_POLICIES, default='skip',
+                               help="How to merge users that already exist")
+    import_parser.add_argument('--chunk-size', type=int, default=leveling_io.CHUNK_SIZE, help="Rows per transaction")
+
+    delete_parser = subparsers.add_parser('delete', help="Delete all of a guild's rows in chunks")
+    delete_parser.add_argument('guild_id', type=int)
+    delete_parser.add_argument('--chunk-size', type=int, default=leveling_io.CHUNK_SIZE, help="Rows per statement")
+
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# utils/ai_channels.py
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BURST_SECONDS = 2.0  # Quiet time that ends a burst
+MAX_BURST_WAIT = 8.0  # A busy channel still gets an answer this soon after its first message
+MAX_BURST_MESSAGES = 10
+MAX_TURN_LENGTH = 1800  # Oldest lines are dropped past this many characters
+
+
+class BurstMessage:
+    __slots__ = ('speaker', 'text', 'message')
+
+    def __init__(self, speaker, text, message):
+        self.speaker = speaker
+        self.text = text
+        self.message = message
+
+
+def format_burst(burst, max_length=MAX_TURN_LENGTH):
+    """Join a burst into one speaker-labelled turn, merging consecutive lines by the same speaker"""
+    lines = []
+    for item in burst:
+        if lines and lines[-1][0] == item.speaker:
+            lines[-1] = (item.speaker, f"{lines[-1][1]}\n{item.text}")
+        else:
+            lines.append((item.speaker, item.text))
+    text = "\n".join(f"{speaker}: {line}" for speaker, line in lines)
+    if len(text) > max_length:
+        # Keep the end of the conversation; that's what the reply should address
+        text = text[-max_length:]
+        text = text[text.find("\n") + 1:] or text
+    return text
+
+
+class ChannelConversation:
+    """Collects a channel's messages into bursts and hands each burst to `handler`
+
+    A burst ends after `burst_seconds` without a new message, after
+    MAX_BURST_WAIT, or at MAX_BURST_MESSAGES. Only one burst per channel is
+    handled at a time; messages that arrive meanwhile form the next burst,
+    so a busy channel produces fewer, larger turns instead of a backlog.
+    """
+    def __init__(self, channel_id, handler, burst_seconds=DEFAULT_BURST_SECONDS, on_idle=None):
+        self.channel_id = channel_id
+        self.handler = handler
+        self.burst_seconds = burst_seconds
+        self.on_idle = on_idle
+        self.pending = []
+        self.first_at = None
+        self.last_at = None
+        self.arrived = asyncio.Event()
+        self.task = None
+        self.turns = 0
+        self.messages = 0
+
+    def add(self, speaker, text, message):
+        now = time.monotonic()
+        if not self.pending:
+            self.first_at = now
+        self.pending.append(BurstMessage(speaker, text, message))
+        self.last_at = now
+        self.messages += 1
+        self.arrived.set()
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+
+    def cancel(self):
+        if self.task:
+            self.task.cancel()
+
+    async def _wait_for_quiet(self):
+        while len(self.pending) < MAX_BURST_MESSAGES:
+            now = time.monotonic()
+            deadline = min(self.last_at + self.burst_seconds, self.first_at + MAX_BURST_WAIT)
+            if now >= deadline:
+                return
+            self.arrived.clear()
+            try:
+                await asyncio.wait_for(self.arrived.wait(), deadline - now)
+            except asyncio.TimeoutError:
+                return
+
+    async def _run(self):
+        try:
+            while self.pending:
+                await self._wait_for_quiet()
+                burst, self.pending = self.pending[:MAX_BURST_MESSAGES], self.pending[MAX_BURST_MESSAGES:]
+                if self.pending:
+                    self.first_at = time.monotonic()
+                self.turns += 1
+                try:
+                    await self.handler(burst)
+                except Exception as e:
+                    logger.error(f"Error handling AI burst in channel {self.channel_id}: {e}")
+        finally:
+            if self.on_idle and not self.pending:
+                self.on_idle(self)
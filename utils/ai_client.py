@@ -0,0 +1,253 @@
+# utils/ai_client.py
+import asyncio
+import hashlib
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+
+from PyCharacterAI import Client
+from PyCharacterAI.exceptions import ActionError, AuthenticationError, CreateError, InvalidArgumentError
+
+logger = logging.getLogger(__name__)
+
+READY_TIMEOUT = 5.0  # How long a request waits for a (re)connect in progress
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 300.0
+FAILURE_THRESHOLD = 5  # Consecutive transient failures that open the circuit
+RESET_TIMEOUT = 30.0  # Seconds the circuit stays open before a probe request
+DEFAULT_ACCOUNT_CONCURRENCY = 2  # Requests in flight per account
+
+# How an upstream error should be handled
+SESSION_ERROR = 'session'  # The chat itself is unusable; start a new one
+AUTH_ERROR = 'auth'  # Our token was rejected; re-authenticate
+REJECTED_ERROR = 'rejected'  # Upstream refused this message; nothing is broken
+TRANSIENT_ERROR = 'transient'  # Network, server or timeout; retry later with the same chat
+
+
+class AIUnavailable(Exception):
+    """Raised when no request should be sent upstream right now"""
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def account_name(token):
+    """Stable, non-secret name for the account behind a token"""
+    return hashlib.sha256(token.encode()).hexdigest()[:12]
+
+
+def classify_error(error):
+    """Decide whether an upstream error means a broken chat, bad auth or a passing problem"""
+    if isinstance(error, AuthenticationError):
+        return AUTH_ERROR
+    if isinstance(error, CreateError):
+        # No chat to reset; creating one failed upstream
+        return TRANSIENT_ERROR
+    if isinstance(error, ActionError):
+        if 'self harm' in str(error).lower():
+            return REJECTED_ERROR
+        return SESSION_ERROR
+    if isinstance(error, InvalidArgumentError):
+        return SESSION_ERROR
+    return TRANSIENT_ERROR
+
+
+class AIClientManager:
+    """Owns one authenticated Character.AI client
+
+    Authentication runs in the background with exponential backoff and is
+    repeated after auth errors or when the circuit opens. `acquire` waits
+    briefly for readiness and returns the client, or raises AIUnavailable.
+    A circuit breaker counts
+    consecutive transient failures; once it opens, requests fail fast until
+    a single probe request succeeds after RESET_TIMEOUT.
+    """
+    def __init__(self, token, client_factory=Client, failure_threshold=FAILURE_THRESHOLD,
+                 reset_timeout=RESET_TIMEOUT, max_concurrent=DEFAULT_ACCOUNT_CONCURRENCY):
+        self.token = token
+        self.name = account_name(token) if token else ''
+        self.max_concurrent = max(1, max_concurrent)
+        self.inflight = 0
+        self.limit = asyncio.Semaphore(self.max_concurrent)
+        self.client_factory = client_factory
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.client = None
+        self.ready = asyncio.Event()
+        self.connect_task = None
+        self.failures = 0
+        self.opened_at = None  # set while the circuit is open
+        self.probing = False
+
+    @property
+    def configured(self):
+        return bool(self.token)
+
+    @property
+    def state(self):
+        if not self.configured:
+            return 'disabled'
+        if self.opened_at is not None:
+            return 'open'
+        if not self.ready.is_set():
+            return 'connecting'
+        return 'ready'
+
+    def start(self):
+        """Begin authenticating in the background"""
+        if self.configured:
+            self._schedule_connect()
+
+    async def close(self):
+        if self.connect_task:
+            self.connect_task.cancel()
+        await self._close_client()
+
+    def _schedule_connect(self):
+        if self.connect_task and not self.connect_task.done():
+            return
+        self.ready.clear()
+        self.connect_task = asyncio.create_task(self._connect_loop())
+
+    async def _close_client(self):
+        if self.client is not None:
+            try:
+                await self.client.close_session()
+            except Exception as e:
+                logger.debug(f"Error closing Character.AI session: {e}")
+            self.client = None
+
+    async def _connect_loop(self):
+        attempt = 0
+        while True:
+            try:
+                await self._close_client()
+                client = self.client_factory()
+                await client.authenticate(self.token)
+                self.client = client
+                self.ready.set()
+                logger.info(f"Character.AI account {self.name} authenticated successfully!")
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Full jitter keeps several bots from retrying in lockstep
+                delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+                attempt += 1
+                logger.error(f"Error authenticating Character.AI account {self.name} (attempt {attempt}): {e}. Retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def lease(self):
+        """Hold one of this account's request slots"""
+        self.inflight += 1
+        try:
+            async with self.limit:
+                yield self
+        finally:
+            self.inflight -= 1
+
+    async def acquire(self, timeout=READY_TIMEOUT):
+        """Return the client if a request may be sent now, else raise AIUnavailable"""
+        if not self.configured:
+            raise AIUnavailable('disabled')
+        probe = False
+        if self.opened_at is not None:
+            if self.probing or time.monotonic() - self.opened_at < self.reset_timeout:
+                raise AIUnavailable('circuit_open')
+            # Half-open: let exactly one request through to test upstream
+            self.probing = probe = True
+        if not self.ready.is_set():
+            try:
+                await asyncio.wait_for(self.ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                if probe:
+                    self.probing = False
+                raise AIUnavailable('connecting')
+        return self.client
+
+    def record_success(self):
+        self.failures = 0
+        if self.opened_at is not None:
+            logger.info(f"Character.AI account {self.name} is succeeding again; closing circuit")
+        self.opened_at = None
+        self.probing = False
+
+    def record_failure(self, error):
+        """Account for a failed request and return its classification"""
+        kind = classify_error(error)
+        if kind == AUTH_ERROR:
+            logger.warning(f"Character.AI rejected the token for account {self.name}; re-authenticating")
+            self.probing = False
+            self._schedule_connect()
+        elif kind == TRANSIENT_ERROR:
+            self.failures += 1
+            if self.probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+                if self.opened_at is None:
+                    logger.warning(f"Opening Character.AI circuit for account {self.name} after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+                self.probing = False
+                # A long run of failures is often a dead connection; start a fresh one
+                self._schedule_connect()
+        else:
+            # The request reached a working upstream
+            self.record_success()
+        return kind
+
+
+class AIAccountPool:
+    """Routes requests across several Character.AI accounts
+
+    A chat only exists on the account that created it, so a session that
+    already has an account always goes back to it. New sessions go to the
+    healthy account with the fewest requests in flight. Each account keeps
+    its own readiness, circuit breaker and concurrency limit.
+    """
+    def __init__(self, tokens, client_factory=Client, max_concurrent=DEFAULT_ACCOUNT_CONCURRENCY):
+        self.accounts = {}
+        for token in tokens:
+            if token:
+                manager = AIClientManager(token, client_factory=client_factory, max_concurrent=max_concurrent)
+                self.accounts.setdefault(manager.name, manager)
+        # Sessions stored before accounts were tracked belong to the first token
+        self.primary = next(iter(self.accounts.values()), None)
+
+    @property
+    def configured(self):
+        return bool(self.accounts)
+
+    @property
+    def capacity(self):
+        return sum(account.max_concurrent for account in self.accounts.values())
+
+    def start(self):
+        for account in self.accounts.values():
+            account.start()
+
+    async def close(self):
+        for account in self.accounts.values():
+            await account.close()
+
+    def route(self, name=None):
+        """Return the account for a session's stored account name, or pick one for a new session
+
+        A name that no longer matches any configured token gets a new account,
+        and the caller must start a new chat. Raises AIUnavailable if no
+        account can take a new session.
+        """
+        if not self.accounts:
+            raise AIUnavailable('disabled')
+        if name in self.accounts:
+            return self.accounts[name]
+        if name == '':
+            return self.primary
+
+        candidates = [account for account in self.accounts.values() if account.state == 'ready']
+        if not candidates:
+            # Still authenticating: acquire() will wait briefly for one of these
+            candidates = [account for account in self.accounts.values() if account.state == 'connecting']
+        if not candidates:
+            raise AIUnavailable('circuit_open')
+        # Least loaded relative to its limit; random tie-break spreads bursts
+        return min(candidates, key=lambda account: (account.inflight / account.max_concurrent, random.random()))
@@ -0,0 +1,221 @@
+# utils/ai_pipeline.py
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+import discord
+
+from utils.ai_client import SESSION_ERROR, AIUnavailable
+from utils.ai_scheduler import SchedulerBusy
+from utils.ai_streaming import StreamingReply, stream_turns
+from utils.ai_warm_pool import DEFAULT_MAX_AGE_MINUTES, DEFAULT_POOL_SIZE, WarmChatPool
+from utils.metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 30.0  # Deadline for a whole request: queue, session and upstream
+SLOW_QUEUE_WAIT = 1.0  # Log requests that waited longer than this for a slot
+UPSTREAM_BLAME_SHARE = 0.5  # Share of the deadline upstream must have used for a timeout to count against the account
+
+# Stages timed for every request, in pipeline order
+STAGES = ('queue', 'session', 'first_token', 'upstream', 'render', 'total')
+
+
+class AIRequest:
+    """One message to answer: where it came from, which session it uses and how to reply"""
+    __slots__ = ('source', 'key', 'user_id', 'character_id', 'text', 'send')
+
+    def __init__(self, source, key, user_id, character_id, text, send):
+        self.source = source
+        self.key = key
+        self.user_id = user_id
+        self.character_id = character_id
+        self.text = text
+        self.send = send  # coroutine function: content -> sent message
+
+
+class AIResult:
+    """How a request ended
+
+    `outcome` is one of ok, empty, timeout, busy, unavailable or error;
+    `reason` refines busy, unavailable and timeout (which stage the
+    deadline hit: queue, session or upstream). `replied` tells whether any
+    text reached Discord (a timed out stream may still have shown some).
+    """
+    __slots__ = ('outcome', 'reason', 'replied', 'timings')
+
+    def __init__(self, outcome, reason=None, replied=False, timings=None):
+        self.outcome = outcome
+        self.reason = reason
+        self.replied = replied
+        self.timings = timings or {}
+
+
+class AIPipeline:
+    """The single path every AI message takes
+
+    Stages: wait for a scheduler slot, look up or create the chat session
+    on its account, stream the upstream reply, and render it to Discord.
+    Each stage's latency goes into a histogram and every failure into a
+    counter on `metrics`, so slow replies can be traced to a stage.
+    """
+    def __init__(self, scheduler, sessions, accounts, timeout=DEFAULT_TIMEOUT,
+                 warm_pool_size=DEFAULT_POOL_SIZE, warm_pool_max_age=DEFAULT_MAX_AGE_MINUTES, metrics=None):
+        self.scheduler = scheduler
+        self.sessions = sessions
+        self.accounts = accounts
+        self.timeout = timeout
+        self.warm_pool_size = warm_pool_size
+        self.warm_pool_max_age = warm_pool_max_age
+        self.metrics = metrics or Metrics()
+        # account name -> WarmChatPool for the default character. Guild
+        # overrides are too rarely used to be worth pre-creating chats for.
+        self.warm_pools = {}
+
+    def start(self, character_id):
+        """Start warming chats for the default character on every account"""
+        if not character_id:
+            return
+        for account in self.accounts.accounts.values():
+            pool = WarmChatPool(
+                account,
+                character_id,
+                size=self.warm_pool_size,
+                max_age_minutes=self.warm_pool_max_age,
+                # Only pre-create chats while no user request is waiting
+                can_refill=lambda: self.scheduler.queued == 0,
+            )
+            self.warm_pools[account.name] = pool
+            pool.start()
+
+    def stop(self):
+        for pool in self.warm_pools.values():
+            pool.stop()
+
+    def take_warm_chat(self, account, character_id):
+        """A pre-created chat on this account for the character, or None"""
+        pool = self.warm_pools.get(account.name)
+        return pool.take(character_id) if pool else None
+
+    async def record_error(self, account, key, error):
+        """Count a failed request and reset the chat only if the chat itself is broken"""
+        if isinstance(error, discord.DiscordException):
+            # Replies are only sent once upstream has answered
+            logger.error(f"Discord error while sending AI reply: {error}")
+            self.metrics.increment('errors.discord')
+            account.record_success()
+            return
+        kind = account.record_failure(error)
+        self.metrics.increment(f'errors.{kind}')
+        logger.error(f"Character.AI API error on account {account.name} ({kind}): {error!r}")
+        if kind == SESSION_ERROR:
+            await self.sessions.delete(key)
+
+    @asynccontextmanager
+    async def chat_session(self, key, user_id, character_id):
+        """Route a session to its account and yield (account, client, chat_id)
+
+        Holds one of the account's request slots while inside the block.
+        Upstream errors are classified against the account and re-raised.
+        """
+        session = await self.sessions.get(key, character_id)
+        if session is not None and session.account and session.account not in self.accounts.accounts:
+            # Its account's token was removed, so the chat is unreachable
+            session = None
+        account = self.accounts.route(session.account if session else None)
+
+        async with account.lease():
+            try:
+                client = await account.acquire()
+                if session is not None:
+                    chat_id = session.chat_id
+                else:
+                    # A pre-created chat saves a create_chat round trip on the first reply
+                    chat_id = self.take_warm_chat(account, character_id)
+                    self.metrics.increment('sessions.warm' if chat_id else 'sessions.created')
+                    if chat_id is None:
+                        chat, greeting = await client.chat.create_chat(character_id)
+                        chat_id = chat.chat_id
+                    await self.sessions.set(key, user_id, character_id, chat_id, account.name)
+                    logger.info(f"Started chat session {key} on account {account.name}: {chat_id}")
+                yield account, client, chat_id
+            except AIUnavailable:
+                raise
+            except Exception as e:
+                await self.record_error(account, key, e)
+                raise
+
+    async def run(self, request):
+        """Answer a request and return an AIResult; never raises for upstream problems"""
+        start = time.monotonic()
+        timings = {}
+        reply = StreamingReply(request.send)
+        result = AIResult('error', timings=timings)
+        try:
+            if not self.accounts.configured:
+                raise AIUnavailable('disabled')
+            if not request.character_id:
+                raise AIUnavailable('no_character')
+
+            # One deadline covers the queue, the session lookup and the reply, so
+            # a request stuck behind others still gets an answer in time
+            stage = 'queue'
+            timed_out = False
+            try:
+                async with asyncio.timeout(self.timeout):
+                    async with self.scheduler.slot(request.key) as ticket:
+                        timings['queue'] = ticket.wait
+                        if ticket.wait > SLOW_QUEUE_WAIT:
+                            stats = self.scheduler.stats()
+                            logger.info(
+                                f"AI request for {ticket.key} waited {ticket.wait:.1f}s in queue "
+                                f"(position {ticket.position}, running {stats['running']}, queued {stats['queued']})"
+                            )
+
+                        stage, stage_start = 'session', time.monotonic()
+                        async with self.chat_session(request.key, request.user_id, request.character_id) as (account, client, chat_id):
+                            stage, upstream_start = 'upstream', time.monotonic()
+                            timings['session'] = upstream_start - stage_start
+                            try:
+                                stream = await client.chat.send_message(request.character_id, chat_id, request.text, streaming=True)
+                                await stream_turns(stream, reply)
+                                account.record_success()
+                            finally:
+                                if reply.first_text_at is not None:
+                                    timings['first_token'] = reply.first_text_at - upstream_start
+                                # Discord sends made while streaming aren't upstream time
+                                timings['upstream'] = time.monotonic() - upstream_start - reply.discord_time
+            except TimeoutError as timeout_error:
+                timed_out = True
+                if stage == 'upstream' and time.monotonic() - upstream_start >= self.timeout * UPSTREAM_BLAME_SHARE:
+                    # A reply that ate most of the deadline is the account's fault;
+                    # one cut short because the queue used up the time is not
+                    account.record_failure(timeout_error)
+                self.metrics.increment(f'errors.timeout.{stage}')
+                logger.warning(f"{request.source} AI request for {request.key} timed out after {self.timeout:.0f}s in {stage}")
+
+            # Always show the final text, including what arrived before a timeout
+            await reply.finish()
+            timings['render'] = reply.discord_time
+            if timed_out:
+                result.outcome, result.reason = 'timeout', stage
+            elif not reply.started:
+                result.outcome = 'empty'
+            else:
+                result.outcome = 'ok'
+
+        except SchedulerBusy as busy:
+            result.outcome, result.reason = 'busy', busy.reason
+        except AIUnavailable as unavailable:
+            result.outcome, result.reason = 'unavailable', unavailable.reason
+        except Exception as e:
+            logger.error(f"Error handling {request.source} AI request: {e}")
+        finally:
+            result.replied = reply.started
+            timings['total'] = time.monotonic() - start
+            for stage, seconds in timings.items():
+                self.metrics.observe(stage, seconds)
+            self.metrics.increment(f'outcome.{result.outcome}')
+            self.metrics.increment(f'source.{request.source}')
+        return result
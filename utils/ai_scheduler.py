@@ -0,0 +1,139 @@
+# utils/ai_scheduler.py
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENT = 4
+DEFAULT_MAX_QUEUE = 50
+MAX_QUEUED_PER_KEY = 3
+WAIT_SAMPLES = 500
+
+
+class SchedulerBusy(Exception):
+    """Raised when a request can't be queued"""
+    def __init__(self, reason, queued):
+        super().__init__(reason)
+        self.reason = reason
+        self.queued = queued
+
+
+class Ticket:
+    """A granted slot; `wait` is how long the request sat in the queue"""
+    __slots__ = ('key', 'position', 'wait')
+
+    def __init__(self, key, position):
+        self.key = key
+        self.position = position
+        self.wait = 0.0
+
+
+class RequestScheduler:
+    """Global concurrency cap with one in-flight request per key and fair queueing
+
+    Each key (a chat session) has its own FIFO. Keys with waiting requests
+    take turns round-robin, so one chatty user can't starve everyone else,
+    and a key never has two requests running at once. The total number of
+    waiting requests is bounded; past that, `slot` raises SchedulerBusy
+    instead of letting latency grow without limit.
+    """
+    def __init__(self, max_concurrent=DEFAULT_MAX_CONCURRENT, max_queue=DEFAULT_MAX_QUEUE,
+                 max_per_key=MAX_QUEUED_PER_KEY):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max_queue
+        self.max_per_key = max_per_key
+        self.running = 0
+        self.queued = 0
+        self.active = set()  # keys with a request in flight
+        self.waiting = {}  # key -> deque of futures
+        self.rotation = deque()  # keys with waiters that may be granted, in turn order
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+        self.rejected = 0
+
+    def _dispatch(self):
+        while self.running < self.max_concurrent and self.rotation:
+            key = self.rotation.popleft()
+            waiters = self.waiting.get(key)
+            if not waiters:
+                self.waiting.pop(key, None)
+                continue
+            future = waiters.popleft()
+            if not waiters:
+                del self.waiting[key]
+            self.queued -= 1
+            self.running += 1
+            self.active.add(key)
+            future.set_result(None)
+
+    def _release(self, key):
+        self.running -= 1
+        self.active.discard(key)
+        if key in self.waiting:
+            self.rotation.append(key)
+        self._dispatch()
+
+    def _cancel_waiter(self, key, future):
+        waiters = self.waiting.get(key)
+        if waiters and future in waiters:
+            waiters.remove(future)
+            self.queued -= 1
+            if not waiters:
+                del self.waiting[key]
+                if key in self.rotation:
+                    self.rotation.remove(key)
+
+    @asynccontextmanager
+    async def slot(self, key):
+        """Wait for a turn for `key` and hold a concurrency slot while inside the block"""
+        start = time.monotonic()
+        waiters = self.waiting.get(key)
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise SchedulerBusy('queue_full', self.queued)
+        if waiters is not None and len(waiters) >= self.max_per_key:
+            self.rejected += 1
+            raise SchedulerBusy('too_many_pending', len(waiters))
+
+        ticket = Ticket(key, self.queued)
+        future = asyncio.get_running_loop().create_future()
+        if waiters is None:
+            self.waiting[key] = waiters = deque()
+            if key not in self.active:
+                self.rotation.append(key)
+        waiters.append(future)
+        self.queued += 1
+        self._dispatch()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as we were cancelled; give the slot back
+                self._release(key)
+            else:
+                self._cancel_waiter(key, future)
+            raise
+
+        ticket.wait = time.monotonic() - start
+        self.waits.append(ticket.wait)
+        try:
+            yield ticket
+        finally:
+            self._release(key)
+
+    def stats(self):
+        """Current load and queue wait percentiles in seconds"""
+        waits = sorted(self.waits)
+        def percentile(p):
+            return waits[min(len(waits) - 1, int(len(waits) * p))] if waits else 0.0
+        return {
+            'running': self.running,
+            'queued': self.queued,
+            'rejected': self.rejected,
+            'wait_p50': percentile(0.50),
+            'wait_p95': percentile(0.95),
+            'wait_max': waits[-1] if waits else 0.0,
+        }
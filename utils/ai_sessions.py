@@ -0,0 +1,228 @@
+# utils/ai_sessions.py
+import logging
+import time
+from collections import OrderedDict
+
+from utils.database import get_database
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'database/ai_chat.db'
+
+# How a conversation is scoped: one chat per user everywhere, per user per
+# guild, or per user per channel. DMs always fall back to per user.
+SCOPES = ('user', 'guild', 'channel')
+DEFAULT_SCOPE = 'user'
+DEFAULT_TTL_HOURS = 72
+MAX_CACHED_SESSIONS = 1024
+
+MIGRATIONS = [
+    # 1: initial schema
+    '''
+    CREATE TABLE IF NOT EXISTS chat_sessions (
+        session_key TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        character_id TEXT NOT NULL,
+        chat_id TEXT NOT NULL,
+        last_used REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_chat_sessions_user ON chat_sessions (user_id);
+    CREATE INDEX IF NOT EXISTS idx_chat_sessions_last_used ON chat_sessions (last_used);
+    ''',
+    # 2: multiple accounts and per-guild characters
+    '''
+    ALTER TABLE chat_sessions ADD COLUMN account TEXT NOT NULL DEFAULT '';
+    CREATE TABLE IF NOT EXISTS guild_ai_settings (
+        guild_id INTEGER PRIMARY KEY,
+        character_id TEXT
+    );
+    ''',
+    # 3: designated AI chat channels
+    '''
+    ALTER TABLE guild_ai_settings ADD COLUMN chat_channel_id INTEGER;
+    ''',
+]
+
+SELECT_SESSION_SQL = '''
+    SELECT user_id, character_id, chat_id, last_used, account FROM chat_sessions WHERE session_key = ?
+'''
+UPSERT_SESSION_SQL = '''
+    INSERT INTO chat_sessions (session_key, user_id, character_id, chat_id, last_used, account)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(session_key) DO UPDATE SET
+        user_id = excluded.user_id,
+        character_id = excluded.character_id,
+        chat_id = excluded.chat_id,
+        last_used = excluded.last_used,
+        account = excluded.account
+'''
+TOUCH_SESSION_SQL = 'UPDATE chat_sessions SET last_used = MAX(last_used, ?) WHERE session_key = ?'
+DELETE_SESSION_SQL = 'DELETE FROM chat_sessions WHERE session_key = ?'
+DELETE_IDLE_SQL = 'DELETE FROM chat_sessions WHERE last_used < ?'
+SELECT_GUILD_CHARACTERS_SQL = 'SELECT guild_id, character_id FROM guild_ai_settings WHERE character_id IS NOT NULL'
+UPSERT_GUILD_CHARACTER_SQL = '''
+    INSERT INTO guild_ai_settings (guild_id, character_id) VALUES (?, ?)
+    ON CONFLICT(guild_id) DO UPDATE SET character_id = excluded.character_id
+'''
+SELECT_CHAT_CHANNELS_SQL = 'SELECT guild_id, chat_channel_id FROM guild_ai_settings WHERE chat_channel_id IS NOT NULL'
+UPSERT_CHAT_CHANNEL_SQL = '''
+    INSERT INTO guild_ai_settings (guild_id, chat_channel_id) VALUES (?, ?)
+    ON CONFLICT(guild_id) DO UPDATE SET chat_channel_id = excluded.chat_channel_id
+'''
+
+
+def with_character(key, character_id):
+    """Suffix a key with a character override, so each character keeps its own conversation"""
+    return f'{key}:ch:{character_id}' if character_id else key
+
+
+def channel_session_key(channel_id, character_id=None):
+    """Storage key for a conversation shared by everyone in a channel"""
+    return with_character(f'chan:{channel_id}', character_id)
+
+
+def session_key(scope, user_id, guild_id=None, channel_id=None, character_id=None):
+    """Build the storage key for a user's conversation in the given scope
+
+    `character_id` is only passed for guild character overrides; keys for
+    the default character stay unsuffixed.
+    """
+    if scope == 'channel' and channel_id is not None and guild_id is not None:
+        key = f'c:{channel_id}:u:{user_id}'
+    elif scope in ('guild', 'channel') and guild_id is not None:
+        key = f'g:{guild_id}:u:{user_id}'
+    else:
+        key = f'u:{user_id}'
+    return with_character(key, character_id)
+
+
+class ChatSession:
+    """A stored chat id, the account it lives on and when it was last used"""
+    __slots__ = ('user_id', 'character_id', 'chat_id', 'last_used', 'account')
+
+    def __init__(self, user_id, character_id, chat_id, last_used, account=''):
+        self.user_id = user_id
+        self.character_id = character_id
+        self.chat_id = chat_id
+        self.last_used = last_used
+        self.account = account
+
+
+class ChatSessionStore:
+    """Persistent session_key -> chat id mapping with an LRU front and idle expiry
+
+    Sessions are loaded lazily from SQLite on first use and kept in a bounded
+    in-memory LRU. Last-used times are updated in memory and written back in
+    batches by `flush`. Sessions idle for longer than the TTL are treated as
+    gone and removed by `evict_idle`.
+    """
+    def __init__(self, path=None, scope=DEFAULT_SCOPE, ttl_hours=DEFAULT_TTL_HOURS,
+                 max_cached=MAX_CACHED_SESSIONS):
+        if scope not in SCOPES:
+            logger.warning(f"Unknown AI session scope '{scope}', using '{DEFAULT_SCOPE}'")
+            scope = DEFAULT_SCOPE
+        self.db = get_database(path or DB_PATH, MIGRATIONS)
+        self.scope = scope
+        self.ttl = ttl_hours * 3600
+        self.max_cached = max_cached
+        self.cache = OrderedDict()  # session_key -> ChatSession
+        self.dirty = {}  # session_key -> last_used, written on the next flush
+
+    async def open(self):
+        await self.db.open()
+
+    async def close(self):
+        await self.flush()
+        await self.db.close()
+
+    def key_for(self, user_id, guild_id=None, channel_id=None, character_id=None):
+        return session_key(self.scope, user_id, guild_id, channel_id, character_id)
+
+    def _expired(self, session, now):
+        return self.ttl > 0 and session.last_used + self.ttl < now
+
+    def _remember(self, key, session):
+        self.cache[key] = session
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.max_cached:
+            old_key, _ = self.cache.popitem(last=False)
+            # Evicted from memory only; its last_used is still in self.dirty
+            logger.debug(f"Dropped AI session {old_key} from cache")
+
+    async def get(self, key, character_id):
+        """Return the ChatSession for a key, or None if missing, expired or for another character
+
+        A session for another character is left alone; keys carry guild
+        overrides, so a mismatch only means the default character changed
+        and `set` will replace it.
+        """
+        now = time.time()
+        session = self.cache.get(key)
+        if session is None:
+            row = await self.db.fetchone(SELECT_SESSION_SQL, (key,))
+            if row is None:
+                return None
+            session = ChatSession(row[0], row[1], row[2], max(row[3], self.dirty.get(key, 0)), row[4])
+
+        if self._expired(session, now):
+            await self.delete(key)
+            return None
+        if session.character_id != character_id:
+            return None
+
+        session.last_used = now
+        self.dirty[key] = now
+        self._remember(key, session)
+        return session
+
+    async def set(self, key, user_id, character_id, chat_id, account=''):
+        """Store a new chat id for a key, replacing any previous one"""
+        now = time.time()
+        self._remember(key, ChatSession(user_id, character_id, chat_id, now, account))
+        self.dirty.pop(key, None)
+        await self.db.execute(UPSERT_SESSION_SQL, (key, user_id, character_id, chat_id, now, account))
+
+    async def delete(self, key):
+        """Forget a session; returns True if one was stored"""
+        self.cache.pop(key, None)
+        self.dirty.pop(key, None)
+        return await self.db.execute(DELETE_SESSION_SQL, (key,)) > 0
+
+    async def flush(self):
+        """Write batched last-used times"""
+        if not self.dirty:
+            return
+        rows = [(last_used, key) for key, last_used in self.dirty.items()]
+        self.dirty = {}
+        try:
+            await self.db.executemany(TOUCH_SESSION_SQL, rows)
+        except Exception:
+            for last_used, key in rows:
+                self.dirty.setdefault(key, last_used)
+            raise
+
+    async def evict_idle(self):
+        """Delete sessions idle for longer than the TTL; returns how many were removed"""
+        if self.ttl <= 0:
+            return 0
+        await self.flush()
+        cutoff = time.time() - self.ttl
+        for key in [key for key, session in self.cache.items() if session.last_used < cutoff]:
+            del self.cache[key]
+        return await self.db.execute(DELETE_IDLE_SQL, (cutoff,))
+
+    async def load_guild_characters(self):
+        """Return guild_id -> character id overrides"""
+        return dict(await self.db.fetchall(SELECT_GUILD_CHARACTERS_SQL))
+
+    async def set_guild_character(self, guild_id, character_id):
+        """Set or, with None, clear a guild's character override"""
+        await self.db.execute(UPSERT_GUILD_CHARACTER_SQL, (guild_id, character_id or None))
+
+    async def load_chat_channels(self):
+        """Return guild_id -> designated AI chat channel id"""
+        return dict(await self.db.fetchall(SELECT_CHAT_CHANNELS_SQL))
+
+    async def set_chat_channel(self, guild_id, channel_id):
+        """Set or, with None, clear a guild's designated AI chat channel"""
+        await self.db.execute(UPSERT_CHAT_CHANNEL_SQL, (guild_id, channel_id))
@@ -0,0 +1,119 @@
+# utils/ai_streaming.py
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_LIMIT = 2000
+# Discord allows about 5 edits per 5 seconds per channel; stay under it so
+# edits never queue up behind the rate limiter
+EDIT_INTERVAL = 1.2
+# Look this far back from the limit for a newline or space to split on
+SPLIT_WINDOW = 300
+
+
+def split_point(text, limit=MESSAGE_LIMIT):
+    """Index to cut text at so the first part fits in one message"""
+    if len(text) <= limit:
+        return len(text)
+    window_start = limit - SPLIT_WINDOW
+    for separator in ('\n', ' '):
+        index = text.rfind(separator, window_start, limit)
+        if index > 0:
+            return index + 1
+    return limit
+
+
+def split_message(text, limit=MESSAGE_LIMIT):
+    """Split text into message-sized chunks, preferring line and word breaks
+
+    Only text inside the first `limit` characters decides each cut, so as a
+    streamed reply grows, chunks that are already complete never change.
+    """
+    chunks = []
+    while len(text) > limit:
+        cut = split_point(text, limit)
+        chunks.append(text[:cut])
+        text = text[cut:]
+    chunks.append(text)
+    return chunks
+
+
+class StreamingReply:
+    """Show a growing reply by sending one message and editing it as text arrives
+
+    `send` is a coroutine function taking the content and returning the sent
+    message. Edits to the last message are coalesced to at most one per
+    EDIT_INTERVAL. Text past 2000 characters continues in follow-up messages;
+    earlier messages get one last edit with their final content.
+    """
+    def __init__(self, send, edit_interval=EDIT_INTERVAL):
+        self.send = send
+        self.edit_interval = edit_interval
+        self.messages = []
+        self.shown = []  # content currently displayed in each message
+        self.text = ''
+        self.last_edit = 0.0
+        self.edits = 0
+        self.first_text_at = None  # monotonic time the first text arrived
+        self.discord_time = 0.0  # seconds spent waiting on Discord sends and edits
+
+    async def update(self, text):
+        """Record the full text so far and refresh the messages if it's time"""
+        if self.first_text_at is None and text.strip():
+            self.first_text_at = time.monotonic()
+        self.text = text
+        await self._timed_sync(final=False)
+
+    async def finish(self, text=None):
+        """Show the complete text, ignoring the edit interval"""
+        if text is not None:
+            self.text = text
+        await self._timed_sync(final=True)
+
+    async def _timed_sync(self, final):
+        start = time.monotonic()
+        try:
+            await self._sync(final)
+        finally:
+            self.discord_time += time.monotonic() - start
+
+    @property
+    def started(self):
+        return bool(self.messages)
+
+    async def _sync(self, final):
+        if not self.text.strip():
+            return
+        chunks = split_message(self.text)
+        for index, chunk in enumerate(chunks):
+            if index >= len(self.messages):
+                self.messages.append(await self.send(chunk))
+                self.shown.append(chunk)
+                self.last_edit = time.monotonic()
+                continue
+            if self.shown[index] == chunk:
+                continue
+            # Messages before the last are complete and get their final text now;
+            # the last one only when the interval has passed or we're done
+            is_last = index == len(chunks) - 1
+            if is_last and not final and time.monotonic() - self.last_edit < self.edit_interval:
+                continue
+            try:
+                await self.messages[index].edit(content=chunk)
+                self.shown[index] = chunk
+                self.last_edit = time.monotonic()
+                self.edits += 1
+            except Exception as e:
+                logger.error(f"Error editing streamed reply: {e}")
+
+
+async def stream_turns(stream, reply):
+    """Feed a PyCharacterAI streaming response into a StreamingReply; returns the last text"""
+    text = ''
+    async for turn in stream:
+        candidate = turn.get_primary_candidate()
+        if candidate and candidate.text:
+            text = candidate.text
+            await reply.update(text)
+    return text
@@ -0,0 +1,106 @@
+# utils/ai_warm_pool.py
+import asyncio
+import logging
+import time
+from collections import deque
+
+from utils.ai_client import AIUnavailable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 3
+DEFAULT_MAX_AGE_MINUTES = 60
+CREATE_SPACING = 1.0  # Seconds between background create_chat calls
+FAILURE_RETRY = 30.0
+BUSY_RETRY = 5.0
+
+
+class WarmChatPool:
+    """Keeps a few freshly created chats ready for first-time users
+
+    `take` hands out a pre-created chat id without touching the network. A
+    background task refills the pool to `size`, one create_chat at a time
+    under one of the account's request slots, and only while `can_refill()`
+    says upstream capacity is free, so refills never compete with queued
+    user requests. Chats older than `max_age` are discarded unused.
+    """
+    def __init__(self, ai, character_id, size=DEFAULT_POOL_SIZE,
+                 max_age_minutes=DEFAULT_MAX_AGE_MINUTES, can_refill=lambda: True):
+        self.ai = ai
+        self.character_id = character_id
+        self.size = max(0, size)
+        self.max_age = max_age_minutes * 60
+        self.can_refill = can_refill
+        self.chats = deque()  # (chat_id, created_at), oldest first
+        self.wanted = asyncio.Event()
+        self.task = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.size > 0 and bool(self.character_id) and self.ai.configured
+
+    def start(self):
+        if self.enabled:
+            self.wanted.set()
+            self.task = asyncio.create_task(self._refill_loop())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    def _drop_expired(self):
+        cutoff = time.monotonic() - self.max_age
+        while self.chats and self.chats[0][1] < cutoff:
+            self.chats.popleft()
+
+    def take(self, character_id):
+        """Return a warm chat id for this character, or None if none is ready"""
+        if not self.enabled or character_id != self.character_id:
+            return None
+        self._drop_expired()
+        self.wanted.set()
+        if not self.chats:
+            self.misses += 1
+            return None
+        self.hits += 1
+        chat_id, _ = self.chats.popleft()
+        return chat_id
+
+    def _next_expiry(self):
+        if not self.chats:
+            return None
+        return max(0.0, self.chats[0][1] + self.max_age - time.monotonic())
+
+    async def _refill_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wanted.wait(), self._next_expiry())
+            except asyncio.TimeoutError:
+                pass
+            self.wanted.clear()
+            self._drop_expired()
+
+            while len(self.chats) < self.size:
+                if not self.can_refill():
+                    await asyncio.sleep(BUSY_RETRY)
+                    continue
+                try:
+                    # Refills count against the account's request limit like any user request
+                    async with self.ai.lease():
+                        client = await self.ai.acquire()
+                        chat, greeting = await client.chat.create_chat(self.character_id)
+                    self.ai.record_success()
+                    self.chats.append((chat.chat_id, time.monotonic()))
+                    logger.debug(f"Warm chat pool: {len(self.chats)}/{self.size}")
+                except asyncio.CancelledError:
+                    raise
+                except AIUnavailable:
+                    await asyncio.sleep(FAILURE_RETRY)
+                except Exception as e:
+                    self.ai.record_failure(e)
+                    logger.error(f"Error pre-creating chat: {e}")
+                    await asyncio.sleep(FAILURE_RETRY)
+                    continue
+                await asyncio.sleep(CREATE_SPACING)
@@ -0,0 +1,93 @@
+# utils/announce_store.py
+import time
+
+from utils.database import get_database
+
+DB_PATH = 'database/announcements.db'
+
+MIGRATIONS = [
+    # 1: initial schema
+    '''
+    CREATE TABLE IF NOT EXISTS announce_jobs (
+        job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        message TEXT NOT NULL,
+        author_name TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'running',
+        created_at REAL NOT NULL,
+        finished_at REAL,
+        progress_channel_id INTEGER,
+        progress_message_id INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS announce_deliveries (
+        job_id INTEGER NOT NULL,
+        guild_id INTEGER NOT NULL,
+        outcome TEXT,
+        PRIMARY KEY (job_id, guild_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_announce_deliveries_pending
+        ON announce_deliveries (job_id) WHERE outcome IS NULL;
+    ''',
+]
+
+INSERT_JOB_SQL = '''
+    INSERT INTO announce_jobs (message, author_name, created_at) VALUES (?, ?, ?)
+'''
+INSERT_TARGET_SQL = 'INSERT OR IGNORE INTO announce_deliveries (job_id, guild_id) VALUES (?, ?)'
+SET_PROGRESS_MESSAGE_SQL = '''
+    UPDATE announce_jobs SET progress_channel_id = ?, progress_message_id = ? WHERE job_id = ?
+'''
+SELECT_RUNNING_JOBS_SQL = '''
+    SELECT job_id, message, author_name, progress_channel_id, progress_message_id
+    FROM announce_jobs WHERE status = 'running' ORDER BY job_id
+'''
+SELECT_PENDING_SQL = 'SELECT guild_id FROM announce_deliveries WHERE job_id = ? AND outcome IS NULL'
+SELECT_OUTCOMES_SQL = 'SELECT outcome, COUNT(*) FROM announce_deliveries WHERE job_id = ? GROUP BY outcome'
+RECORD_OUTCOME_SQL = 'UPDATE announce_deliveries SET outcome = ? WHERE job_id = ? AND guild_id = ?'
+FINISH_JOB_SQL = 'UPDATE announce_jobs SET status = ?, finished_at = ? WHERE job_id = ?'
+
+
+class AnnouncementStore:
+    """Announcement jobs and, per job, which guilds have been handled
+
+    Every target guild gets a row when the job is created; its outcome stays
+    NULL until delivery was attempted, so the pending rows are the checkpoint
+    a job resumes from after a restart.
+    """
+    def __init__(self, path=None):
+        self.db = get_database(path or DB_PATH, MIGRATIONS)
+
+    async def open(self):
+        await self.db.open()
+
+    async def close(self):
+        await self.db.close()
+
+    async def create_job(self, message, author_name, guild_ids):
+        """Create a job targeting `guild_ids` and return its id"""
+        def _create(conn):
+            job_id = conn.execute(INSERT_JOB_SQL, (message, author_name, time.time())).lastrowid
+            conn.executemany(INSERT_TARGET_SQL, [(job_id, guild_id) for guild_id in guild_ids])
+            return job_id
+
+        return await self.db.write(_create)
+
+    async def set_progress_message(self, job_id, channel_id, message_id):
+        await self.db.execute(SET_PROGRESS_MESSAGE_SQL, (channel_id, message_id, job_id))
+
+    async def running_jobs(self):
+        """(job_id, message, author_name, progress_channel_id, progress_message_id) of unfinished jobs"""
+        return await self.db.fetchall(SELECT_RUNNING_JOBS_SQL)
+
+    async def pending_guilds(self, job_id):
+        return [row[0] for row in await self.db.fetchall(SELECT_PENDING_SQL, (job_id,))]
+
+    async def outcome_counts(self, job_id):
+        """outcome -> number of guilds; None counts the guilds still pending"""
+        return dict(await self.db.fetchall(SELECT_OUTCOMES_SQL, (job_id,)))
+
+    async def record_outcomes(self, job_id, outcomes):
+        """Checkpoint (guild_id, outcome) pairs"""
+        await self.db.executemany(RECORD_OUTCOME_SQL, [(outcome, job_id, guild_id) for guild_id, outcome in outcomes])
+
+    async def finish_job(self, job_id, status='done'):
+        await self.db.execute(FINISH_JOB_SQL, (status, time.time(), job_id))
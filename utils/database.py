@@ -0,0 +1,177 @@
+# utils/database.py
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Connection tuning applied to every connection we open
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",  # Safe with WAL, avoids an fsync per commit
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",  # ~16 MB page cache per connection
+    "PRAGMA busy_timeout = 5000",
+)
+
+# Compiled statements kept per connection. Keep SQL in module-level constants
+# so the same text is reused and hits this cache instead of being re-prepared.
+STATEMENT_CACHE_SIZE = 256
+DEFAULT_READERS = 4
+
+# Open databases by absolute path, so cogs sharing a file share one writer
+_databases = {}
+
+
+def get_database(path, migrations=(), readers=DEFAULT_READERS):
+    """Return the shared Database for a file, creating it on first use"""
+    key = os.path.abspath(path)
+    db = _databases.get(key)
+    if db is None or db.closed:
+        db = Database(path, migrations, readers=readers)
+        _databases[key] = db
+    return db
+
+
+class Database:
+    """SQLite database with a dedicated writer thread and a pool of reader threads
+
+    Every connection is long-lived and runs in WAL mode, so readers never wait
+    on the writer. All methods are coroutines that run the actual SQLite work
+    off the event loop.
+
+    `migrations` is an ordered list of SQL scripts. Script N (1-based) is
+    applied once when the database's `user_version` is below N.
+    """
+    def __init__(self, path, migrations=(), readers=DEFAULT_READERS):
+        self.path = path
+        self.migrations = list(migrations)
+        self.closed = False
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='db-reader')
+        self._opened = None
+
+    def _connect(self):
+        """Open a tuned connection for the current thread (called lazily per thread)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path,
+                isolation_level=None,  # We manage transactions explicitly
+                check_same_thread=False,
+                cached_statements=STATEMENT_CACHE_SIZE,
+            )
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _migrate(self):
+        """Apply pending migrations on the writer thread"""
+        conn = self._connect()
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, script in enumerate(self.migrations, 1):
+            if number <= version:
+                continue
+            logger.info(f"Applying migration {number} to {self.path}")
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for statement in _split_script(script):
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {number}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    async def open(self):
+        """Create the database file if needed and bring its schema up to date"""
+        if self._opened is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            loop = asyncio.get_event_loop()
+            self._opened = loop.run_in_executor(self._writer, self._migrate)
+        await self._opened
+
+    async def close(self):
+        """Wait for queued work, then close every connection"""
+        if self.closed:
+            return
+        self.closed = True
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self._shutdown)
+
+    def _shutdown(self):
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except Exception as e:
+                    logger.error(f"Error closing connection to {self.path}: {e}")
+            self._connections.clear()
+
+    async def write(self, func, *args):
+        """Run func(conn, *args) in a transaction on the writer thread"""
+        def _run():
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(conn, *args)
+                conn.execute("COMMIT")
+                return result
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        await self.open()
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._writer, _run)
+
+    async def read(self, func, *args):
+        """Run func(conn, *args) on one of the reader threads"""
+        def _run():
+            return func(self._connect(), *args)
+
+        await self.open()
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._readers, _run)
+
+    async def execute(self, sql, params=()):
+        """Run a single write statement and return the number of affected rows"""
+        return await self.write(lambda conn: conn.execute(sql, params).rowcount)
+
+    async def executemany(self, sql, rows):
+        """Run a write statement for every row in one transaction"""
+        return await self.write(lambda conn: conn.executemany(sql, rows).rowcount)
+
+    async def fetchone(self, sql, params=()):
+        return await self.read(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql, params=()):
+        return await self.read(lambda conn: conn.execute(sql, params).fetchall())
+
+
+def _split_script(script):
+    """Split a migration script into complete statements"""
+    statements = []
+    current = ""
+    for line in script.splitlines(keepends=True):
+        current += line
+        if sqlite3.complete_statement(current):
+            if current.strip():
+                statements.append(current.strip())
+            current = ""
+    if current.strip():
+        statements.append(current.strip())
+    return statements
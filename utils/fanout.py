@@ -0,0 +1,117 @@
+# utils/fanout.py
+import asyncio
+import logging
+import random
+
+import aiohttp
+import discord
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 10  # Sends in flight across all channels
+DEFAULT_ATTEMPTS = 3
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+
+# Delivery outcomes. missing and forbidden won't fix themselves by retrying.
+SENT = 'sent'
+MISSING = 'missing'
+FORBIDDEN = 'forbidden'
+FAILED = 'failed'
+
+
+class Delivery:
+    """How sending to one channel went"""
+    __slots__ = ('channel_id', 'outcome', 'attempts', 'error', 'message')
+
+    def __init__(self, channel_id):
+        self.channel_id = channel_id
+        self.outcome = None
+        self.attempts = 0
+        self.error = None
+        self.message = None
+
+
+def retry_delay(attempt, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+    """Exponential backoff with full jitter, so retries from many channels spread out"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def classify_send_error(error):
+    """Return (outcome, retryable) for an exception raised while sending"""
+    if isinstance(error, discord.NotFound):
+        return MISSING, False
+    if isinstance(error, discord.Forbidden):
+        return FORBIDDEN, False
+    if isinstance(error, discord.HTTPException):
+        # Server errors and rate limits discord.py gave up waiting on are worth another try
+        return FAILED, error.status >= 500 or error.status == 429
+    if isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError, OSError)):
+        return FAILED, True
+    return FAILED, False
+
+
+class FanoutDispatcher:
+    """Sends one message to many channels with bounded concurrency
+
+    Work is grouped by rate-limit bucket: Discord limits message sends per
+    channel, so sends to the same channel run one after another while
+    different channels proceed in parallel, at most `max_concurrent` at a
+    time. Retryable failures are retried with jittered exponential backoff;
+    missing and forbidden channels fail immediately.
+    """
+    def __init__(self, bot, max_concurrent=DEFAULT_CONCURRENCY, max_attempts=DEFAULT_ATTEMPTS,
+                 base_delay=RETRY_BASE_DELAY):
+        self.bot = bot
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def resolve(self, channel_id):
+        """Cached channel, falling back to the API for channels not in the cache"""
+        channel = self.bot.get_channel(channel_id)
+        if channel is None:
+            channel = await self.bot.fetch_channel(channel_id)
+        return channel
+
+    async def deliver(self, channel_id, content=None, **kwargs):
+        """Send to one channel, retrying transient failures; returns a Delivery"""
+        delivery = Delivery(channel_id)
+        while True:
+            delivery.attempts += 1
+            try:
+                async with self.semaphore:
+                    channel = await self.resolve(channel_id)
+                    delivery.message = await channel.send(content, **kwargs)
+                delivery.outcome = SENT
+                return delivery
+            except Exception as e:
+                outcome, retryable = classify_send_error(e)
+                delivery.outcome, delivery.error = outcome, e
+                if not retryable or delivery.attempts >= self.max_attempts:
+                    return delivery
+                delay = retry_delay(delivery.attempts - 1, self.base_delay)
+                retry_after = getattr(e, 'retry_after', None)
+                if retry_after:
+                    delay = max(delay, retry_after)
+                logger.debug(f"Retrying send to channel {channel_id} in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+
+    async def _deliver_bucket(self, channel_id, sends, results):
+        for content, kwargs in sends:
+            results.append(await self.deliver(channel_id, content, **kwargs))
+
+    async def send(self, channel_ids, content=None, **kwargs):
+        """Send the same message to every channel; returns one Delivery per channel id"""
+        return await self.send_many([(channel_id, content, kwargs) for channel_id in channel_ids])
+
+    async def send_many(self, sends):
+        """Deliver (channel_id, content, kwargs) items, serialized per channel; returns Deliveries"""
+        buckets = {}
+        for channel_id, content, kwargs in sends:
+            buckets.setdefault(int(channel_id), []).append((content, kwargs))
+        results = []
+        await asyncio.gather(*(
+            self._deliver_bucket(channel_id, bucket, results) for channel_id, bucket in buckets.items()
+        ))
+        return results
@@ -0,0 +1,133 @@
+# utils/gunsmoke_schedule.py
+from datetime import datetime, timedelta
+
+import pytz
+
+JAKARTA_TZ = pytz.timezone('Asia/Jakarta')
+RESET_HOUR = 16  # 4 PM in Jakarta time
+
+EVENT_LENGTH = timedelta(days=7)  # Gunsmoke lasts 1 week
+CYCLE_LENGTH = timedelta(days=28)  # ...and the next one starts 3 weeks after it ends
+WARNING_BEFORE_END = timedelta(hours=3)
+RESET_WINDOW = timedelta(minutes=10)  # A reset notice later than this is stale
+
+# Events at the same instant fire in this order
+KINDS = ('upcoming', 'day', 'warning', 'reset', 'reschedule')
+
+# Keyed by days remaining, including today
+DAY_MESSAGES = {
+    7: ("First Day of Gunsmoke Frontline!",
+        "Everyone, it's time to shine! Let's make today count and score some points!\nRemember, Gunsmoke ends 3 hours before reset."),
+    6: ("Second Day of Gunsmoke Frontline!",
+        "Keep up the great work and aim for even higher scores!\nRemember, Gunsmoke ends 3 hours before reset."),
+    5: ("Third Day of Gunsmoke Frontline!",
+        "Let's push for even better results today!\nRemember, Gunsmoke ends 3 hours before reset."),
+    4: ("Fourth Day of Gunsmoke Frontline!",
+        "Let's aim for some great scores today!\nRemember, Gunsmoke ends 3 hours before reset."),
+    3: ("Fifth Day of Gunsmoke Frontline!",
+        "Let's make the most of today and aim for some great scores!\nRemember, Gunsmoke ends 3 hours before reset."),
+    2: ("Sixth Day of Gunsmoke Frontline!",
+        "Let's make today count and aim for some great scores!\nRemember, Gunsmoke ends 3 hours before reset."),
+    1: ("Last Day of Gunsmoke Frontline!",
+        "It's the final day! Let's make it count and aim for some great scores!\nRemember, Gunsmoke ends 3 hours before reset.")
+}
+
+# Keyed by whole days until the start
+UPCOMING_MESSAGES = {
+    2: ("Gunsmoke Frontline is coming in 2 days!",
+        "Everyone, get ready to shine! Let's make the most of this event and aim for some great scores!"),
+    1: ("Gunsmoke Frontline is coming tomorrow!",
+        "Everyone, get ready to shine! Let's make the most of this event and aim for some great scores!"),
+    0: ("Gunsmoke Frontline is starting today!",
+        "Everyone, get ready to shine! Let's make the most of this event and aim for some great scores!")
+}
+
+WARNING_MESSAGE = (
+    "**Gunsmoke Frontline Warning!**\n\n"
+    "Keep in mind that Gunsmoke ends 3 hours before reset! "
+    "Make sure to finish your runs before the event closes!"
+)
+RESET_MESSAGE = (
+    "**Gunsmoke is Reset. Good Work everyone! :D**\n\n"
+    "Let's do our best for today too! Time to score some points!"
+)
+
+
+def parse_start(value):
+    """Parse a stored start time as an aware Jakarta datetime"""
+    start = datetime.fromisoformat(value)
+    if start.tzinfo is None:
+        return JAKARTA_TZ.localize(start)
+    return start.astimezone(JAKARTA_TZ)
+
+
+def next_start_after(start, now):
+    """Start of the first cycle after `start` that hasn't ended by `now`"""
+    next_start = start + CYCLE_LENGTH
+    while next_start + EVENT_LENGTH <= now:
+        next_start += CYCLE_LENGTH
+    return next_start
+
+
+def reschedule_message(next_start):
+    return (
+        f"**Next Gunsmoke Frontline scheduled!**\n\n"
+        f"Next event starts: **{next_start.strftime('%Y-%m-%d %H:%M')} (UTC+7) Time**\n"
+        f"Get ready Everyone!"
+    )
+
+
+class GunsmokeEvent:
+    """One notification on the timeline
+
+    Ordered by time, then by KINDS. `key` is what gets persisted to remember
+    how far the timeline has been processed. An event still pending at
+    `expires` was missed (the bot was down) and is skipped instead of sent
+    late; reschedule events never expire.
+    """
+    __slots__ = ('at', 'kind', 'message', 'expires', 'key')
+
+    def __init__(self, at, kind, message=None, expires=None):
+        self.at = at
+        self.kind = kind
+        self.message = message
+        self.expires = expires
+        self.key = (int(at.timestamp()), KINDS.index(kind))
+
+    def __lt__(self, other):
+        return self.key < other.key
+
+    def __repr__(self):
+        return f"<GunsmokeEvent {self.kind} at {self.at.isoformat()}>"
+
+
+def cycle_events(start):
+    """Every notification for the gunsmoke starting at `start`"""
+    day = timedelta(days=1)
+    end = start + EVENT_LENGTH
+    events = []
+    for days_until, (title, text) in UPCOMING_MESSAGES.items():
+        # Same moments the old polling loop picked: when whole days left drops to days_until
+        at = start - (days_until + 1) * day
+        events.append(GunsmokeEvent(at, 'upcoming', f"**{title}**\n\n{text}", at + day))
+    for index in range(EVENT_LENGTH.days):
+        at = start + index * day
+        title, text = DAY_MESSAGES[EVENT_LENGTH.days - index]
+        events.append(GunsmokeEvent(at, 'day', f"**{title}**\n\n{text}", at + day))
+        if index:
+            events.append(GunsmokeEvent(at, 'reset', RESET_MESSAGE, at + RESET_WINDOW))
+    events.append(GunsmokeEvent(end - WARNING_BEFORE_END, 'warning', WARNING_MESSAGE, end))
+    events.append(GunsmokeEvent(end, 'reschedule'))
+    return events
+
+
+def build_timeline(start, after=None, cycles=2):
+    """Events for the current and following cycles, sorted, skipping keys up to `after`"""
+    events = []
+    for cycle in range(cycles):
+        events.extend(cycle_events(start + cycle * CYCLE_LENGTH))
+    if after is not None:
+        after = tuple(after)
+        events = [event for event in events if event.key > after]
+    events.sort()
+    return events
@@ -0,0 +1,240 @@
+# utils/gunsmoke_store.py
+import logging
+
+from utils.database import get_database
+from utils.fanout import FORBIDDEN, MISSING, SENT
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = 'database/gunsmoke.db'
+
+MIGRATIONS = [
+    # 1: initial schema
+    '''
+    CREATE TABLE IF NOT EXISTS gunsmoke_guilds (
+        guild_id INTEGER PRIMARY KEY,
+        enabled INTEGER NOT NULL DEFAULT 0,
+        current_start TEXT,
+        last_event_at INTEGER,
+        last_event_kind INTEGER,
+        next_event_at INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS idx_gunsmoke_guilds_next_event
+        ON gunsmoke_guilds (next_event_at) WHERE next_event_at IS NOT NULL;
+    CREATE TABLE IF NOT EXISTS gunsmoke_channels (
+        guild_id INTEGER NOT NULL,
+        channel_id INTEGER NOT NULL,
+        PRIMARY KEY (guild_id, channel_id)
+    );
+    ''',
+    # 2: per-channel delivery outcomes and quarantine
+    '''
+    ALTER TABLE gunsmoke_channels ADD COLUMN failures INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE gunsmoke_channels ADD COLUMN quarantined INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE gunsmoke_channels ADD COLUMN last_outcome TEXT;
+    ALTER TABLE gunsmoke_channels ADD COLUMN last_attempt REAL;
+    ''',
+    # 3: one-off data migrations that already ran
+    '''
+    CREATE TABLE IF NOT EXISTS gunsmoke_migrations (
+        name TEXT PRIMARY KEY,
+        applied_at REAL NOT NULL
+    );
+    ''',
+]
+
+# Name recorded once the old global gunsmoke_config.json was imported
+LEGACY_CONFIG_MIGRATION = 'legacy_config'
+
+# Consecutive missing/forbidden deliveries before a channel stops being tried
+QUARANTINE_AFTER = 3
+
+SELECT_GUILD_SQL = '''
+    SELECT guild_id, enabled, current_start, last_event_at, last_event_kind, next_event_at
+    FROM gunsmoke_guilds WHERE guild_id = ?
+'''
+UPSERT_GUILD_SQL = '''
+    INSERT INTO gunsmoke_guilds (guild_id, enabled, current_start, last_event_at, last_event_kind, next_event_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(guild_id) DO UPDATE SET
+        enabled = excluded.enabled,
+        current_start = excluded.current_start,
+        last_event_at = excluded.last_event_at,
+        last_event_kind = excluded.last_event_kind,
+        next_event_at = excluded.next_event_at
+'''
+SELECT_NEXT_DUE_SQL = 'SELECT MIN(next_event_at) FROM gunsmoke_guilds WHERE next_event_at IS NOT NULL'
+SELECT_DUE_GUILDS_SQL = '''
+    SELECT guild_id, enabled, current_start, last_event_at, last_event_kind, next_event_at
+    FROM gunsmoke_guilds WHERE next_event_at IS NOT NULL AND next_event_at <= ?
+    ORDER BY next_event_at LIMIT ?
+'''
+SAVE_PROGRESS_SQL = '''
+    UPDATE gunsmoke_guilds SET current_start = ?, last_event_at = ?, last_event_kind = ?, next_event_at = ?
+    WHERE guild_id = ? AND enabled = ? AND current_start IS ? AND last_event_at IS ? AND last_event_kind IS ?
+'''
+POSTPONE_GUILD_SQL = 'UPDATE gunsmoke_guilds SET next_event_at = ? WHERE guild_id = ?'
+SELECT_CHANNELS_SQL = '''
+    SELECT channel_id FROM gunsmoke_channels WHERE guild_id = ? AND quarantined = 0 ORDER BY rowid
+'''
+SELECT_CHANNEL_STATUS_SQL = '''
+    SELECT channel_id, quarantined, failures, last_outcome, last_attempt
+    FROM gunsmoke_channels WHERE guild_id = ? ORDER BY rowid
+'''
+INSERT_CHANNEL_SQL = 'INSERT OR IGNORE INTO gunsmoke_channels (guild_id, channel_id) VALUES (?, ?)'
+RESTORE_CHANNEL_SQL = '''
+    UPDATE gunsmoke_channels SET quarantined = 0, failures = 0
+    WHERE guild_id = ? AND channel_id = ? AND quarantined = 1
+'''
+RECORD_SENT_SQL = '''
+    UPDATE gunsmoke_channels SET failures = 0, last_outcome = ?, last_attempt = ?
+    WHERE guild_id = ? AND channel_id = ?
+'''
+RECORD_DEAD_SQL = '''
+    UPDATE gunsmoke_channels SET
+        failures = failures + 1,
+        quarantined = failures + 1 >= ?,
+        last_outcome = ?,
+        last_attempt = ?
+    WHERE guild_id = ? AND channel_id = ?
+'''
+SELECT_CHANNEL_HEALTH_SQL = 'SELECT quarantined, failures FROM gunsmoke_channels WHERE guild_id = ? AND channel_id = ?'
+RECORD_FAILED_SQL = '''
+    UPDATE gunsmoke_channels SET last_outcome = ?, last_attempt = ?
+    WHERE guild_id = ? AND channel_id = ?
+'''
+DELETE_CHANNEL_SQL = 'DELETE FROM gunsmoke_channels WHERE guild_id = ? AND channel_id = ?'
+SELECT_MIGRATION_SQL = 'SELECT 1 FROM gunsmoke_migrations WHERE name = ?'
+INSERT_MIGRATION_SQL = 'INSERT OR IGNORE INTO gunsmoke_migrations (name, applied_at) VALUES (?, ?)'
+
+
+class GunsmokeGuild:
+    """One guild's gunsmoke schedule
+
+    `last_event` is the key of the last timeline event handled, and
+    `next_event_at` the unix time of the next one (None when nothing is
+    scheduled); the reminder engine only loads guilds whose next event is due.
+    """
+    __slots__ = ('guild_id', 'enabled', 'current_start', 'last_event', 'next_event_at')
+
+    def __init__(self, guild_id, enabled=False, current_start=None, last_event=None, next_event_at=None):
+        self.guild_id = guild_id
+        self.enabled = enabled
+        self.current_start = current_start
+        self.last_event = last_event
+        self.next_event_at = next_event_at
+
+    @classmethod
+    def from_row(cls, row):
+        guild_id, enabled, current_start, last_event_at, last_event_kind, next_event_at = row
+        last_event = (last_event_at, last_event_kind) if last_event_at is not None else None
+        return cls(guild_id, bool(enabled), current_start, last_event, next_event_at)
+
+
+def guild_params(guild):
+    last_event_at, last_event_kind = guild.last_event or (None, None)
+    return (guild.guild_id, int(guild.enabled), guild.current_start, last_event_at, last_event_kind, guild.next_event_at)
+
+
+class GunsmokeStore:
+    """Per-guild gunsmoke schedules and notification channels in SQLite"""
+    def __init__(self, path=None):
+        self.db = get_database(path or DB_PATH, MIGRATIONS)
+
+    async def open(self):
+        await self.db.open()
+
+    async def close(self):
+        await self.db.close()
+
+    async def get_guild(self, guild_id):
+        """Return a guild's schedule, or a disabled one if it never set one up"""
+        row = await self.db.fetchone(SELECT_GUILD_SQL, (guild_id,))
+        return GunsmokeGuild.from_row(row) if row else GunsmokeGuild(guild_id)
+
+    async def save_guild(self, guild):
+        await self.db.execute(UPSERT_GUILD_SQL, guild_params(guild))
+
+    async def legacy_imported(self):
+        """Whether the old global config was already imported"""
+        return await self.db.fetchone(SELECT_MIGRATION_SQL, (LEGACY_CONFIG_MIGRATION,)) is not None
+
+    async def import_legacy(self, imports, now):
+        """Save (GunsmokeGuild, channel_ids) pairs and mark the import done, in one transaction"""
+        def _import(conn):
+            for guild, channel_ids in imports:
+                conn.execute(UPSERT_GUILD_SQL, guild_params(guild))
+                conn.executemany(INSERT_CHANNEL_SQL, [(guild.guild_id, channel_id) for channel_id in channel_ids])
+            conn.execute(INSERT_MIGRATION_SQL, (LEGACY_CONFIG_MIGRATION, now))
+
+        await self.db.write(_import)
+
+    async def next_due(self):
+        """Unix time of the earliest scheduled event in any guild, or None"""
+        row = await self.db.fetchone(SELECT_NEXT_DUE_SQL)
+        return row[0] if row else None
+
+    async def due_guilds(self, now, limit):
+        """Guilds with an event due at or before `now`, earliest first"""
+        rows = await self.db.fetchall(SELECT_DUE_GUILDS_SQL, (now, limit))
+        return [GunsmokeGuild.from_row(row) for row in rows]
+
+    async def save_progress(self, guild, expected):
+        """Store how far the reminder engine got, unless the schedule changed meanwhile
+
+        `expected` is the (enabled, current_start, last_event) the engine last
+        read or wrote. Returns False, writing nothing, if the stored row no
+        longer matches, e.g. because an admin disabled or moved the schedule.
+        """
+        enabled, current_start, last_event = expected
+        last_event_at, last_event_kind = last_event or (None, None)
+        last_at, last_kind = guild.last_event or (None, None)
+        params = (guild.current_start, last_at, last_kind, guild.next_event_at,
+                  guild.guild_id, int(enabled), current_start, last_event_at, last_event_kind)
+        return await self.db.execute(SAVE_PROGRESS_SQL, params) > 0
+
+    async def postpone(self, guild_id, at):
+        """Move a guild's next due time to `at` without touching the rest of its schedule"""
+        await self.db.execute(POSTPONE_GUILD_SQL, (at, guild_id))
+
+    async def channels(self, guild_id):
+        return [row[0] for row in await self.db.fetchall(SELECT_CHANNELS_SQL, (guild_id,))]
+
+    async def channel_statuses(self, guild_id):
+        """(channel_id, quarantined, failures, last_outcome, last_attempt) for every channel, quarantined included"""
+        return await self.db.fetchall(SELECT_CHANNEL_STATUS_SQL, (guild_id,))
+
+    async def add_channel(self, guild_id, channel_id):
+        """Add a notification channel, or take it out of quarantine
+
+        Returns False if it was already an active notification channel.
+        """
+        def _add(conn):
+            if conn.execute(INSERT_CHANNEL_SQL, (guild_id, channel_id)).rowcount:
+                return True
+            return conn.execute(RESTORE_CHANNEL_SQL, (guild_id, channel_id)).rowcount > 0
+
+        return await self.db.write(_add)
+
+    async def remove_channel(self, guild_id, channel_id):
+        """Remove a notification channel; returns False if it wasn't added"""
+        return await self.db.execute(DELETE_CHANNEL_SQL, (guild_id, channel_id)) > 0
+
+    async def record_deliveries(self, guild_id, deliveries, now):
+        """Store delivery outcomes; returns the channel ids that were just quarantined"""
+        def _record(conn):
+            newly_quarantined = []
+            for delivery in deliveries:
+                params = (guild_id, delivery.channel_id)
+                if delivery.outcome == SENT:
+                    conn.execute(RECORD_SENT_SQL, (delivery.outcome, now) + params)
+                elif delivery.outcome in (MISSING, FORBIDDEN):
+                    conn.execute(RECORD_DEAD_SQL, (QUARANTINE_AFTER, delivery.outcome, now) + params)
+                    row = conn.execute(SELECT_CHANNEL_HEALTH_SQL, params).fetchone()
+                    if row and row[0] and row[1] == QUARANTINE_AFTER:
+                        newly_quarantined.append(delivery.channel_id)
+                else:
+                    conn.execute(RECORD_FAILED_SQL, (delivery.outcome, now) + params)
+            return newly_quarantined
+
+        return await self.db.write(_record)
@@ -0,0 +1,118 @@
+# utils/leveling_config.py
+import heapq
+import time
+from bisect import bisect_right
+
+# XP required to reach a level, by curve name
+CURVES = {
+    'quadratic': lambda level: 100 * (level - 1) ** 2,
+    'linear': lambda level: 500 * (level - 1),
+    'exponential': lambda level: int(500 * (1.2 ** (level - 1) - 1)),
+}
+DEFAULT_CURVE = 'quadratic'
+
+DEFAULT_XP_MIN = 15
+DEFAULT_XP_MAX = 15
+DEFAULT_COOLDOWN = 60  # Seconds between XP gains per user per guild
+
+# Levels precomputed up front; tables grow on demand past this
+INITIAL_LEVELS = 200
+
+
+class LevelCurve:
+    """Level thresholds for one curve, compiled into a sorted array
+
+    thresholds[i] is the total XP needed for level i + 1, so the level for a
+    given XP is a single bisection instead of a float sqrt per message.
+    """
+    def __init__(self, name):
+        self.name = name
+        self._formula = CURVES[name]
+        self.thresholds = [self._formula(level) for level in range(1, INITIAL_LEVELS + 1)]
+
+    def _extend_to(self, xp):
+        while self.thresholds[-1] <= xp:
+            self.thresholds.append(self._formula(len(self.thresholds) + 1))
+
+    def level_for(self, xp):
+        """Level reached with this much total XP"""
+        if xp >= self.thresholds[-1]:
+            self._extend_to(xp)
+        return max(1, bisect_right(self.thresholds, xp))
+
+    def xp_for_level(self, level):
+        """Total XP needed to reach a level"""
+        if level <= len(self.thresholds):
+            return self.thresholds[max(level, 1) - 1]
+        return self._formula(level)
+
+
+# Curves are shared by every guild that uses them
+_compiled_curves = {}
+
+
+def get_curve(name):
+    curve = _compiled_curves.get(name)
+    if curve is None:
+        curve = _compiled_curves[name] = LevelCurve(name)
+    return curve
+
+
+class LevelingConfig:
+    """Leveling rules for one guild"""
+    def __init__(self, xp_min=DEFAULT_XP_MIN, xp_max=DEFAULT_XP_MAX, cooldown=DEFAULT_COOLDOWN,
+                 curve=DEFAULT_CURVE, channel_multipliers=None):
+        self.xp_min = xp_min
+        self.xp_max = xp_max
+        self.cooldown = cooldown
+        self.curve = get_curve(curve)
+        # channel_id -> multiplier; 0 means the channel gives no XP
+        self.channel_multipliers = channel_multipliers or {}
+
+    def multiplier_for(self, channel_id):
+        return self.channel_multipliers.get(channel_id, 1.0)
+
+    def no_xp_channels(self):
+        return [channel_id for channel_id, multiplier in self.channel_multipliers.items() if multiplier == 0]
+
+
+class CooldownStore:
+    """Expiring (guild_id, user_id) cooldowns
+
+    Holds one float per user on cooldown. Expired entries are swept from a
+    min-heap of expiry times, so memory tracks recently active users rather
+    than everyone who has ever sent a message.
+    """
+    def __init__(self):
+        self._expiries = {}
+        self._heap = []
+
+    def try_acquire(self, key, cooldown, now=None):
+        """Start a cooldown for key; returns False if it is still cooling down"""
+        now = time.monotonic() if now is None else now
+        self._sweep(now)
+        expiry = self._expiries.get(key)
+        if expiry is not None and expiry > now:
+            return False
+        if cooldown > 0:
+            expiry = now + cooldown
+            self._expiries[key] = expiry
+            heapq.heappush(self._heap, (expiry, key))
+        return True
+
+    def _sweep(self, now):
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            expiry, key = heapq.heappop(heap)
+            # Skip stale heap entries left behind by a newer cooldown
+            if self._expiries.get(key) == expiry:
+                del self._expiries[key]
+
+    def clear_guild(self, guild_id):
+        """End every running cooldown in a guild, e.g. after its rules or data were reset"""
+        self._expiries = {k: v for k, v in self._expiries.items() if k[0] != guild_id}
+        self._heap = [(expiry, k) for expiry, k in self._heap if k[0] != guild_id]
+        heapq.heapify(self._heap)
+
+    def __len__(self):
+        return len(self._expiries)
@@ -0,0 +1,207 @@
+# utils/leveling_io.py
+import csv
+import datetime
+import json
+import logging
+from itertools import islice
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('jsonl', 'csv')
+CONFLICT_POLICIES = ('skip', 'replace', 'sum', 'max')
+FIELDS = ('user_id', 'xp', 'level', 'messages', 'last_message')
+
+CHUNK_SIZE = 1000  # Rows per import transaction / delete statement
+FETCH_SIZE = 500  # Rows pulled from the cursor at a time while exporting
+
+EXPORT_SQL = '''
+    SELECT user_id, xp, level, messages, last_message
+    FROM user_levels
+    WHERE guild_id = ?
+    ORDER BY xp DESC, user_id
+'''
+
+DELETE_CHUNK_SQL = '''
+    DELETE FROM user_levels WHERE rowid IN (
+        SELECT rowid FROM user_levels WHERE guild_id = ? LIMIT ?
+    )
+'''
+
+# How an imported row is merged with an existing one
+IMPORT_SQL = {
+    'skip': '''
+        INSERT INTO user_levels (user_id, guild_id, xp, level, messages, last_message)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (user_id, guild_id) DO NOTHING
+    ''',
+    'replace': '''
+        INSERT INTO user_levels (user_id, guild_id, xp, level, messages, last_message)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (user_id, guild_id) DO UPDATE SET
+            xp = excluded.xp,
+            level = excluded.level,
+            messages = excluded.messages,
+            last_message = excluded.last_message
+    ''',
+    'sum': '''
+        INSERT INTO user_levels (user_id, guild_id, xp, level, messages, last_message)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (user_id, guild_id) DO UPDATE SET
+            xp = user_levels.xp + excluded.xp,
+            level = MAX(user_levels.level, excluded.level),
+            messages = user_levels.messages + excluded.messages,
+            last_message = COALESCE(MAX(user_levels.last_message, excluded.last_message), user_levels.last_message)
+    ''',
+    'max': '''
+        INSERT INTO user_levels (user_id, guild_id, xp, level, messages, last_message)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (user_id, guild_id) DO UPDATE SET
+            xp = MAX(user_levels.xp, excluded.xp),
+            level = MAX(user_levels.level, excluded.level),
+            messages = MAX(user_levels.messages, excluded.messages),
+            last_message = COALESCE(MAX(user_levels.last_message, excluded.last_message), user_levels.last_message)
+    ''',
+}
+
+
+# Policies whose merged XP can differ from both rows, leaving the stored level stale
+RELEVEL_POLICIES = ('sum', 'max')
+
+SELECT_XP_SQL = 'SELECT xp FROM user_levels WHERE user_id = ? AND guild_id = ?'
+UPDATE_LEVEL_SQL = 'UPDATE user_levels SET level = ? WHERE user_id = ? AND guild_id = ?'
+
+
+def export_guild(conn, guild_id, fmt, out):
+    """Stream a guild's rows to a text file object; returns the row count
+
+    Rows are pulled from the cursor in small batches, so memory use does not
+    depend on the size of the guild. Meant to run via Database.read().
+    """
+    cursor = conn.execute(EXPORT_SQL, (guild_id,))
+    writer = None
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(FIELDS)
+
+    count = 0
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        for row in rows:
+            if writer:
+                writer.writerow(row)
+            else:
+                out.write(json.dumps(dict(zip(FIELDS, row)), default=str) + "\n")
+        count += len(rows)
+    return count
+
+
+def detect_format(first_line):
+    return 'jsonl' if first_line.lstrip().startswith('{') else 'csv'
+
+
+def read_rows(lines):
+    """Parse exported JSONL or CSV lines into dicts, lazily
+
+    Only `user_id` and `xp` are required, so exports from other leveling bots
+    can be imported after renaming their columns.
+    """
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None:
+        return
+    if detect_format(first) == 'jsonl':
+        for number, line in enumerate(_chain(first, lines), 1):
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    raise ValueError(f"Invalid JSON on line {number}: {getattr(e, 'msg', e)}") from e
+                yield _normalize(record, number)
+    else:
+        reader = csv.DictReader(_chain(first, lines))
+        try:
+            for record in reader:
+                yield _normalize(record, reader.line_num)
+        except csv.Error as e:
+            raise ValueError(f"Invalid CSV on line {reader.line_num}: {e}") from e
+
+
+def _chain(first, rest):
+    yield first
+    yield from rest
+
+
+def _normalize(record, line_number):
+    try:
+        return {
+            'user_id': int(record['user_id']),
+            'xp': max(0, int(record['xp'])),
+            'level': int(record['level']) if record.get('level') not in (None, '') else None,
+            'messages': int(record['messages']) if record.get('messages') not in (None, '') else 0,
+            'last_message': record.get('last_message') or None,
+        }
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid row on line {line_number}: {e}") from e
+
+
+def validate_file(path):
+    """Parse a whole import file without writing anything; returns the row count
+
+    Raises ValueError on the first bad row, so a broken file is rejected
+    before any chunk is committed.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        return sum(1 for _ in read_rows(f))
+
+
+def _import_chunk(conn, sql, guild_id, chunk, level_for):
+    """Merge one chunk, then re-derive levels from the merged XP where the policy needs it"""
+    conn.executemany(sql, chunk)
+    if level_for is None:
+        return
+    levels = []
+    for user_id in {row[0] for row in chunk}:
+        xp = conn.execute(SELECT_XP_SQL, (user_id, guild_id)).fetchone()[0]
+        levels.append((level_for(xp), user_id, guild_id))
+    conn.executemany(UPDATE_LEVEL_SQL, levels)
+
+
+async def import_rows(db, guild_id, rows, policy='skip', level_for=None, chunk_size=CHUNK_SIZE):
+    """Write parsed rows in chunked transactions; returns the number of rows read
+
+    Each chunk commits separately, so other writers (like the XP flush) get
+    the database between chunks. `level_for(xp)` fills in missing levels,
+    and for the sum and max policies recomputes the level from the merged XP.
+    """
+    if policy not in IMPORT_SQL:
+        raise ValueError(f"Unknown conflict policy: {policy}")
+    sql = IMPORT_SQL[policy]
+    relevel = level_for if policy in RELEVEL_POLICIES else None
+    rows = iter(rows)
+    total = 0
+    while True:
+        chunk = []
+        for row in islice(rows, chunk_size):
+            level = row['level'] or (level_for(row['xp']) if level_for else 1)
+            chunk.append((row['user_id'], guild_id, row['xp'], level, row['messages'], row['last_message']))
+        if not chunk:
+            break
+        await db.write(_import_chunk, sql, guild_id, chunk, relevel)
+        total += len(chunk)
+    return total
+
+
+async def delete_guild(db, guild_id, chunk_size=CHUNK_SIZE):
+    """Delete a guild's rows a chunk at a time; returns the number deleted"""
+    total = 0
+    while True:
+        deleted = await db.execute(DELETE_CHUNK_SQL, (guild_id, chunk_size))
+        total += deleted
+        if deleted < chunk_size:
+            return total
+
+
+def export_filename(guild_id, fmt):
+    return f"levels_{guild_id}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
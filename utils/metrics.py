@@ -0,0 +1,79 @@
+# utils/metrics.py
+import bisect
+from collections import Counter
+
+# Bucket upper bounds in seconds, roughly 1-2.5-5 steps from 5 ms to 2 min
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 30.0, 60.0, 120.0,
+)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; constant memory however many samples it sees"""
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is overflow
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th sample (max for the overflow bucket)"""
+        if not self.count:
+            return 0.0
+        rank = max(1, round(self.count * p))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                if index < len(self.buckets):
+                    return min(self.buckets[index], self.max)
+                return self.max
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'p50': self.percentile(0.50),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'max': self.max,
+        }
+
+
+class Metrics:
+    """Named histograms and counters"""
+    def __init__(self):
+        self.histograms = {}
+        self.counters = Counter()
+
+    def observe(self, name, value):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(value)
+
+    def increment(self, name, amount=1):
+        self.counters[name] += amount
+
+    def snapshot(self):
+        return {
+            'histograms': {name: histogram.summary() for name, histogram in self.histograms.items()},
+            'counters': dict(self.counters),
+        }
+
+    def reset(self):
+        self.histograms.clear()
+        self.counters.clear()
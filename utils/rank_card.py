@@ -0,0 +1,211 @@
+# utils/rank_card.py
+import asyncio
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:  # Rank cards are optional; /level falls back to a text embed
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+CARD_CACHE_DIR = "./rank_card_cache"
+CARD_CACHE_MAX_SIZE = 50 * 1024 * 1024  # 50 MB on disk
+CARD_MEMORY_ENTRIES = 256
+AVATAR_MEMORY_ENTRIES = 512
+PROGRESS_BUCKET = 2  # Progress is drawn (and cached) in 2% steps
+RENDER_WORKERS = 2
+
+CARD_WIDTH = 640
+CARD_HEIGHT = 200
+AVATAR_SIZE = 150
+
+
+def _font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:  # Pillow < 10.1 has a single bitmap font
+        return ImageFont.load_default()
+
+
+def render_rank_card(avatar_bytes, name, level, progress):
+    """Draw a rank card and return it as PNG bytes
+
+    Runs in a worker process, so it only takes plain picklable values.
+    `progress` is the percentage towards the next level.
+    """
+    card = Image.new("RGBA", (CARD_WIDTH, CARD_HEIGHT), (35, 39, 42, 255))
+    draw = ImageDraw.Draw(card)
+
+    # Avatar, cropped to a circle
+    margin = (CARD_HEIGHT - AVATAR_SIZE) // 2
+    avatar = Image.open(io.BytesIO(avatar_bytes)).convert("RGBA").resize((AVATAR_SIZE, AVATAR_SIZE))
+    mask = Image.new("L", (AVATAR_SIZE, AVATAR_SIZE), 0)
+    ImageDraw.Draw(mask).ellipse((0, 0, AVATAR_SIZE, AVATAR_SIZE), fill=255)
+    card.paste(avatar, (margin, margin), mask)
+
+    # Progress ring around the avatar
+    ring = (margin - 8, margin - 8, margin + AVATAR_SIZE + 8, margin + AVATAR_SIZE + 8)
+    draw.ellipse(ring, outline=(72, 75, 78, 255), width=8)
+    if progress > 0:
+        draw.arc(ring, start=-90, end=-90 + 360 * progress / 100, fill=(0, 255, 0, 255), width=8)
+
+    left = margin * 2 + AVATAR_SIZE + 10
+    draw.text((left, 35), name[:24], font=_font(34), fill=(255, 255, 255, 255))
+    draw.text((left, 90), f"Level {level}", font=_font(28), fill=(0, 255, 0, 255))
+
+    # Progress bar with percentage
+    bar = (left, 140, CARD_WIDTH - 30, 162)
+    draw.rounded_rectangle(bar, radius=11, fill=(72, 75, 78, 255))
+    if progress > 0:
+        filled = bar[0] + (bar[2] - bar[0]) * progress / 100
+        draw.rounded_rectangle((bar[0], bar[1], max(filled, bar[0] + 22), bar[3]), radius=11, fill=(0, 255, 0, 255))
+    draw.text((bar[2] - 60, 166), f"{progress}%", font=_font(22), fill=(200, 200, 200, 255))
+
+    out = io.BytesIO()
+    card.save(out, format="PNG", optimize=True)
+    return out.getvalue()
+
+
+class LRUCache:
+    """Small in-memory LRU keyed by any hashable"""
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+
+    def get(self, key):
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+
+
+class RankCardRenderer:
+    """Renders rank cards in a process pool behind memory and disk caches
+
+    Cards are keyed by everything drawn on them (user, level, progress
+    bucket, name and avatar hash), so a repeated /level is a cache hit until
+    the user earns enough XP to move the bar. Rank is left off the card: it
+    changes whenever anyone else gains XP, so /level shows it in the embed.
+    Avatars are downloaded once per avatar hash.
+    """
+    def __init__(self, cache_dir=CARD_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.cards = LRUCache(CARD_MEMORY_ENTRIES)
+        self.avatars = LRUCache(AVATAR_MEMORY_ENTRIES)
+        self._pool = None
+        self._writes_since_trim = 0
+
+    @staticmethod
+    def available():
+        return Image is not None
+
+    def _get_pool(self):
+        if self._pool is None:
+            # spawn keeps workers free of the bot's threads and sockets
+            self._pool = ProcessPoolExecutor(
+                max_workers=RENDER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def shutdown(self):
+        if self._pool:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def get_avatar(self, user):
+        asset = user.display_avatar.replace(size=256, format="png")
+        avatar = self.avatars.get(asset.key)
+        if avatar is None:
+            avatar = await asset.read()
+            self.avatars.put(asset.key, avatar)
+        return avatar
+
+    @staticmethod
+    def card_key(user, name, level, progress):
+        progress = int(progress // PROGRESS_BUCKET * PROGRESS_BUCKET)
+        return (user.id, level, progress, name, user.display_avatar.key)
+
+    def cached(self, user, name, level, progress):
+        """Return the card if it's in the memory cache, else None; never renders or reads disk"""
+        return self.cards.get(self.card_key(user, name, level, progress))
+
+    async def render(self, user, name, level, progress):
+        """Return PNG bytes for a user's rank card, rendering only on a cache miss"""
+        key = self.card_key(user, name, level, progress)
+        progress = key[2]
+        card = self.cards.get(key)
+        if card is not None:
+            return card
+
+        loop = asyncio.get_event_loop()
+        path = os.path.join(self.cache_dir, hashlib.sha1(repr(key).encode()).hexdigest() + ".png")
+        card = await loop.run_in_executor(None, self._read_file, path)
+        if card is None:
+            avatar = await self.get_avatar(user)
+            card = await loop.run_in_executor(
+                self._get_pool(), render_rank_card, avatar, name, level, progress
+            )
+            await loop.run_in_executor(None, self._write_file, path, card)
+
+        self.cards.put(key, card)
+        return card
+
+    def _read_file(self, path):
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # Mark as recently used for trimming
+            return data
+        except OSError:
+            return None
+
+    def _write_file(self, path, data):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Error caching rank card: {e}")
+            return
+
+        self._writes_since_trim += 1
+        if self._writes_since_trim >= 50:
+            self._writes_since_trim = 0
+            self._trim_disk()
+
+    def _trim_disk(self):
+        """Delete least recently used cards until the cache fits CARD_CACHE_MAX_SIZE"""
+        files = []
+        total_size = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(".png"):
+                stats = entry.stat()
+                files.append((stats.st_mtime, stats.st_size, entry.path))
+                total_size += stats.st_size
+
+        files.sort()
+        for mtime, size, path in files:
+            if total_size <= CARD_CACHE_MAX_SIZE:
+                break
+            try:
+                os.remove(path)
+                total_size -= size
+            except OSError:
+                continue
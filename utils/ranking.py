@@ -0,0 +1,63 @@
+# utils/ranking.py
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+
+MAX_CACHED_GUILDS = 256
+
+
+class RankIndex:
+    """Sorted XP values for one guild, answering rank queries in O(log n)
+
+    Users with equal XP share a rank, matching `COUNT(*) WHERE xp > ?` + 1.
+    """
+    def __init__(self, xp_values=()):
+        self._values = sorted(xp_values)
+
+    def add(self, xp):
+        insort(self._values, xp)
+
+    def remove(self, xp):
+        i = bisect_left(self._values, xp)
+        if i < len(self._values) and self._values[i] == xp:
+            del self._values[i]
+
+    def update(self, old_xp, new_xp):
+        """Move a user from old_xp to new_xp (old_xp is None for new users)"""
+        if old_xp is not None:
+            self.remove(old_xp)
+        self.add(new_xp)
+
+    def rank(self, xp):
+        """1-based position of a user with this much XP"""
+        return len(self._values) - bisect_right(self._values, xp) + 1
+
+    def __len__(self):
+        return len(self._values)
+
+
+class RankIndexCache:
+    """Per-guild RankIndex objects for recently active guilds, evicted LRU"""
+    def __init__(self, max_guilds=MAX_CACHED_GUILDS):
+        self.max_guilds = max_guilds
+        self._indexes = OrderedDict()
+
+    def get(self, guild_id):
+        index = self._indexes.get(guild_id)
+        if index is not None:
+            self._indexes.move_to_end(guild_id)
+        return index
+
+    def put(self, guild_id, index):
+        self._indexes[guild_id] = index
+        self._indexes.move_to_end(guild_id)
+        while len(self._indexes) > self.max_guilds:
+            self._indexes.popitem(last=False)
+
+    def update(self, guild_id, old_xp, new_xp):
+        """Keep a loaded guild in sync with an XP change; unloaded guilds are skipped"""
+        index = self._indexes.get(guild_id)
+        if index is not None:
+            index.update(old_xp, new_xp)
+
+    def discard(self, guild_id):
+        self._indexes.pop(guild_id, None)